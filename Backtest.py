@@ -0,0 +1,266 @@
+import os
+import sys
+import multiprocessing
+import numpy as np
+
+from DataProcessing import IndicatorSeries
+from HistoryStore import HistoryStore
+from OrderProcessing import get_sl
+
+# One row per simulated trade
+TRADE_DTYPE = np.dtype([
+    ('entry_index', '<i8'), ('exit_index', '<i8'), ('side', '<i1'), # side: 1 buy, -1 sell
+    ('entry', '<f8'), ('sl', '<f8'), ('tp1', '<f8'), ('tp2', '<f8'), ('tp3', '<f8'),
+    ('legs_tp', '<i1'),    # Number of thirds closed at their take profit
+    ('stopped', '?'),      # True if the stop loss closed the remaining thirds
+    ('pnl', '<f8'),        # Price units per unit of volume, averaged over the three thirds
+    ('risk', '<f8'),       # |entry - sl|
+])
+
+
+def Signals(rates, atr_period: int = 18, atr_multiplier: float = 5):
+    '''
+    Evaluates the main.py buy/sell conditions on every candle of a history.
+
+    A signal on candle t uses the Indicator values of the previous (closed) candle t-1,
+    its high/low and the open of candle t, exactly like the live loop when candle t opens:
+        buy:  prv_low <= minimum and curr_open < average
+        sell: prv_high >= maximum and curr_open > average (only if there is no buy)
+
+    Args:
+        rates: Structured array with 'open', 'high', 'low', 'close' fields, oldest first.
+
+    Returns:
+        tuple: (side, maximum, minimum, average) arrays. side is 1 for buy, -1 for sell,
+               0 otherwise; the indicator arrays are aligned with side (values of candle t-1).
+    '''
+    maximum, minimum, average = IndicatorSeries(rates['high'], rates['low'], rates['close'],
+                                                atr_period=atr_period, atr_multiplier=atr_multiplier)
+    n = len(rates)
+    prev_max = np.full(n, np.nan)
+    prev_min = np.full(n, np.nan)
+    prev_avg = np.full(n, np.nan)
+    prev_max[1:], prev_min[1:], prev_avg[1:] = maximum[:-1], minimum[:-1], average[:-1]
+
+    prv_high = np.concatenate(([np.nan], rates['high'][:-1]))
+    prv_low = np.concatenate(([np.nan], rates['low'][:-1]))
+    curr_open = rates['open']
+
+    buy = (prv_low <= prev_min) & (curr_open < prev_avg)
+    sell = (prv_high >= prev_max) & (curr_open > prev_avg) & ~buy
+
+    side = np.zeros(n, dtype=np.int8)
+    side[buy] = 1
+    side[sell] = -1
+    return side, prev_max, prev_min, prev_avg
+
+
+def _first_hit(values: np.ndarray, start: int, level: float, above: bool, stop: int = None, chunk: int = 32):
+    '''
+    Returns the first index in [start, stop) where `values` reaches `level` (>= if above,
+    <= otherwise), or len(values) if it does not. Searches in growing vectorized chunks,
+    since most levels are reached within a few candles.
+    '''
+    n = len(values)
+    stop = n if stop is None else min(stop, n)
+    while start < stop:
+        window = values[start:min(start + chunk, stop)]
+        hits = window >= level if above else window <= level
+        if hits.any():
+            return start + int(hits.argmax())
+        start += chunk
+        chunk *= 2
+    return n
+
+
+def BacktestSeries(rates, digits: int = None, spread: float = 0.0, rrr: float = 1.2,
+                   atr_period: int = 18, atr_multiplier: float = 5, allow_overlap: bool = False):
+    '''
+    Backtests the Indicator strategy on one (symbol, timeframe) history: Signals()
+    followed by ResolveTrades().
+
+    Args:
+        rates: Structured array with 'open', 'high', 'low', 'close' fields, oldest first.
+        digits, spread, rrr, allow_overlap: See ResolveTrades().
+
+    Returns:
+        np.ndarray: Trades as a TRADE_DTYPE structured array.
+    '''
+    side, _, _, avg = Signals(rates, atr_period=atr_period, atr_multiplier=atr_multiplier)
+    return ResolveTrades(rates, side, avg, digits=digits, spread=spread, rrr=rrr, allow_overlap=allow_overlap)
+
+
+def ResolveTrades(rates, side, average, digits: int = None, spread: float = 0.0, rrr: float = 1.2,
+                  allow_overlap: bool = False):
+    '''
+    Turns the signals of Signals() into trades. The signals do not depend on the RRR,
+    so a parameter sweep computes them once and calls this for every RRR value.
+
+    Entries are taken at the open of the signal candle (plus `spread` for buys, like the
+    live ask price). TP3 is the average line, TP1/TP2 split the distance in thirds as in
+    Buy_req/Sell_req, and the stop loss comes from get_sl() (risk-to-reward ratio 1.2 by
+    default). Each third of the position closes at its own take profit or at the common
+    stop loss; when a candle reaches both, the stop loss is assumed to come first. Thirds
+    still open at the end are closed at the last close.
+
+    Fills are resolved per trade with vectorized searches over the following candles
+    rather than by stepping through ticks.
+
+    Args:
+        rates: The history Signals() was computed on.
+        side, average: The side and average arrays returned by Signals().
+        digits (int, optional): Price decimals; TP levels are rounded like the live orders.
+        spread (float): Ask - bid in price units, added to buy entries.
+        rrr (float): Risk-to-reward ratio used for the stop loss.
+        allow_overlap (bool): If False (like the live loop, which skips symbols with an open
+                              position) no new trade opens while one is still running.
+
+    Returns:
+        np.ndarray: Trades as a TRADE_DTYPE structured array.
+    '''
+    high = np.ascontiguousarray(rates['high'], dtype=np.float64)
+    low = np.ascontiguousarray(rates['low'], dtype=np.float64)
+    n = len(rates)
+
+    signal_index = np.flatnonzero(side)
+    entry = rates['open'][signal_index] + np.where(side[signal_index] == 1, spread, 0.0)
+
+    # Order levels for every signal at once, following Buy_req/Sell_req
+    tp3 = average[signal_index] if digits is None else np.round(average[signal_index], digits)
+    distance = tp3 - entry
+    tp1 = entry + distance / 3
+    tp2 = entry + 2 * distance / 3
+    if digits is not None:
+        tp1, tp2 = np.round(tp1, digits), np.round(tp2, digits)
+    sl = get_sl(entry, tp3, rrr)
+    if digits is not None:
+        sl = np.round(sl, digits)
+
+    trades = []
+    busy_until = -1
+    last_close = float(rates['close'][-1]) if n else np.nan
+    for k, t in enumerate(signal_index):
+        if not allow_overlap and t <= busy_until:
+            continue
+        is_buy = side[t] == 1
+        # A buy is stopped by lows and takes profit on highs; a sell the other way round
+        sl_hit = _first_hit(low if is_buy else high, t, sl[k], above=not is_buy)
+
+        # Take profits only matter if they are reached before the stop loss candle
+        levels = np.array((tp1[k], tp2[k], tp3[k]))
+        tp_hit = np.array([_first_hit(high if is_buy else low, t, level, above=is_buy, stop=sl_hit)
+                           for level in levels])
+
+        taken = tp_hit < sl_hit
+        if sl_hit < n:
+            exit_price = np.where(taken, levels, sl[k])
+            exit_index = int(np.where(taken, tp_hit, sl_hit).max())
+        else:
+            exit_price = np.where(taken, levels, last_close)
+            exit_index = int(tp_hit.max()) if taken.all() else n - 1
+        legs_tp = int(taken.sum())
+        pnl = float(((exit_price - entry[k]) if is_buy else (entry[k] - exit_price)).sum())
+
+        trades.append((t, exit_index, 1 if is_buy else -1, entry[k], sl[k], tp1[k], tp2[k], tp3[k],
+                       legs_tp, sl_hit < n and legs_tp < 3, pnl / 3, abs(entry[k] - sl[k])))
+        busy_until = exit_index
+
+    return np.array(trades, dtype=TRADE_DTYPE)
+
+
+def TradeStats(trades: np.ndarray):
+    '''
+    Summarises a TRADE_DTYPE array.
+
+    Returns:
+        dict: trades, buys, sells, win_rate, tp1/tp2/tp3 hit rates, stop rate, total and
+              average pnl (price units), average R (pnl / risk) and profit factor.
+    '''
+    count = len(trades)
+    if count == 0:
+        return {'trades': 0, 'buys': 0, 'sells': 0, 'win_rate': np.nan, 'tp1_rate': np.nan,
+                'tp2_rate': np.nan, 'tp3_rate': np.nan, 'sl_rate': np.nan, 'total_pnl': 0.0,
+                'avg_pnl': np.nan, 'avg_r': np.nan, 'profit_factor': np.nan}
+
+    pnl = trades['pnl']
+    risk = np.where(trades['risk'] > 0, trades['risk'], np.nan)
+    gains = pnl[pnl > 0].sum()
+    losses = -pnl[pnl < 0].sum()
+    return {
+        'trades': count,
+        'buys': int((trades['side'] == 1).sum()),
+        'sells': int((trades['side'] == -1).sum()),
+        'win_rate': float((pnl > 0).mean()),
+        'tp1_rate': float((trades['legs_tp'] >= 1).mean()),
+        'tp2_rate': float((trades['legs_tp'] >= 2).mean()),
+        'tp3_rate': float((trades['legs_tp'] >= 3).mean()),
+        'sl_rate': float(trades['stopped'].mean()),
+        'total_pnl': float(pnl.sum()),
+        'avg_pnl': float(pnl.mean()),
+        'avg_r': float(np.nanmean(pnl / risk)) if np.isfinite(risk).any() else np.nan,
+        'profit_factor': float(gains / losses) if losses > 0 else np.inf,
+    }
+
+
+def _backtest_job(job):
+    rates, digits, kwargs = job
+    return TradeStats(BacktestSeries(rates, digits=digits, **kwargs))
+
+
+def BacktestMany(histories: dict, digits: dict = None, processes: int = None, **kwargs):
+    '''
+    Backtests several series, optionally spread over a process pool (series are independent).
+
+    Args:
+        histories (dict): (symbol, timeframe) -> rates structured array.
+        digits (dict, optional): symbol -> price decimals.
+        processes (int, optional): Worker processes. None or 1 runs in this process.
+        **kwargs: Passed on to BacktestSeries().
+
+    Returns:
+        dict: (symbol, timeframe) -> TradeStats() dict.
+    '''
+    digits = digits or {}
+    jobs = [(rates, digits.get(key[0]), kwargs) for key, rates in histories.items()]
+    if processes is None or processes <= 1:
+        results = [_backtest_job(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_backtest_job, jobs)
+    return dict(zip(histories.keys(), results))
+
+
+def LoadHistories(data_dir: str):
+    '''
+    Loads every `<symbol>_<timeframe>.npy` rates file in `data_dir` (the layout used by
+    SimulatedBroker) and every series of a HistoryStore kept in `data_dir`.
+
+    Returns:
+        dict: (symbol, timeframe) -> rates structured array (HistoryView for stored series).
+    '''
+    histories = HistoryStore(data_dir).histories()
+    for name in sorted(os.listdir(data_dir)):
+        if name.endswith('.npy') and '_' in name:
+            symbol, timeframe = name[:-4].rsplit('_', 1)
+            histories[(symbol, timeframe)] = np.load(os.path.join(data_dir, name))
+    return histories
+
+
+def FormatReport(stats: dict):
+    '''Renders BacktestMany() results as a text table.'''
+    lines = [f"{'Symbol':<14}{'TF':>4}{'Trades':>8}{'Win%':>7}{'TP1%':>7}{'TP2%':>7}{'TP3%':>7}{'SL%':>7}{'AvgR':>8}{'PF':>7}"]
+    for (symbol, timeframe), row in stats.items():
+        if row['trades'] == 0:
+            lines.append(f"{symbol:<14}{timeframe:>4}{0:>8}")
+            continue
+        lines.append(f"{symbol:<14}{timeframe:>4}{row['trades']:>8}{row['win_rate'] * 100:>7.1f}"
+                     f"{row['tp1_rate'] * 100:>7.1f}{row['tp2_rate'] * 100:>7.1f}{row['tp3_rate'] * 100:>7.1f}"
+                     f"{row['sl_rate'] * 100:>7.1f}{row['avg_r']:>8.2f}{row['profit_factor']:>7.2f}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('Usage: python Backtest.py <directory with <symbol>_<timeframe>.npy rates files or a history store>')
+        sys.exit(1)
+    print(FormatReport(BacktestMany(LoadHistories(sys.argv[1]), processes=os.cpu_count())))
@@ -0,0 +1,169 @@
+import numpy as np
+from Broker import mt5
+from pytz import utc # For UTC timezone awareness
+from datetime import datetime, timedelta
+
+from Metrics import metrics
+from TimeProcessing import clock, get_mt5_interval
+
+
+class BarCache:
+    '''
+    In-memory rolling window of the last `size` candles for one (symbol, timeframe) series.
+
+    The cache is seeded once with mt5.copy_rates_from_pos and afterwards only fetches
+    the candles from its last closed candle onwards with mt5.copy_rates_range. The
+    still-forming last candle is replaced in place and newer candles are appended.
+    If the fetched candles no longer line up with the cache (gap, broker history
+    rewrite) the whole window is fetched again.
+
+    Candles are kept in a fixed-size NumPy buffer of twice the window length where
+    every candle is written twice, so the current window is always one contiguous
+    view and appending never moves data.
+
+    With a HistoryStore, closed candles are also written to disk and a new cache is
+    seeded from the stored candles, so only the candles missing since the last run are
+    fetched from the broker.
+    '''
+
+    def __init__(self, symbol: str, timeframe: str, size: int = 550, store=None):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.size = size
+        self.store = store.series(symbol, timeframe) if store is not None else None
+
+        self._buffer = None   # Structured array of 2 * size candles, allocated on the first seed
+        self._write = 0       # Position where the next candle is written
+        self.length = 0       # Number of valid candles in the window
+        self.generation = 0   # Incremented every time the window is (re)seeded
+        self.resynced = False # True if the last sync() had to (re)seed the window
+        self.synced_at = None # clock.monotonic() time of the last sync() that reached the broker
+
+    def rates(self):
+        '''
+        Returns the cached candles, oldest first, as a view on the internal buffer
+        (same fields as mt5.copy_rates_from_pos). The view is only valid until the next sync().
+        '''
+        if self._buffer is None:
+            return None
+        end = self._write + self.size
+        return self._buffer[end - self.length:end]
+
+    def _fetch_from_store(self):
+        '''
+        Returns the last `size` candles built from the stored candles plus the tail fetched
+        from the broker, or None if the store is empty or does not line up with the broker.
+        '''
+        stored = self.store.read(count=self.size) if self.store is not None else None
+        if stored is None or len(stored) == 0:
+            return None
+
+        # Fetch from the newest stored candle, which must come back unchanged as the first candle
+        metrics.inc('fetches', kind='store_tail')
+        with metrics.time('copy_rates_range'):
+            fresh = mt5.copy_rates_range(self.symbol, get_mt5_interval(self.timeframe),
+                                         datetime.fromtimestamp(int(stored['time'][-1]), tz=utc),
+                                         clock.now() + timedelta(days=1))
+        if fresh is None or len(fresh) < 2:
+            return None
+        if fresh[0]['time'] != stored['time'][-1] or \
+           any(fresh[0][field] != stored[field][-1] for field in ('open', 'high', 'low', 'close')):
+            print(f"Stored history for {self.symbol} ({self.timeframe}) does not match the broker. Fetching it again...")
+            return None
+
+        rates = np.zeros(len(stored) - 1 + len(fresh), dtype=fresh.dtype)
+        for field in stored.dtype.names:
+            rates[field][:len(stored) - 1] = stored[field][:-1]
+        rates[len(stored) - 1:] = fresh
+        return rates[-self.size:]
+
+    def _seed(self):
+        '''Fetches the full window (from the store if possible) and replaces the cached candles.'''
+        self.resynced = True
+        rates = self._fetch_from_store()
+        if rates is None:
+            metrics.inc('fetches', kind='full')
+            with metrics.time('copy_rates_from_pos'):
+                rates = mt5.copy_rates_from_pos(self.symbol, get_mt5_interval(self.timeframe), 0, self.size)
+        if rates is None or len(rates) == 0:
+            self.length = 0
+            return None
+
+        if self._buffer is None or self._buffer.dtype != rates.dtype:
+            self._buffer = np.zeros(2 * self.size, dtype=rates.dtype)
+        count = len(rates)
+        self._buffer[:count] = rates
+        self._buffer[self.size:self.size + count] = rates
+        self._write = count % self.size
+        self.length = count
+        self.generation += 1
+        self._store_closed()
+        return self.rates()
+
+    def _store_closed(self):
+        '''Appends the closed candles the store does not have yet (all but the forming one).'''
+        if self.store is not None and self.length >= 2:
+            self.store.append(self.rates()[:-1])
+
+    def _append(self, bar):
+        self._buffer[self._write] = bar
+        self._buffer[self._write + self.size] = bar
+        self._write = (self._write + 1) % self.size
+        self.length = min(self.length + 1, self.size)
+
+    def _replace_last(self, bar):
+        last = (self._write - 1) % self.size
+        self._buffer[last] = bar
+        self._buffer[last + self.size] = bar
+
+    def _is_fresh(self, max_age: float):
+        '''True if the window was synced less than `max_age` seconds ago.'''
+        return max_age is not None and self.synced_at is not None and self.length >= 2 and \
+            clock.monotonic() - self.synced_at < max_age
+
+    def sync(self, max_age: float = None):
+        '''
+        Brings the cache up to date with the broker and returns rates() (None on failure).
+        Only the last closed candle, the forming candle and any newer candles are fetched.
+        If the cache was synced less than `max_age` seconds ago nothing is fetched, so
+        several readers of the same series in one cycle share a single request.
+        '''
+        if self._is_fresh(max_age):
+            return self.rates() # resynced still describes the sync that fetched these candles
+        self.synced_at = clock.monotonic()
+        self.resynced = False
+        if self.length < 2:
+            return self._seed()
+
+        window = self.rates()
+        last_closed = window[-2]
+        forming = window[-1]
+
+        # Fetch from the last closed candle so the first returned candle overlaps the cache.
+        # date_to is pushed into the future because broker server time may run ahead of UTC.
+        metrics.inc('fetches', kind='delta')
+        with metrics.time('copy_rates_range'):
+            fresh = mt5.copy_rates_range(self.symbol, get_mt5_interval(self.timeframe),
+                                         datetime.fromtimestamp(int(last_closed['time']), tz=utc),
+                                         clock.now() + timedelta(days=1))
+        if fresh is None or len(fresh) < 2:
+            return self._seed()
+
+        # The overlap must match exactly, otherwise the broker history changed under us
+        overlap = fresh[0]
+        if overlap['time'] != last_closed['time'] or fresh[1]['time'] != forming['time'] or \
+           any(overlap[field] != last_closed[field] for field in ('open', 'high', 'low', 'close')):
+            print(f"History for {self.symbol} ({self.timeframe}) does not match the cache. Re-syncing...")
+            metrics.inc('resyncs')
+            return self._seed()
+
+        # Too many new candles to append one by one: fetch the window again
+        if len(fresh) - 2 >= self.size:
+            return self._seed()
+
+        self._replace_last(fresh[1]) # The forming candle has new high/low/close/volume values
+        for bar in fresh[2:]:
+            self._append(bar)
+        if len(fresh) > 2:
+            self._store_closed()
+        return self.rates()
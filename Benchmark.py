@@ -0,0 +1,338 @@
+import os
+import ast
+import sys
+import json
+import timeit
+import platform
+import argparse
+import contextlib
+import subprocess
+import statistics
+import numpy as np
+import pandas as pd
+from pytz import utc
+from datetime import datetime
+
+import Broker
+from Broker import SimulatedBroker, set_broker
+
+# Start of the simulated clock: a Monday 00:00 UTC, so every timeframe has a candle boundary
+BENCH_START_TIME = 1704067200 # 2024-01-01 00:00 UTC
+BENCH_SEED = 42
+
+
+def _main_settings():
+    '''
+    Reads the literal settings of main.py (symbols table, HISTORY_BARS, STRATEGIES, ...)
+    without running it (main.py asks for credentials).
+    '''
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py'), encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    settings = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            try:
+                settings.setdefault(node.targets[0].id, ast.literal_eval(node.value))
+            except ValueError:
+                pass # Not a literal
+    if 'symbols' not in settings:
+        raise RuntimeError('symbols table not found in main.py')
+    return settings
+
+
+def _rates_frame(bars: int):
+    '''Synthetic candles in the DataFrame layout Indicator() receives.'''
+    broker = SimulatedBroker(seed=BENCH_SEED, speedup=0, start_time=BENCH_START_TIME, history_bars=bars)
+    return pd.DataFrame(broker.copy_rates_from_pos('EURUSD-VIP', Broker.TIMEFRAME_M15, 0, bars))
+
+
+def _use_simulated_broker(history_bars: int = 1000):
+    '''
+    Points the shared mt5 proxy at a fresh SimulatedBroker and replaces the Telegram
+    sender with a no-op, so order building is measured without network calls.
+    '''
+    import OrderProcessing
+    from MetadataCache import metadata_cache
+
+    broker = SimulatedBroker(seed=BENCH_SEED, speedup=0, start_time=BENCH_START_TIME, history_bars=history_bars)
+    set_broker(broker)
+    metadata_cache.invalidate()
+    metadata_cache.invalidate_account()
+    OrderProcessing.send_telegram_message = lambda message, on_sent=None, on_failed=None: None
+    OrderProcessing.SIGNAL_DIGEST_WINDOW = 0 # Measure rendering, not the digest timer
+    return broker
+
+
+# --- Micro-benchmarks -------------------------------------------------------------
+# Each setup function returns the callable that is timed.
+
+def _bench_indicator(bars: int):
+    def setup():
+        from DataProcessing import Indicator
+        df = _rates_frame(bars)
+        return lambda: Indicator(df)
+    return setup
+
+
+def _bench_indicator_from_rates(bars: int):
+    def setup():
+        from DataProcessing import IndicatorFromRates
+        rates = _rates_frame(bars).to_records(index=False)
+        return lambda: IndicatorFromRates(rates)
+    return setup
+
+
+def _bench_nz():
+    from DataProcessing import nz
+    values = [1.5, np.nan, None, 0.0] * 250
+    def run():
+        for value in values:
+            nz(value, 2.0)
+    return run
+
+
+def _bench_get_lot(balance: float):
+    def setup():
+        from OrderProcessing import get_lot
+        return lambda: get_lot(balance)
+    return setup
+
+
+def _bench_get_lots(accounts: int):
+    def setup():
+        from OrderProcessing import get_lots
+        balances = np.random.default_rng(BENCH_SEED).uniform(0, 1e6, accounts)
+        return lambda: get_lots(balances)
+    return setup
+
+
+def _bench_fan_out(accounts: int):
+    def setup():
+        from OrderProcessing import Buy_req, FanOut
+        broker = _use_simulated_broker()
+        price = broker.symbol_info_tick('EURUSD-VIP').bid
+        request = Buy_req('EURUSD-VIP', price, price - 0.002, price + 0.001)
+        balances = np.random.default_rng(BENCH_SEED).uniform(0, 1e6, accounts)
+        account_ids = np.arange(accounts)
+        return lambda: FanOut(request, balances, account_ids, 2)
+    return setup
+
+
+def _bench_schedule(series: int):
+    '''One 4h boundary over `series` synthetic series: select the due series, group them by symbol.'''
+    def setup():
+        from SymbolTable import SymbolTable, TIMEFRAMES
+        from TimeProcessing import CandleScheduler
+        table = SymbolTable((f'SYM{k // len(TIMEFRAMES):05d}', TIMEFRAMES[k % len(TIMEFRAMES)]) for k in range(series))
+        clock = [float(BENCH_START_TIME)]
+        scheduler = CandleScheduler(table, settle_delay=0, clock=lambda: clock[0])
+
+        def run():
+            clock[0] += 4 * 3600
+            table.by_symbol(scheduler.pop_due())
+        return run
+    return setup
+
+
+def _bench_order(side: str):
+    def setup():
+        from OrderProcessing import Execute_Buy_Order, Execute_Sell_Order
+        broker = _use_simulated_broker()
+        price = broker.symbol_info_tick('EURUSD-VIP').bid
+        if side == 'buy':
+            return lambda: Execute_Buy_Order('EURUSD-VIP', price, price - 0.002, price + 0.001, '15m')
+        return lambda: Execute_Sell_Order('EURUSD-VIP', price, price + 0.002, price - 0.001, '15m')
+    return setup
+
+
+# --- Macro-benchmark: one cycle of the trading loop over the main.py symbols table -----
+
+class _BrokerClock:
+    '''Clock on the simulated time of a SimulatedBroker (speedup 0), which only moves with advance().'''
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def time(self):
+        return self.broker.now()
+
+    def now(self):
+        return datetime.fromtimestamp(self.broker.now(), tz=utc)
+
+    def monotonic(self):
+        return self.broker.now()
+
+    def sleep(self, seconds: float):
+        self.broker.advance(seconds)
+
+
+def _bench_cycle(mode: str):
+    '''
+    Runs SeriesProcessor.process_due(), the code main.py runs at every boundary, with the
+    settings of main.py, an in-memory journal and every message delivered at once. The
+    active clock follows the simulated broker, so caches see the simulated time.
+
+    mode 'cold': every call starts from a new processor and journal, so all caches and
+    indicator states are seeded before every series is evaluated (program start).
+    mode 'burst': every call moves the simulated clock to the next 4h boundary and
+    processes the series the scheduler finds due, as on a 4h boundary where all intraday
+    series are due. The sessions are always open, so every call is a full boundary.
+    '''
+    def setup():
+        import OrderProcessing
+        from SeriesProcessing import SeriesProcessor
+        from SessionCalendar import SessionCalendar
+        from StateJournal import StateJournal
+        from Strategies import StrategyPipeline
+        from SymbolTable import NO_CANDLE, SymbolTable
+        from TimeProcessing import CandleScheduler, set_clock
+
+        settings = _main_settings()
+        history_bars = settings.get('HISTORY_BARS', 550)
+        broker = _use_simulated_broker(history_bars=history_bars + 5000)
+        set_clock(_BrokerClock(broker))
+        OrderProcessing.send_telegram_message = lambda message, on_sent=None, on_failed=None: on_sent and on_sent()
+        calendar = SessionCalendar({'default': {'weekly': [['Mon 00:00', 'Sun 23:59']]}})
+        table = SymbolTable((symbol, timeframe) for symbol, timeframe in settings['symbols'])
+        scheduler = CandleScheduler(table, settle_delay=0, calendar=calendar)
+
+        def new_processor():
+            table.last_processed[:] = NO_CANDLE
+            return SeriesProcessor(table, StateJournal(':memory:'), StrategyPipeline(settings.get('STRATEGIES', ['indicator_bands'])),
+                                   history_bars=history_bars, resample=settings.get('RESAMPLE_HIGHER_TIMEFRAMES', True),
+                                   sync_max_age=settings.get('SYNC_MAX_AGE', 1), calendar=calendar)
+
+        processor = new_processor()
+        everything = list(range(len(table)))
+        processor.process_due(everything, scheduler) # Generate the synthetic histories outside the timing
+
+        def run():
+            nonlocal processor
+            if mode == 'cold':
+                processor = new_processor()
+                processor.process_due(everything, scheduler)
+            else:
+                broker.advance(4 * 3600)
+                processor.process_due(scheduler.pop_due(), scheduler)
+        return run
+    return setup
+
+
+BENCHMARKS = {
+    'indicator.550': _bench_indicator(550),
+    'indicator.5k': _bench_indicator(5000),
+    'indicator.100k': _bench_indicator(100000),
+    'indicator_from_rates.550': _bench_indicator_from_rates(550),
+    'indicator_from_rates.100k': _bench_indicator_from_rates(100000),
+    'nz.1000': _bench_nz,
+    'get_lot.1e3': _bench_get_lot(1e3),
+    'get_lot.1e5': _bench_get_lot(1e5),
+    'get_lot.1e7': _bench_get_lot(1e7),
+    'get_lots.10k': _bench_get_lots(10000),
+    'fan_out.10k': _bench_fan_out(10000),
+    'schedule.5k': _bench_schedule(5000),
+    'order.buy': _bench_order('buy'),
+    'order.sell': _bench_order('sell'),
+    'cycle.cold': _bench_cycle('cold'),
+    'cycle.burst_4h': _bench_cycle('burst'),
+}
+
+
+def Measure(func, repeat: int = 5, min_time: float = 0.2):
+    '''
+    Times `func` with timeit: the number of calls per sample is raised until a sample
+    takes at least `min_time` seconds, then `repeat` samples are taken.
+
+    Returns:
+        dict: Seconds per call ('min', 'median'), calls per sample ('number') and 'repeat'.
+    '''
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9) * 1.2))
+    samples = [elapsed / number] + [timer.timeit(number) / number for _ in range(repeat - 1)]
+    return {'min': min(samples), 'median': statistics.median(samples), 'number': number, 'repeat': repeat}
+
+
+def _environment():
+    '''Machine and revision the results were measured on, stored alongside them.'''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def RunBenchmarks(names=None, repeat: int = 5, min_time: float = 0.2):
+    '''
+    Runs the selected benchmarks (all by default) and returns the results document:
+    {'environment': {...}, 'results': {name: Measure() result}}.
+    '''
+    results = {}
+    for name in names or BENCHMARKS:
+        # The trading code logs with print(); keep it out of the report while timing
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            func = BENCHMARKS[name]()
+            results[name] = Measure(func, repeat=repeat, min_time=min_time)
+        print(f"{name:<28}{results[name]['min'] * 1e3:>12.4f} ms")
+    return {'environment': _environment(), 'results': results}
+
+
+def Compare(baseline: dict, current: dict, tolerance: float = 0.25):
+    '''
+    Compares the 'min' time of every benchmark present in both documents.
+
+    Returns:
+        list: (name, baseline seconds, current seconds, ratio) for every benchmark that
+              became more than `tolerance` (relative) slower.
+    '''
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        ratio = result['min'] / before['min']
+        if ratio > 1 + tolerance:
+            regressions.append((name, before['min'], result['min'], ratio))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for the indicator, order building and the main loop.')
+    parser.add_argument('-k', '--filter', default=None, help='Only run benchmarks whose name contains this text')
+    parser.add_argument('-o', '--output', default=None, help='Write the results to this JSON file')
+    parser.add_argument('-b', '--baseline', default=None, help='JSON results to compare against')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.25, help='Allowed slowdown before failing (0.25 = 25%%)')
+    parser.add_argument('--repeat', type=int, default=5, help='Samples per benchmark')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Minimum seconds per sample')
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.filter is None or args.filter in name]
+    document = RunBenchmarks(names, repeat=args.repeat, min_time=args.min_time)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = Compare(baseline, document, args.tolerance)
+        for name, before, after, ratio in regressions:
+            print(f"REGRESSION {name}: {before * 1e3:.4f} ms -> {after * 1e3:.4f} ms ({ratio:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
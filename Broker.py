@@ -0,0 +1,319 @@
+import os
+import zlib
+import threading
+import numpy as np
+from time import monotonic
+from collections import namedtuple
+from datetime import datetime
+from typing import Protocol
+
+# MetaTrader5 constants used by this project (same numeric values as the MetaTrader5 package)
+TIMEFRAME_M1 = 1
+TIMEFRAME_M3 = 3
+TIMEFRAME_M5 = 5
+TIMEFRAME_M15 = 15
+TIMEFRAME_M30 = 30
+TIMEFRAME_H1 = 16385
+TIMEFRAME_H2 = 16386
+TIMEFRAME_H3 = 16387
+TIMEFRAME_H4 = 16388
+TIMEFRAME_D1 = 16408
+TRADE_ACTION_DEAL = 1
+ORDER_TYPE_BUY = 0
+ORDER_TYPE_SELL = 1
+ORDER_TIME_GTC = 0
+ORDER_FILLING_FOK = 0
+
+# Candle length in seconds for every MetaTrader5 timeframe constant above
+TIMEFRAME_PERIODS = {
+    TIMEFRAME_M1: 60, TIMEFRAME_M3: 180, TIMEFRAME_M5: 300, TIMEFRAME_M15: 900, TIMEFRAME_M30: 1800,
+    TIMEFRAME_H1: 3600, TIMEFRAME_H2: 7200, TIMEFRAME_H3: 10800, TIMEFRAME_H4: 14400, TIMEFRAME_D1: 86400,
+}
+
+# Structured dtype of the arrays returned by mt5.copy_rates_*
+RATES_DTYPE = np.dtype([
+    ('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+    ('tick_volume', '<u8'), ('spread', '<i4'), ('real_volume', '<u8'),
+])
+
+
+class Broker(Protocol):
+    '''
+    The subset of the MetaTrader5 module API this project uses. Any object providing
+    these calls (and the TIMEFRAME_* / ORDER_* constants) can be installed with set_broker().
+    '''
+
+    def initialize(self, **kwargs) -> bool: ...
+    def login(self, login: int, password: str = None, server: str = None, **kwargs) -> bool: ...
+    def shutdown(self) -> None: ...
+    def last_error(self) -> tuple: ...
+    def terminal_info(self): ...
+    def symbol_select(self, symbol: str, enable: bool = True) -> bool: ...
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int): ...
+    def copy_rates_from(self, symbol: str, timeframe: int, date_from, count: int): ...
+    def copy_rates_range(self, symbol: str, timeframe: int, date_from, date_to): ...
+    def positions_get(self, **kwargs): ...
+    def positions_total(self) -> int: ...
+    def account_info(self): ...
+    def symbol_info(self, symbol: str): ...
+    def symbol_info_tick(self, symbol: str): ...
+
+
+class MT5Broker:
+    '''
+    Adapter for the real MetaTrader5 terminal. The MetaTrader5 package is only imported
+    when the adapter is created, so the rest of the project can be imported without it.
+    '''
+
+    def __init__(self):
+        import MetaTrader5
+        self._mt5 = MetaTrader5
+
+    def __getattr__(self, name):
+        # Every call and constant is served by the MetaTrader5 module itself
+        return getattr(self._mt5, name)
+
+
+TerminalInfo = namedtuple('TerminalInfo', ['connected', 'trade_allowed', 'name'])
+AccountInfo = namedtuple('AccountInfo', ['login', 'balance', 'equity', 'currency', 'server'])
+SymbolInfo = namedtuple('SymbolInfo', ['name', 'digits', 'point', 'trade_contract_size',
+                                       'volume_min', 'volume_max', 'volume_step', 'spread'])
+Tick = namedtuple('Tick', ['time', 'bid', 'ask', 'last', 'volume', 'time_msc'])
+Position = namedtuple('Position', ['ticket', 'symbol', 'magic', 'comment', 'type', 'volume',
+                                   'price_open', 'sl', 'tp', 'time'])
+
+
+class SimulatedBroker:
+    '''
+    Offline stand-in for the MetaTrader5 terminal. It serves candles and ticks either
+    from local files or from a seeded synthetic random walk, on a simulated clock that
+    can run faster than real time, so the trading loop can run and be profiled on any box.
+
+    Candles for (symbol, timeframe) are read from `<data_dir>/<symbol>_<timeframe>.npy`
+    (a structured array as returned by copy_rates_from_pos, timeframe as in '15m') when
+    present; otherwise they are generated deterministically from `seed`, symbol and
+    timeframe. Every series of a symbol starts from the same base price, but the series
+    are independent walks, so they are only meant for load and throughput testing.
+
+    Args:
+        data_dir (str, optional): Directory with recorded rates files.
+        seed (int): Seed of the synthetic generator.
+        speedup (float): Simulated seconds per real second. Use 0 to only move the clock
+                         through set_time()/advance().
+        start_time (float, optional): Simulated epoch time at creation. Defaults to now.
+        history_bars (int): Synthetic candles available before the start time.
+        balance (float): Account balance reported by account_info().
+    '''
+
+    TIMEFRAME_M1, TIMEFRAME_M3, TIMEFRAME_M5 = TIMEFRAME_M1, TIMEFRAME_M3, TIMEFRAME_M5
+    TIMEFRAME_M15, TIMEFRAME_M30 = TIMEFRAME_M15, TIMEFRAME_M30
+    TIMEFRAME_H1, TIMEFRAME_H2, TIMEFRAME_H3 = TIMEFRAME_H1, TIMEFRAME_H2, TIMEFRAME_H3
+    TIMEFRAME_H4, TIMEFRAME_D1 = TIMEFRAME_H4, TIMEFRAME_D1
+    TRADE_ACTION_DEAL, ORDER_TYPE_BUY, ORDER_TYPE_SELL = TRADE_ACTION_DEAL, ORDER_TYPE_BUY, ORDER_TYPE_SELL
+    ORDER_TIME_GTC, ORDER_FILLING_FOK = ORDER_TIME_GTC, ORDER_FILLING_FOK
+
+    _TIMEFRAME_NAMES = {
+        TIMEFRAME_M1: '1m', TIMEFRAME_M3: '3m', TIMEFRAME_M5: '5m', TIMEFRAME_M15: '15m', TIMEFRAME_M30: '30m',
+        TIMEFRAME_H1: '1h', TIMEFRAME_H2: '2h', TIMEFRAME_H3: '3h', TIMEFRAME_H4: '4h', TIMEFRAME_D1: '1d',
+    }
+
+    def __init__(self, data_dir: str = None, seed: int = 0, speedup: float = 1.0, start_time: float = None,
+                 history_bars: int = 1000, balance: float = 10000.0):
+        self.data_dir = data_dir
+        self.seed = seed
+        self.speedup = speedup
+        self.history_bars = history_bars
+        self.balance = balance
+        self.connected = False
+        self.positions = [] # Position tuples returned by positions_get()
+
+        self._time_origin = float(start_time if start_time is not None else datetime.now().timestamp())
+        self._real_origin = monotonic()
+        self._series = {} # (symbol, timeframe) -> (rates array, generator state or None)
+
+    # --- Simulated clock ---------------------------------------------------------
+
+    def now(self):
+        '''Current simulated epoch time in seconds.'''
+        return self._time_origin + (monotonic() - self._real_origin) * self.speedup
+
+    def set_time(self, timestamp: float):
+        self._time_origin = float(timestamp)
+        self._real_origin = monotonic()
+
+    def advance(self, seconds: float):
+        self.set_time(self.now() + seconds)
+
+    # --- Candle series -----------------------------------------------------------
+
+    def _symbol_seed(self, *parts):
+        return zlib.crc32('|'.join(str(part) for part in (self.seed,) + parts).encode())
+
+    def _base_price(self, symbol: str):
+        if symbol.startswith('XAU'):
+            return 1900.0
+        if 'JPY' in symbol:
+            return 150.0
+        return 0.5 + (self._symbol_seed(symbol) % 1000) / 1000
+
+    def _generate(self, symbol: str, timeframe: int, start_index: int, count: int, last_close: float, rng):
+        period = TIMEFRAME_PERIODS[timeframe]
+        volatility = 0.0005 * np.sqrt(period / 60) # Relative, so long walks never reach zero
+        closes = last_close * np.exp(np.cumsum(rng.normal(0.0, volatility, count)))
+        opens = np.concatenate(([last_close], closes[:-1]))
+        wicks = np.abs(rng.normal(0.0, volatility, (2, count))) * opens
+
+        rates = np.zeros(count, dtype=RATES_DTYPE)
+        rates['time'] = (start_index + np.arange(count)) * period
+        rates['open'] = opens
+        rates['close'] = closes
+        rates['high'] = np.maximum(opens, closes) + wicks[0]
+        rates['low'] = np.minimum(opens, closes) - wicks[1]
+        rates['tick_volume'] = rng.integers(10, 1000, count)
+        rates['spread'] = 10
+        return rates
+
+    def _rates(self, symbol: str, timeframe: int):
+        '''Returns every candle of the series that has opened by the simulated time.'''
+        key = (symbol, timeframe)
+        period = TIMEFRAME_PERIODS[timeframe]
+        current_index = int(self.now()) // period
+
+        if key not in self._series:
+            path = os.path.join(self.data_dir, f"{symbol}_{self._TIMEFRAME_NAMES[timeframe]}.npy") if self.data_dir else None
+            if path and os.path.exists(path):
+                self._series[key] = (np.load(path), None)
+            else:
+                rng = np.random.default_rng(self._symbol_seed(symbol, timeframe))
+                first_index = current_index - self.history_bars + 1
+                rates = self._generate(symbol, timeframe, first_index, self.history_bars, self._base_price(symbol), rng)
+                self._series[key] = (rates, rng)
+
+        rates, rng = self._series[key]
+        if rng is not None and rates['time'][-1] // period < current_index:
+            # Extend the synthetic series up to the candle that is open now
+            last_index = rates['time'][-1] // period
+            extra = self._generate(symbol, timeframe, last_index + 1, current_index - last_index, rates['close'][-1], rng)
+            rates = np.concatenate((rates, extra))
+            self._series[key] = (rates, rng)
+
+        end = np.searchsorted(rates['time'], self.now(), side='right')
+        return rates[:end]
+
+    # --- Broker API ----------------------------------------------------------------
+
+    def initialize(self, **kwargs):
+        self.connected = True
+        return True
+
+    def login(self, login=None, password=None, server=None, **kwargs):
+        self.connected = True
+        return True
+
+    def shutdown(self):
+        self.connected = False
+
+    def last_error(self):
+        return (1, 'Success')
+
+    def terminal_info(self):
+        return TerminalInfo(connected=self.connected, trade_allowed=True, name='SimulatedBroker')
+
+    def symbol_select(self, symbol: str, enable: bool = True):
+        return True
+
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int):
+        rates = self._rates(symbol, timeframe)
+        end = len(rates) - start_pos
+        return rates[max(0, end - count):max(0, end)].copy()
+
+    def copy_rates_from(self, symbol: str, timeframe: int, date_from, count: int):
+        # MT5 semantics: `count` candles opened at or before date_from
+        rates = self._rates(symbol, timeframe)
+        end = np.searchsorted(rates['time'], _epoch(date_from), side='right')
+        return rates[max(0, end - count):end].copy()
+
+    def copy_rates_range(self, symbol: str, timeframe: int, date_from, date_to):
+        rates = self._rates(symbol, timeframe)
+        start = np.searchsorted(rates['time'], _epoch(date_from), side='left')
+        end = np.searchsorted(rates['time'], _epoch(date_to), side='right')
+        return rates[start:end].copy()
+
+    def positions_get(self, symbol: str = None, **kwargs):
+        if symbol is None:
+            return tuple(self.positions)
+        return tuple(position for position in self.positions if position.symbol == symbol)
+
+    def positions_total(self):
+        return len(self.positions)
+
+    def account_info(self):
+        return AccountInfo(login=0, balance=self.balance, equity=self.balance, currency='USD', server='Simulated')
+
+    def symbol_info(self, symbol: str):
+        digits = 2 if symbol.startswith('XAU') else (3 if 'JPY' in symbol else 5)
+        return SymbolInfo(name=symbol, digits=digits, point=10.0 ** -digits,
+                          trade_contract_size=100.0 if symbol.startswith('XAU') else 100000.0,
+                          volume_min=0.01, volume_max=100.0, volume_step=0.01, spread=10)
+
+    def symbol_info_tick(self, symbol: str):
+        # Ticks follow the close of the symbol's currently forming M1 candle
+        bid = float(self._rates(symbol, TIMEFRAME_M1)['close'][-1])
+        info = self.symbol_info(symbol)
+        now = self.now()
+        return Tick(time=int(now), bid=bid, ask=bid + info.spread * info.point, last=bid,
+                    volume=0, time_msc=int(now * 1000))
+
+
+class SerializedBroker:
+    '''
+    Wraps a broker backend so that only one thread at a time talks to it. The MetaTrader5
+    package keeps a single connection to the terminal and is not safe to call concurrently,
+    so this is installed when series are evaluated on a worker pool. Constants are passed through.
+    '''
+
+    def __init__(self, broker):
+        self._broker = broker
+        self._lock = threading.RLock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._broker, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+        return call
+
+
+def _epoch(value):
+    return value.timestamp() if isinstance(value, datetime) else float(value)
+
+
+# --- Active broker -------------------------------------------------------------------
+
+_active_broker = None
+
+def set_broker(broker):
+    '''Installs the broker backend used by every module through `Broker.mt5`.'''
+    global _active_broker
+    _active_broker = broker
+
+def get_broker():
+    '''Returns the active broker backend, creating the real MT5 adapter on first use.'''
+    global _active_broker
+    if _active_broker is None:
+        _active_broker = MT5Broker()
+    return _active_broker
+
+
+class _BrokerProxy:
+    '''Module-like object that forwards every attribute to the active broker backend.'''
+
+    def __getattr__(self, name):
+        return getattr(get_broker(), name)
+
+
+# Drop-in replacement for `import MetaTrader5 as mt5`
+mt5 = _BrokerProxy()
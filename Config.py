@@ -0,0 +1,106 @@
+import os
+import json
+import math
+
+from TimeProcessing import TIMEFRAME_SECONDS
+
+# Environment variables override the config file (keep the password out of the file)
+ENV_VARS = {
+    'TRADING_MT5_ACCOUNT': ('mt5', 'account'),
+    'TRADING_MT5_PASSWORD': ('mt5', 'password'),
+    'TRADING_MT5_SERVER': ('mt5', 'server'),
+    'TRADING_TELEGRAM_BOT_TOKEN': ('telegram', 'bot_token'),
+    'TRADING_TELEGRAM_CHAT_ID': ('telegram', 'chat_id'),
+    'TRADING_TELEGRAM_API_URL': ('telegram', 'api_url'),
+    'TRADING_SIGNAL_DIGEST_WINDOW': ('signals', 'digest_window'),
+}
+CONFIG_ENV_VAR = 'TRADING_CONFIG' # Path of the config file if --config is not given
+
+
+def LoadConfig(path: str = None, environ=None):
+    '''
+    Reads the daemon configuration from a JSON file and the TRADING_* environment variables:
+
+        {
+            "mt5": {"account": 12345678, "password": "...", "server": "Broker-Server"},
+            "telegram": {"bot_token": "...", "chat_id": "...", "api_url": "https://api.telegram.org"},
+            "symbols": [["EURUSD-VIP", "15m"], ["XAUUSD-VIP", "1h"]],
+            "followers": [{"account": 11111111, "balance": 2500.0}],
+            "signals": {"digest_window": 2.0, "critical_strategies": ["indicator_bands"]}
+        }
+
+    Every key is optional in the file. Environment variables (see ENV_VARS) take
+    precedence over the file. Missing symbols or Telegram settings mean "use the
+    defaults in main.py / OrderProcessing.py". Follower accounts get order payloads
+    (lots sized by their balance) for every signal. "digest_window" is the number of seconds
+    signals are collected into one Telegram digest (0: every signal on its own), and the
+    signals of "critical_strategies" are always sent at once.
+
+    Args:
+        path (str, optional): Config file. Defaults to $TRADING_CONFIG; without either,
+                              only the environment is read.
+
+    Returns:
+        dict: {'mt5': {...}, 'telegram': {...}, 'symbols': list of (symbol, timeframe) or None,
+               'followers': list of (account, balance),
+               'signals': {'digest_window': float or None, 'critical_strategies': list of names}}.
+
+    Raises:
+        ValueError: If the MT5 credentials are incomplete or a symbol, follower or signal setting is invalid.
+    '''
+    environ = os.environ if environ is None else environ
+    path = path or environ.get(CONFIG_ENV_VAR)
+
+    config = {}
+    if path:
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+    config = {'mt5': dict(config.get('mt5') or {}), 'telegram': dict(config.get('telegram') or {}),
+              'symbols': config.get('symbols'), 'followers': config.get('followers') or [],
+              'signals': dict(config.get('signals') or {})}
+
+    for variable, (section, key) in ENV_VARS.items():
+        if environ.get(variable):
+            config[section][key] = environ[variable]
+
+    mt5_config = config['mt5']
+    missing = [key for key in ('account', 'password', 'server') if not mt5_config.get(key)]
+    if missing:
+        raise ValueError(f"Missing MT5 settings: {', '.join(missing)} (config file or TRADING_MT5_* variables)")
+    try:
+        mt5_config['account'] = int(mt5_config['account'])
+    except (TypeError, ValueError):
+        raise ValueError(f"MT5 account must be an integer, got {mt5_config['account']!r}") from None
+
+    if config['symbols'] is not None:
+        symbols = []
+        for entry in config['symbols']:
+            if len(entry) != 2 or entry[1] not in TIMEFRAME_SECONDS:
+                raise ValueError(f"Invalid symbol entry {entry!r}: expected [symbol, timeframe] with a timeframe "
+                                 f"from {', '.join(TIMEFRAME_SECONDS)}")
+            symbols.append((str(entry[0]), entry[1]))
+        config['symbols'] = symbols
+
+    followers = []
+    for entry in config['followers']:
+        try:
+            followers.append((int(entry['account']), float(entry['balance'])))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Invalid follower entry {entry!r}: expected {{\"account\": number, \"balance\": number}}") from None
+    config['followers'] = followers
+
+    signals = config['signals']
+    raw_window, window = signals.get('digest_window'), None
+    if raw_window is not None:
+        try:
+            window = float(raw_window)
+        except (TypeError, ValueError):
+            raise ValueError(f"Signal digest window must be a number of seconds >= 0, got {raw_window!r}") from None
+        if not math.isfinite(window) or window < 0:
+            raise ValueError(f"Signal digest window must be a number of seconds >= 0, got {raw_window!r}")
+    signals['digest_window'] = window
+    critical = signals.get('critical_strategies') or []
+    if not isinstance(critical, list) or not all(isinstance(name, str) for name in critical):
+        raise ValueError(f"critical_strategies must be a list of strategy names, got {critical!r}")
+    signals['critical_strategies'] = critical
+    return config
@@ -1,6 +1,30 @@
+from __future__ import annotations # pd.DataFrame annotations must not import pandas
+
 import numpy as np
-import pandas as pd
-from talib import ATR # For Average True Range calculation
+from math import isfinite
+from importlib import import_module
+
+
+class _LazyModule:
+    '''Stands in for a module and imports it on first attribute access.'''
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = import_module(self._name)
+        return getattr(self._module, attr)
+
+
+# pandas and TA-Lib are only loaded once something needs them: the streaming
+# IndicatorState used by the trading loop only touches TA-Lib on its first ATR step
+pd = _LazyModule('pandas')
+talib = _LazyModule('talib')
+
+def ATR(high, low, close, timeperiod: int = 14): # For Average True Range calculation
+    return talib.ATR(high=high, low=low, close=close, timeperiod=timeperiod)
 
 def nz(x, y=None):
     '''
@@ -177,3 +201,468 @@ def Indicator(df_rates_orig: pd.DataFrame):
     final_average = nz(avg_lst[target_idx])
     
     return final_maximum, final_minimum, final_average
+
+
+def _fma(x: float, y: float, z: float):
+    '''
+    Correctly rounded x * y + z, i.e. what C's fma() returns. It is computed
+    exactly with integer arithmetic (Python's int division rounds correctly).
+    '''
+    if not (isfinite(x) and isfinite(y) and isfinite(z)):
+        return x * y + z
+    xn, xd = x.as_integer_ratio()
+    yn, yd = y.as_integer_ratio()
+    zn, zd = z.as_integer_ratio()
+    return (xn * yn * zd + zn * xd * yd) / (xd * yd * zd)
+
+
+def _atr_step_classic(prev_atr: float, true_range: float, period: int):
+    # TA-Lib 0.4.x: prevATR *= period-1; prevATR += TR; prevATR /= period
+    return (prev_atr * (period - 1) + true_range) / period
+
+
+def _atr_step_fma(prev_atr: float, true_range: float, period: int):
+    # TA-Lib 0.6+: prevATR = fma(prevATR, (period-1)/period, TR * (1 - (period-1)/period))
+    decay = (period - 1) / period
+    return _fma(prev_atr, decay, true_range * (1.0 - decay))
+
+
+def _detect_atr_step():
+    '''
+    Returns the Wilder smoothing step that reproduces the installed talib.ATR
+    bit for bit. Different TA-Lib releases round the smoothing differently, and
+    IndicatorState must match whichever one Indicator() is using.
+    '''
+    period = 3
+    idx = np.arange(64, dtype=np.float64)
+    close = 1900.0 + np.sin(idx * 0.7) * 13.37 + idx * 0.11
+    high = close + 1.0 + np.cos(idx * 1.3) ** 2 * 3.1
+    low = close - 1.0 - np.sin(idx * 0.9) ** 2 * 2.9
+    expected = ATR(high=high, low=low, close=close, timeperiod=period)
+
+    for step in (_atr_step_fma, _atr_step_classic):
+        atr = expected[period]
+        for i in range(period + 1, len(close)):
+            true_range = max(high[i] - low[i], abs(high[i] - close[i - 1]), abs(low[i] - close[i - 1]))
+            atr = step(atr, true_range, period)
+            if atr != expected[i]:
+                break
+        else:
+            return step
+    return _atr_step_classic
+
+
+def _atr_step_first(prev_atr: float, true_range: float, period: int):
+    # Detects the TA-Lib smoothing on first use, then replaces itself with the detected step
+    global _atr_step
+    _atr_step = _detect_atr_step()
+    return _atr_step(prev_atr, true_range, period)
+
+
+_atr_step = _atr_step_first
+
+
+class IndicatorState:
+    '''
+    Streaming version of Indicator() for a single (symbol, timeframe) series.
+    It keeps the Wilder ATR and the upper/lower/os/spt/max/min/avg recurrences
+    and advances them by one closed candle per update() call, so the cost per
+    new candle stays constant no matter how long the history is.
+
+    Feeding it the same closed candles that Indicator() sees (everything except
+    the still-forming last candle) produces exactly the same (maximum, minimum,
+    average) values as Indicator().
+    '''
+
+    def __init__(self, atr_period: int = 18, atr_multiplier: float = 5):
+        self.atr_period = atr_period
+        self.atr_multiplier = atr_multiplier
+        self.count = 0            # Number of closed candles consumed so far
+        self.last_time = None     # Open time of the last consumed candle
+        self.prev_close = np.nan
+
+        # Wilder ATR state (matches talib.ATR: SMA seed of TR[1..period], then smoothing)
+        self.tr_sum = 0.0
+        self.atr = np.nan
+
+        # Indicator recurrences, initialised to what nz() returns for the first candle
+        self.upper = 0.0
+        self.lower = 0.0
+        self.os = 0
+        self.spt = np.nan
+        self.maximum = np.nan
+        self.minimum = np.nan
+        self.average = np.nan
+
+    def update(self, high: float, low: float, close: float, time=None):
+        '''
+        Advances the state by one closed candle.
+
+        Args:
+            high (float): High of the closed candle.
+            low (float): Low of the closed candle.
+            close (float): Close of the closed candle.
+            time: Optional open time of the candle, kept in `last_time`.
+
+        Returns:
+            tuple: (maximum, minimum, average) for this candle, see value().
+        '''
+        i = self.count
+        period = self.atr_period
+        prev_close = self.prev_close
+
+        self.count = i + 1
+        self.prev_close = close
+        if time is not None:
+            self.last_time = time
+
+        if i == 0: # The first candle has no previous close, so no true range yet
+            return self.value()
+
+        # True range, computed the same way as TA-Lib
+        true_range = max(high - low, abs(high - prev_close), abs(low - prev_close))
+        if i < period:
+            self.tr_sum += true_range
+            return self.value()
+        elif i == period:
+            self.tr_sum += true_range
+            self.atr = self.tr_sum / period
+        else:
+            self.atr = _atr_step(self.atr, true_range, period)
+
+        self._advance(high, low, close, prev_close, self.atr, first=(i == period))
+        return self.value()
+
+    def _advance(self, high: float, low: float, src: float, prev_close: float, atr: float, first: bool):
+        '''
+        One step of the upper/lower/os/spt/max/min/avg recurrence of Indicator()
+        for a candle whose ATR is already known. `first` marks the first candle
+        with a valid ATR, where Indicator() seeds max/min with the close.
+        '''
+        atr_multiplier = atr * self.atr_multiplier
+        up = (high + low) / 2 + atr_multiplier
+        dn = (high + low) / 2 - atr_multiplier
+
+        prev_upper_val = self.upper
+        prev_lower_val = self.lower
+        upper = min(up, prev_upper_val) if prev_close < prev_upper_val else up
+        lower = max(dn, prev_lower_val) if prev_close > prev_lower_val else dn
+
+        if src > upper:
+            os = 1
+        elif src < lower:
+            os = 0
+        else:
+            os = self.os
+
+        spt = lower if os == 1 else upper
+
+        prev_max_val = src if first else self.maximum
+        prev_min_val = src if first else self.minimum
+
+        if (prev_close < spt and src >= spt) or (prev_close > spt and src <= spt):
+            max_val = max(prev_max_val, src)
+            min_val = min(prev_min_val, src)
+        elif os == 0:
+            max_val = min(spt, prev_max_val)
+            min_val = min(src, prev_min_val)
+        else:
+            max_val = max(src, prev_max_val)
+            min_val = max(spt, prev_min_val)
+
+        self.upper, self.lower, self.os, self.spt = upper, lower, os, spt
+        self.maximum, self.minimum = max_val, min_val
+        self.average = (max_val + min_val) / 2
+
+    def update_many(self, highs, lows, closes, times=None):
+        '''
+        Advances the state over a sequence of closed candles (oldest first).
+
+        Returns:
+            tuple: (maximum, minimum, average) for the last candle consumed.
+        '''
+        # Work on plain Python floats: float64 views convert in one pass and avoid
+        # per-element numpy scalar overhead inside the recurrence.
+        highs = np.asarray(highs, dtype=np.float64).tolist()
+        lows = np.asarray(lows, dtype=np.float64).tolist()
+        closes = np.asarray(closes, dtype=np.float64).tolist()
+
+        update = self.update
+        for high, low, close in zip(highs, lows, closes):
+            update(high, low, close)
+
+        if times is not None and len(times) > 0:
+            self.last_time = times[-1]
+        return self.value()
+
+    def value(self):
+        '''
+        Returns (maximum, minimum, average) for the most recently consumed candle,
+        or (np.nan, np.nan, np.nan) while the state is still warming up.
+        '''
+        if self.count <= self.atr_period:
+            return np.nan, np.nan, np.nan
+        return self.maximum, self.minimum, self.average
+
+    _FIELDS = ('atr_period', 'atr_multiplier', 'count', 'last_time', 'prev_close', 'tr_sum', 'atr',
+               'upper', 'lower', 'os', 'spt', 'maximum', 'minimum', 'average')
+
+    def to_dict(self):
+        '''Returns the state as a dict of plain Python numbers (JSON-serializable, NaN included).'''
+        state = {}
+        for field in self._FIELDS:
+            value = getattr(self, field)
+            state[field] = value.item() if isinstance(value, np.generic) else value
+        return state
+
+    @classmethod
+    def from_dict(cls, state: dict):
+        '''Rebuilds a state saved with to_dict().'''
+        restored = cls(state['atr_period'], state['atr_multiplier'])
+        for field in cls._FIELDS:
+            setattr(restored, field, state[field])
+        return restored
+
+
+def IndicatorFromArrays(high, low, close, time=None):
+    '''
+    Array-native equivalent of Indicator(). It takes the raw high/low/close (and
+    optionally time) arrays, e.g. the fields of the structured array returned by
+    mt5.copy_rates_from_pos, and never builds a DataFrame.
+
+    ATR is computed by TA-Lib over the whole buffer and the band recurrence then
+    runs in a single pass over plain floats, giving bit-identical results to
+    Indicator() for the same candles.
+
+    Args:
+        high, low, close (array-like): Candle prices, one element per candle.
+        time (array-like, optional): Candle open times. Only used to restore
+                                     ascending order if the input is unsorted.
+
+    Returns:
+        tuple: (maximum, minimum, average) for the second to last candle.
+               Returns (np.nan, np.nan, np.nan) if not enough data.
+    '''
+    # TA-Lib needs contiguous float64 buffers; this is a no-op for plain float64 arrays
+    # and one strided copy for the fields of an MT5 structured array.
+    high = np.ascontiguousarray(high, dtype=np.float64)
+    low = np.ascontiguousarray(low, dtype=np.float64)
+    close = np.ascontiguousarray(close, dtype=np.float64)
+
+    # Same ordering guarantee as Indicator(), without re-ordering already sorted input
+    if time is not None:
+        time = np.asarray(time)
+        if len(time) > 1 and np.any(time[1:] < time[:-1]):
+            order = np.argsort(time, kind='stable')
+            high, low, close = high[order], low[order], close[order]
+
+    state = IndicatorState()
+    period = state.atr_period
+    if len(close) < period + 2:
+        return np.nan, np.nan, np.nan
+
+    atr = ATR(high=high, low=low, close=close, timeperiod=period).tolist()
+    highs, lows, closes = high.tolist(), low.tolist(), close.tolist()
+
+    # The last candle is still forming, so the recurrence stops at the second to last one
+    advance = state._advance
+    for i in range(period, len(closes) - 1):
+        advance(highs[i], lows[i], closes[i], closes[i - 1], atr[i], i == period)
+    state.count = len(closes) - 1
+
+    return state.value()
+
+
+def IndicatorFromRates(rates):
+    '''
+    Runs IndicatorFromArrays() directly on the structured array returned by
+    mt5.copy_rates_from_pos (fields 'time', 'high', 'low', 'close').
+    '''
+    return IndicatorFromArrays(rates['high'], rates['low'], rates['close'], rates['time'])
+
+
+def StackRates(rates_list, n_bars: int = None):
+    '''
+    Stacks several MT5 rate arrays into (n_series x n_bars) high/low/close matrices
+    for IndicatorBatch(). Series are right-aligned so the last column is every
+    series' current (still-forming) candle; shorter series are NaN-padded on the left.
+
+    Args:
+        rates_list (list): Structured arrays from mt5.copy_rates_from_pos, oldest candle first.
+        n_bars (int, optional): Number of columns. Defaults to the longest series.
+
+    Returns:
+        tuple: (high, low, close) float64 arrays of shape (n_series, n_bars).
+    '''
+    if n_bars is None:
+        n_bars = max((len(rates) for rates in rates_list), default=0)
+
+    high = np.full((len(rates_list), n_bars), np.nan)
+    low = np.full((len(rates_list), n_bars), np.nan)
+    close = np.full((len(rates_list), n_bars), np.nan)
+    for s, rates in enumerate(rates_list):
+        rates = rates[-n_bars:] if n_bars > 0 else rates[:0]
+        if len(rates) == 0:
+            continue
+        high[s, -len(rates):] = rates['high']
+        low[s, -len(rates):] = rates['low']
+        close[s, -len(rates):] = rates['close']
+    return high, low, close
+
+
+def IndicatorBatch(high: np.ndarray, low: np.ndarray, close: np.ndarray):
+    '''
+    Runs the Indicator() logic for many series at once. The recurrence steps through
+    time once and every step is vectorized across all series, so a candle boundary
+    where most of the symbols table fires costs one pass instead of one Python loop
+    per series.
+
+    Args:
+        high, low, close (np.ndarray): (n_series x n_bars) matrices as built by
+                                       StackRates(), right-aligned and NaN-padded on the left.
+
+    Returns:
+        np.ndarray: (n_series x 3) array with (maximum, minimum, average) for each
+                    series' second to last candle, bit-identical to Indicator().
+                    Rows without enough data are NaN.
+    '''
+    atr_period = 18
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    n_series, n_bars = close.shape
+
+    result = np.full((n_series, 3), np.nan)
+    if n_series == 0 or n_bars < atr_period + 2:
+        return result
+
+    # Column where each series' data starts (series are right-aligned)
+    lengths = (~np.isnan(close)).sum(axis=1)
+    start = n_bars - lengths
+
+    # ATR per series via TA-Lib, so the smoothing matches Indicator() exactly
+    atr = np.full((n_series, n_bars), np.nan)
+    for s in range(n_series):
+        if lengths[s] >= atr_period + 2:
+            atr[s, start[s]:] = ATR(high=high[s, start[s]:], low=low[s, start[s]:],
+                                    close=close[s, start[s]:], timeperiod=atr_period)
+
+    # Everything that does not depend on the previous candle is computed for all
+    # candles up front; rows are candles so each step reads contiguous vectors.
+    atr_multiplier = atr * 5
+    up = ((high + low) / 2 + atr_multiplier).T.copy()
+    dn = ((high + low) / 2 - atr_multiplier).T.copy()
+    close_t = close.T.copy()
+
+    # Column of each series' first valid ATR, where Indicator() starts its recurrence
+    first_col = start + atr_period
+
+    # Recurrence state for every series. Series whose ATR is not valid yet carry
+    # meaningless values, which are reset to nz()'s defaults at their first valid candle.
+    upper = np.zeros(n_series)
+    lower = np.zeros(n_series)
+    os = np.zeros(n_series)
+    maximum = np.full(n_series, np.nan)
+    minimum = np.full(n_series, np.nan)
+
+    for i in range(int(first_col.min()), n_bars - 1):
+        src = close_t[i]
+        prev_close = close_t[i - 1]
+
+        starting = first_col == i
+        if starting.any():
+            upper[starting] = 0.0
+            lower[starting] = 0.0
+            os[starting] = 0.0
+            maximum[starting] = src[starting]
+            minimum[starting] = src[starting]
+
+        upper = np.where(prev_close < upper, np.minimum(up[i], upper), up[i])
+        lower = np.where(prev_close > lower, np.maximum(dn[i], lower), dn[i])
+
+        os = np.where(src > upper, 1.0, np.where(src < lower, 0.0, os))
+        overbought = os == 1.0
+        spt = np.where(overbought, lower, upper)
+
+        crossing = ((prev_close < spt) & (src >= spt)) | ((prev_close > spt) & (src <= spt))
+        maximum, minimum = (
+            np.where(crossing, np.maximum(maximum, src),
+                     np.where(overbought, np.maximum(src, maximum), np.minimum(spt, maximum))),
+            np.where(crossing, np.minimum(minimum, src),
+                     np.where(overbought, np.maximum(spt, minimum), np.minimum(src, minimum))),
+        )
+
+    valid = lengths >= atr_period + 2
+    result[valid, 0] = maximum[valid]
+    result[valid, 1] = minimum[valid]
+    result[valid, 2] = ((maximum + minimum) / 2)[valid]
+    return result
+
+
+def IndicatorSeries(high, low, close, atr_period: int = 18, atr_multiplier: float = 5):
+    '''
+    Runs the Indicator() recurrence over a whole history and returns its values for
+    every candle, e.g. for backtesting. Element i is what Indicator() returns when
+    candle i is the last closed candle and the history starts at the first candle.
+    The loop is written out with local variables because it runs over years of candles.
+
+    Args:
+        high, low, close (array-like): Candle prices, oldest first.
+        atr_period (int): ATR period (Indicator() uses 18).
+        atr_multiplier (float): ATR multiplier of the upper/lower bands (Indicator() uses 5).
+
+    Returns:
+        tuple: (maximum, minimum, average) float64 arrays, NaN during the ATR warm-up.
+    '''
+    high = np.ascontiguousarray(high, dtype=np.float64)
+    low = np.ascontiguousarray(low, dtype=np.float64)
+    close = np.ascontiguousarray(close, dtype=np.float64)
+
+    n = len(close)
+    maximum = np.full(n, np.nan)
+    minimum = np.full(n, np.nan)
+    average = np.full(n, np.nan)
+    if n < atr_period + 1:
+        return maximum, minimum, average
+
+    atr = ATR(high=high, low=low, close=close, timeperiod=atr_period).tolist()
+    highs, lows, closes = high.tolist(), low.tolist(), close.tolist()
+    max_out, min_out = [np.nan] * n, [np.nan] * n
+
+    # Same recurrence as IndicatorState._advance(), starting from nz()'s defaults
+    upper, lower, os = 0.0, 0.0, 0
+    max_val = min_val = closes[atr_period]
+    prev_close = closes[atr_period - 1]
+    for i in range(atr_period, n):
+        src = closes[i]
+        band = atr[i] * atr_multiplier
+        up = (highs[i] + lows[i]) / 2 + band
+        dn = (highs[i] + lows[i]) / 2 - band
+
+        # min()/max() written as conditionals (same tie behaviour) to save calls in this hot loop
+        upper = (upper if upper < up else up) if prev_close < upper else up
+        lower = (lower if lower > dn else dn) if prev_close > lower else dn
+        if src > upper:
+            os = 1
+        elif src < lower:
+            os = 0
+        spt = lower if os == 1 else upper
+
+        if (prev_close < spt and src >= spt) or (prev_close > spt and src <= spt):
+            max_val = src if src > max_val else max_val
+            min_val = src if src < min_val else min_val
+        elif os == 0:
+            max_val = max_val if max_val < spt else spt
+            min_val = min_val if min_val < src else src
+        else:
+            max_val = max_val if max_val > src else src
+            min_val = min_val if min_val > spt else spt
+
+        max_out[i] = max_val
+        min_out[i] = min_val
+        prev_close = src
+
+    maximum[:] = max_out
+    minimum[:] = min_out
+    average[:] = (maximum + minimum) / 2
+    return maximum, minimum, average
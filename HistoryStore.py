@@ -0,0 +1,211 @@
+import os
+import numpy as np
+
+# One append-only file per column. Times are candle open times in epoch seconds, like MT5.
+COLUMNS = {
+    'time': np.dtype('<i8'),
+    'open': np.dtype('<f8'),
+    'high': np.dtype('<f8'),
+    'low': np.dtype('<f8'),
+    'close': np.dtype('<f8'),
+    'tick_volume': np.dtype('<u8'),
+    'spread': np.dtype('<i4'),
+}
+
+INDEX_STRIDE = 4096 # Candles per entry of the in-memory sparse time index
+
+
+class HistoryView:
+    '''
+    Read-only, zero-copy view on a range of stored candles. Fields are read like a
+    rates structured array (view['close'], len(view)), but every field is a slice of a
+    np.memmap, so nothing is read from disk until it is used.
+    '''
+
+    def __init__(self, columns: dict):
+        self._columns = columns
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._columns[key]
+        return HistoryView({name: column[key] for name, column in self._columns.items()})
+
+    def __len__(self):
+        return len(self._columns['time'])
+
+    @property
+    def dtype(self):
+        return np.dtype([(name, column.dtype) for name, column in self._columns.items()])
+
+    def rates(self):
+        '''Copies the candles into a structured array with the mt5.copy_rates_* field names.'''
+        rates = np.zeros(len(self), dtype=self.dtype)
+        for name, column in self._columns.items():
+            rates[name] = column
+        return rates
+
+
+class SeriesFile:
+    '''
+    Candle history of one (symbol, timeframe) series, stored as one raw column file per
+    field in `path`. Columns are only ever appended to; compact() rewrites them.
+
+    The number of stored candles is the length of the shortest column, so a write that
+    was interrupted half-way is ignored on the next open and cut off by the next append.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._view = None
+        self._index = None
+        self._refresh()
+
+    def _column_path(self, name: str):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _refresh(self):
+        '''Re-maps the column files after they changed.'''
+        sizes = []
+        for name, dtype in COLUMNS.items():
+            column_path = self._column_path(name)
+            sizes.append(os.path.getsize(column_path) // dtype.itemsize if os.path.exists(column_path) else 0)
+        self.length = min(sizes)
+
+        columns = {}
+        for name, dtype in COLUMNS.items():
+            if self.length:
+                columns[name] = np.memmap(self._column_path(name), dtype=dtype, mode='r', shape=(self.length,))
+            else:
+                columns[name] = np.zeros(0, dtype=dtype)
+        self._view = HistoryView(columns)
+
+        # Every INDEX_STRIDE-th time stays in memory, so a lookup only touches one block of the file
+        self._index = np.array(columns['time'][::INDEX_STRIDE])
+
+    def last_time(self):
+        '''Open time of the newest stored candle, or None if the series is empty.'''
+        return int(self._view['time'][-1]) if self.length else None
+
+    def _position(self, timestamp: int, side: str):
+        '''np.searchsorted on the time column, narrowed down with the sparse index first.'''
+        if not self.length:
+            return 0
+        block = max(int(np.searchsorted(self._index, timestamp, side=side)) - 1, 0)
+        start = block * INDEX_STRIDE
+        stop = min(start + 2 * INDEX_STRIDE, self.length)
+        return start + int(np.searchsorted(self._view['time'][start:stop], timestamp, side=side))
+
+    def read(self, start: int = None, end: int = None, count: int = None):
+        '''
+        Returns the stored candles with start <= time < end as a HistoryView (all of them
+        by default). With `count`, only the newest `count` candles of that range are returned.
+        '''
+        first = 0 if start is None else self._position(start, 'left')
+        last = self.length if end is None else self._position(end, 'left')
+        if count is not None:
+            first = max(first, last - count)
+        return self._view[first:last]
+
+    def append(self, rates):
+        '''
+        Appends the candles of an mt5.copy_rates_* array that are newer than the last
+        stored candle. Older candles are skipped. Pass only closed candles.
+
+        Returns:
+            int: The number of candles written.
+        '''
+        if rates is None or len(rates) == 0:
+            return 0
+        last_time = self.last_time()
+        if last_time is not None:
+            rates = rates[rates['time'] > last_time]
+        if len(rates) == 0:
+            return 0
+
+        # Time is written last: until it is complete, the shorter time column hides the new candles
+        for name in list(COLUMNS)[1:] + ['time']:
+            column_path = self._column_path(name)
+            size = self.length * COLUMNS[name].itemsize
+            with open(column_path, 'r+b' if os.path.exists(column_path) else 'wb') as f:
+                if os.path.getsize(column_path) != size:
+                    f.truncate(size) # Drop a half-written tail
+                f.seek(size)
+                f.write(np.ascontiguousarray(rates[name], dtype=COLUMNS[name]).tobytes())
+        self._refresh()
+        return len(rates)
+
+    def compact(self, keep: int = None):
+        '''
+        Rewrites the column files, dropping unusable tails and, with `keep`, every candle
+        but the newest `keep`. Does nothing if there is nothing to drop. Views returned by
+        read() must no longer be in use (Windows cannot replace a mapped file).
+
+        The new columns are written to temporary files first. The time column is emptied
+        before the other columns are replaced and replaced last, so a crash part-way leaves
+        an empty series (fetched again from the broker) rather than misaligned columns.
+
+        Returns:
+            bool: True if the files were rewritten.
+        '''
+        sizes = [os.path.getsize(self._column_path(name)) if os.path.exists(self._column_path(name)) else 0
+                 for name in COLUMNS]
+        if (keep is None or self.length <= keep) and \
+           all(size == self.length * dtype.itemsize for size, dtype in zip(sizes, COLUMNS.values())):
+            return False
+
+        view = self.read(count=keep)
+        columns = {name: np.array(view[name]) for name in COLUMNS}
+        del view
+        self._view = None # Release the maps before the files are replaced
+        for name, values in columns.items():
+            values.tofile(self._column_path(name) + '.tmp')
+        with open(self._column_path('time'), 'wb'): # Hides the series until every column is replaced
+            pass
+        for name in list(COLUMNS)[1:] + ['time']:
+            os.replace(self._column_path(name) + '.tmp', self._column_path(name))
+        self._refresh()
+        return True
+
+
+class HistoryStore:
+    '''
+    On-disk candle store with one SeriesFile directory per (symbol, timeframe) below
+    `root` (`<root>/<symbol>_<timeframe>/`).
+    '''
+
+    def __init__(self, root: str = 'history'):
+        self.root = root
+        self._series = {}
+
+    def series(self, symbol: str, timeframe: str):
+        '''Returns the SeriesFile of a series, creating its directory on first use.'''
+        key = (symbol, timeframe)
+        if key not in self._series:
+            self._series[key] = SeriesFile(os.path.join(self.root, f"{symbol}_{timeframe}"))
+        return self._series[key]
+
+    def keys(self):
+        '''(symbol, timeframe) pairs that have a directory in the store.'''
+        if not os.path.isdir(self.root):
+            return []
+        return [tuple(name.rsplit('_', 1)) for name in sorted(os.listdir(self.root))
+                if '_' in name and os.path.isdir(os.path.join(self.root, name))]
+
+    def histories(self):
+        '''
+        Returns:
+            dict: (symbol, timeframe) -> HistoryView of every non-empty stored series,
+                  usable wherever Backtest and Optimizer take rates arrays.
+        '''
+        views = {key: self.series(*key).read() for key in self.keys()}
+        return {key: view for key, view in views.items() if len(view)}
+
+    def compact(self, keep: int = None):
+        '''
+        Compacts every stored series (see SeriesFile.compact()).
+
+        Returns:
+            int: The number of series that were rewritten.
+        '''
+        return sum(self.series(*key).compact(keep) for key in self.keys())
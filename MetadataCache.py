@@ -0,0 +1,100 @@
+from Broker import mt5
+from time import monotonic
+
+
+class MetadataCache:
+    '''
+    Caches broker metadata that the order-building path needs on every signal, so a
+    signal only costs one live mt5.symbol_info_tick call.
+
+    - mt5.symbol_info results (digits, point, trade_contract_size, volume_step, ...)
+      are kept per symbol for `symbol_ttl` seconds.
+    - The account balance from mt5.account_info is kept for `account_ttl` seconds.
+
+    Failed lookups are never cached. Entries can be dropped explicitly with
+    invalidate() / invalidate_account(), e.g. after a reconnect.
+    '''
+
+    def __init__(self, symbol_ttl: float = 3600.0, account_ttl: float = 5.0, clock=monotonic):
+        self.symbol_ttl = symbol_ttl
+        self.account_ttl = account_ttl
+        self.clock = clock
+        self._symbols = {}    # symbol -> (expires_at, mt5 SymbolInfo)
+        self._balance = None  # (expires_at, balance)
+
+    def symbol_info(self, symbol: str):
+        '''Returns the (possibly cached) mt5.symbol_info for `symbol`, or None if unavailable.'''
+        now = self.clock()
+        entry = self._symbols.get(symbol)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        info = mt5.symbol_info(symbol)
+        if info is not None:
+            self._symbols[symbol] = (now + self.symbol_ttl, info)
+        else:
+            self._symbols.pop(symbol, None)
+        return info
+
+    def digits(self, symbol: str):
+        '''
+        Returns the number of decimal places of `symbol`, falling back to 5 (3 for JPY pairs)
+        if the broker does not return symbol info.
+        '''
+        info = self.symbol_info(symbol)
+        if info is not None:
+            return info.digits
+        return 5 if 'JPY' not in symbol else 3
+
+    def point(self, symbol: str):
+        info = self.symbol_info(symbol)
+        return info.point if info is not None else None
+
+    def contract_size(self, symbol: str):
+        info = self.symbol_info(symbol)
+        return info.trade_contract_size if info is not None else None
+
+    def volume_step(self, symbol: str):
+        info = self.symbol_info(symbol)
+        return info.volume_step if info is not None else None
+
+    def balance(self):
+        '''Returns the (possibly cached) account balance, or 0.0 if account info is unavailable.'''
+        now = self.clock()
+        if self._balance is not None and self._balance[0] > now:
+            return self._balance[1]
+
+        account_info = mt5.account_info()
+        if account_info is None:
+            print("Could not retrieve MT5 account info. Using default balance 0.0.")
+            self._balance = None
+            return 0.0
+
+        balance = account_info.balance
+        self._balance = (now + self.account_ttl, balance)
+        return balance
+
+    def prewarm(self, symbols):
+        '''
+        Loads symbol info for every symbol (and the account balance) up front.
+
+        Returns:
+            list: Symbols whose info could not be loaded.
+        '''
+        missing = [symbol for symbol in symbols if self.symbol_info(symbol) is None]
+        self.balance()
+        return missing
+
+    def invalidate(self, symbol: str = None):
+        '''Drops the cached info for `symbol`, or for every symbol if None.'''
+        if symbol is None:
+            self._symbols.clear()
+        else:
+            self._symbols.pop(symbol, None)
+
+    def invalidate_account(self):
+        self._balance = None
+
+
+# Shared instance used by the order-building path
+metadata_cache = MetadataCache()
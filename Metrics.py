@@ -0,0 +1,235 @@
+import bisect
+import threading
+from time import perf_counter, sleep
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in seconds, from sub-millisecond stages to late signals
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+METRIC_PREFIX = 'trading_'
+
+
+class Histogram:
+    '''Fixed-bucket histogram in the Prometheus layout (cumulative buckets, sum, count).'''
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float):
+        '''Upper bound of the bucket holding the q-quantile (the maximum for the +Inf bucket).'''
+        if self.count == 0:
+            return float('nan')
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class _Timer:
+    '''Context manager returned by Metrics.time() that records the elapsed time on exit.'''
+
+    __slots__ = ('metrics', 'name', 'labels', 'started')
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics._observe(self.name, self.labels, perf_counter() - self.started)
+        return False
+
+
+class _NullTimer:
+    '''Shared no-op context manager used while metrics are disabled.'''
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    '''
+    Counters and latency histograms for the trading loop.
+
+    Stages are timed with `with metrics.time('stage_name'):` and events counted with
+    metrics.inc(). Metrics are labelled with keyword arguments (e.g. symbol='EURUSD-VIP').
+    While `enabled` is False every call returns immediately, so the instrumentation can
+    stay in the hot path.
+
+    Everything can be read as Prometheus text (render(), serve()) or as a short
+    human-readable summary (summary(), start_summaries()).
+    '''
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {}   # (name, labels) -> value
+        self._histograms = {} # (name, labels) -> Histogram
+        self._server = None
+
+    # --- Recording --------------------------------------------------------------------
+
+    def time(self, stage: str, **labels):
+        '''Context manager that adds the duration of the block to the `stage` histogram.'''
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, 'stage_seconds', (('stage', stage),) + tuple(sorted(labels.items())))
+
+    def observe(self, name: str, seconds: float, **labels):
+        '''Adds one observation (in seconds) to histogram `name`.'''
+        if self.enabled:
+            self._observe(name, tuple(sorted(labels.items())), seconds)
+
+    def _observe(self, name: str, labels: tuple, seconds: float):
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        '''Increments counter `name` (exported as `<name>_total`).'''
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def combined(self, name: str, **labels):
+        '''Returns one Histogram merging every histogram `name` whose labels include `labels`.'''
+        wanted = set(labels.items())
+        merged = Histogram()
+        with self._lock:
+            for (metric, metric_labels), histogram in self._histograms.items():
+                if metric != name or not wanted <= set(metric_labels):
+                    continue
+                merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                merged.sum += histogram.sum
+                merged.count += histogram.count
+                merged.max = max(merged.max, histogram.max)
+        return merged
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    # --- Export -----------------------------------------------------------------------
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        pairs = tuple(labels) + tuple(extra)
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+    def render(self):
+        '''Returns all metrics in the Prometheus text exposition format.'''
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            histograms = [(key, (h.buckets, list(h.counts), h.sum, h.count)) for key, h in histograms]
+
+        lines = []
+        declared = set()
+        for (name, labels), value in counters:
+            metric = f"{METRIC_PREFIX}{name}_total"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            lines.append(f"{metric}{self._format_labels(labels)} {value}")
+
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            metric = f"{METRIC_PREFIX}{name}"
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} histogram")
+                declared.add(metric)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{metric}_bucket{self._format_labels(labels, (('le', repr(float(bound))),))} {cumulative}")
+            lines.append(f"{metric}_bucket{self._format_labels(labels, (('le', '+Inf'),))} {count}")
+            lines.append(f"{metric}_sum{self._format_labels(labels)} {total}")
+            lines.append(f"{metric}_count{self._format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        '''Returns one line per histogram (count, mean, p50, p95, max in ms) and per counter.'''
+        with self._lock:
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            counters = sorted(self._counters.items())
+            lines = ['--- Metrics summary ---']
+            for (name, labels), h in histograms:
+                label_text = ','.join(f"{key}={value}" for key, value in labels)
+                lines.append(f"{name}[{label_text}] n={h.count} mean={h.sum / h.count * 1e3:.1f}ms "
+                             f"p50<={h.quantile(0.5) * 1e3:.1f}ms p95<={h.quantile(0.95) * 1e3:.1f}ms max={h.max * 1e3:.1f}ms")
+        for (name, labels), value in counters:
+            label_text = ','.join(f"{key}={value}" for key, value in labels)
+            lines.append(f"{name}[{label_text}] {value}")
+        return '\n'.join(lines)
+
+    def serve(self, port: int = 9108, host: str = '127.0.0.1'):
+        '''
+        Serves render() at http://<host>:<port>/metrics from a daemon thread.
+        Binds to localhost by default; returns the server.
+        '''
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args): # Keep scrapes out of the console
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        return self._server
+
+    def start_summaries(self, interval: float = 900.0, output=print):
+        '''Calls output(summary()) every `interval` seconds from a daemon thread.'''
+        def run():
+            while True:
+                sleep(interval)
+                output(self.summary())
+        thread = threading.Thread(target=run, name='metrics-summary', daemon=True)
+        thread.start()
+        return thread
+
+
+# Shared instance used by the trading loop, BarCache, OrderProcessing and TelegramDispatcher
+metrics = Metrics()
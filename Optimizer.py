@@ -0,0 +1,241 @@
+import sys
+import argparse
+import itertools
+import multiprocessing
+import numpy as np
+from multiprocessing import shared_memory
+
+from Backtest import LoadHistories, ResolveTrades, Signals
+
+# Only the fields the backtest reads are shared with the workers
+OHLC_DTYPE = np.dtype([('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8')])
+
+# Default search space around the live constants (atr_period 18, multiplier 5, RRR 1.2)
+DEFAULT_GRID = {
+    'atr_period': [10, 14, 18, 22, 26],
+    'atr_multiplier': [3, 4, 5, 6, 7],
+    'rrr': [0.8, 1.0, 1.2, 1.5, 2.0],
+}
+
+
+class SharedHistories:
+    '''
+    Copies every series' candles once into a single shared-memory block. Worker
+    processes attach to the block by name and read the candles as NumPy views, so no
+    task ever pickles or copies price history.
+
+    Args:
+        histories (dict): (symbol, timeframe) -> rates structured array.
+    '''
+
+    def __init__(self, histories: dict):
+        self.layout = {}
+        offset = 0
+        for key, rates in histories.items():
+            self.layout[key] = (offset, len(rates))
+            offset += len(rates)
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, offset * OHLC_DTYPE.itemsize))
+        block = np.ndarray(offset, dtype=OHLC_DTYPE, buffer=self._shm.buf)
+        for key, rates in histories.items():
+            start, length = self.layout[key]
+            for field in OHLC_DTYPE.names:
+                block[field][start:start + length] = rates[field]
+        del block # Views must be released before the block can be closed
+
+    def spec(self):
+        '''Picklable description that attach() turns back into views in another process.'''
+        return self._shm.name, self.layout
+
+    @staticmethod
+    def attach(spec):
+        '''
+        Returns (shared memory handle, {key: rates view}) for a spec() from another process.
+        Keep the handle alive for as long as the views are used.
+        '''
+        name, layout = spec
+        shm = shared_memory.SharedMemory(name=name)
+        block = np.ndarray(sum(length for _, length in layout.values()), dtype=OHLC_DTYPE, buffer=shm.buf)
+        return shm, {key: block[start:start + length] for key, (start, length) in layout.items()}
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+
+# Set in every worker by _init_worker()
+_worker_shm = None
+_worker_histories = None
+
+def _init_worker(spec):
+    global _worker_shm, _worker_histories
+    _worker_shm, _worker_histories = SharedHistories.attach(spec)
+
+
+def _segment_bounds(length: int, n_splits: int):
+    '''Candle index boundaries of the n_splits + 1 consecutive walk-forward segments.'''
+    return np.linspace(0, length, n_splits + 2).astype(np.int64)
+
+
+def _evaluate(task):
+    '''
+    Backtests one series with one (atr_period, atr_multiplier) pair for every RRR value.
+    The indicator and the signals only depend on the first two, so Signals() runs once
+    per task and only the fills are resolved again for each RRR.
+
+    Returns:
+        list: ((atr_period, atr_multiplier, rrr), per-segment [trades, wins, sum_r, gain_r, loss_r]).
+    '''
+    key, atr_period, atr_multiplier, rrrs, n_splits = task
+    rates = _worker_histories[key]
+    bounds = _segment_bounds(len(rates), n_splits)
+    side, _, _, average = Signals(rates, atr_period=atr_period, atr_multiplier=atr_multiplier)
+
+    results = []
+    for rrr in rrrs:
+        trades = ResolveTrades(rates, side, average, rrr=rrr)
+        r_multiple = trades['pnl'] / np.where(trades['risk'] > 0, trades['risk'], np.nan)
+        r_multiple = np.nan_to_num(r_multiple)
+        segment = np.searchsorted(bounds, trades['entry_index'], side='right') - 1
+
+        totals = np.zeros((n_splits + 1, 5))
+        for s in range(n_splits + 1):
+            r = r_multiple[segment == s]
+            totals[s] = (len(r), (r > 0).sum(), r.sum(), r[r > 0].sum(), -r[r < 0].sum())
+        results.append(((atr_period, atr_multiplier, rrr), totals))
+    return results
+
+
+def _metrics(totals: np.ndarray):
+    trades, wins, sum_r, gain_r, loss_r = totals
+    return {
+        'trades': int(trades),
+        'win_rate': wins / trades if trades else np.nan,
+        'total_r': sum_r,
+        'avg_r': sum_r / trades if trades else np.nan,
+        'profit_factor': gain_r / loss_r if loss_r > 0 else np.inf if trades else np.nan,
+    }
+
+
+def Optimize(histories: dict, grid: dict = None, random_samples: int = None, n_splits: int = 0,
+             processes: int = None, objective: str = 'avg_r', seed: int = 0):
+    '''
+    Grid or random search over atr_period, atr_multiplier and the get_sl() RRR.
+
+    The histories are loaded once into shared memory and (series x indicator parameters)
+    tasks are spread over a process pool. With n_splits > 0 every history is cut into
+    n_splits + 1 consecutive segments. The ranking only sees segments 0..n_splits-1
+    (in-sample); the last segment is held out and only reported. WalkForward() picks
+    the best parameters per fold and reports them on the segment that follows.
+
+    Args:
+        histories (dict): (symbol, timeframe) -> rates structured array.
+        grid (dict, optional): Parameter name -> list of values. Defaults to DEFAULT_GRID.
+        random_samples (int, optional): Evaluate this many random combinations of the grid
+                                        values instead of the full grid.
+        n_splits (int): Number of walk-forward folds (0 evaluates the whole history once).
+        processes (int, optional): Pool size. Defaults to the number of CPUs.
+        objective (str): Metric used for ranking ('avg_r', 'total_r', 'win_rate', 'profit_factor').
+        seed (int): Seed for random search.
+
+    Returns:
+        tuple: (ranked results, per-segment totals). Each result is a dict with the
+               parameters, in-sample ('is_*') and held-out last segment ('oos_*') metrics,
+               ranked by the in-sample objective. With n_splits 0 the whole history is
+               in-sample and the 'oos_*' metrics are empty.
+    '''
+    grid = grid or DEFAULT_GRID
+    combos = list(itertools.product(grid['atr_period'], grid['atr_multiplier'], grid['rrr']))
+    if random_samples is not None and random_samples < len(combos):
+        rng = np.random.default_rng(seed)
+        combos = [combos[i] for i in sorted(rng.choice(len(combos), random_samples, replace=False))]
+
+    # Group RRR values by indicator parameters so each task computes the indicator once
+    rrrs_by_indicator = {}
+    for atr_period, atr_multiplier, rrr in combos:
+        rrrs_by_indicator.setdefault((atr_period, atr_multiplier), []).append(rrr)
+    tasks = [(key, atr_period, atr_multiplier, rrrs, n_splits)
+             for key in histories for (atr_period, atr_multiplier), rrrs in rrrs_by_indicator.items()]
+
+    shared = SharedHistories(histories)
+    try:
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(shared.spec(),)) as pool:
+            segment_totals = {}
+            for task_results in pool.imap_unordered(_evaluate, tasks, chunksize=max(1, len(tasks) // (8 * (processes or multiprocessing.cpu_count())))):
+                for params, totals in task_results:
+                    if params in segment_totals:
+                        segment_totals[params] += totals
+                    else:
+                        segment_totals[params] = totals.copy()
+    finally:
+        shared.close()
+
+    results = []
+    for (atr_period, atr_multiplier, rrr), totals in segment_totals.items():
+        in_sample = totals[:-1].sum(axis=0) if n_splits else totals[0]
+        out_of_sample = totals[-1] if n_splits else np.zeros(5)
+        row = {'atr_period': atr_period, 'atr_multiplier': atr_multiplier, 'rrr': rrr}
+        row.update({f'is_{name}': value for name, value in _metrics(in_sample).items()})
+        row.update({f'oos_{name}': value for name, value in _metrics(out_of_sample).items()})
+        results.append(row)
+
+    # Ranking on the held-out segment would select parameters on the data that tests them
+    rank_key = f'is_{objective}'
+    results.sort(key=lambda row: -np.inf if np.isnan(row[rank_key]) else row[rank_key], reverse=True)
+    return results, segment_totals
+
+
+def WalkForward(segment_totals: dict, n_splits: int, objective: str = 'avg_r'):
+    '''
+    For every fold, picks the parameters with the best objective on segment i and reports
+    how they did on the following segment i + 1.
+
+    Returns:
+        list: One dict per fold with the chosen parameters, train and test metrics.
+    '''
+    folds = []
+    for fold in range(n_splits):
+        def train_score(params):
+            value = _metrics(segment_totals[params][fold])[objective]
+            return -np.inf if np.isnan(value) else value
+        best = max(segment_totals, key=train_score)
+        folds.append({
+            'fold': fold,
+            'atr_period': best[0], 'atr_multiplier': best[1], 'rrr': best[2],
+            'train': _metrics(segment_totals[best][fold]),
+            'test': _metrics(segment_totals[best][fold + 1]),
+        })
+    return folds
+
+
+def FormatResults(results: list, top: int = 20):
+    '''Renders the ranked Optimize() results as a text table.'''
+    lines = [f"{'#':>3}{'ATR':>5}{'Mult':>6}{'RRR':>6}{'Trades':>8}{'IS AvgR':>9}{'IS PF':>7}{'OOS Trades':>11}{'OOS AvgR':>10}{'OOS PF':>8}"]
+    for rank, row in enumerate(results[:top], start=1):
+        lines.append(f"{rank:>3}{row['atr_period']:>5}{row['atr_multiplier']:>6}{row['rrr']:>6}"
+                     f"{row['is_trades']:>8}{row['is_avg_r']:>9.3f}{row['is_profit_factor']:>7.2f}"
+                     f"{row['oos_trades']:>11}{row['oos_avg_r']:>10.3f}{row['oos_profit_factor']:>8.2f}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parameter sweep for the Indicator strategy.')
+    parser.add_argument('data_dir', help='Directory with <symbol>_<timeframe>.npy rates files')
+    parser.add_argument('--random', type=int, default=None, help='Random search with this many combinations')
+    parser.add_argument('--splits', type=int, default=0, help='Number of walk-forward folds')
+    parser.add_argument('--processes', type=int, default=None, help='Worker processes (default: all CPUs)')
+    parser.add_argument('--objective', default='avg_r', choices=['avg_r', 'total_r', 'win_rate', 'profit_factor'])
+    parser.add_argument('--top', type=int, default=20, help='Rows to print')
+    args = parser.parse_args()
+
+    histories = LoadHistories(args.data_dir)
+    if not histories:
+        print(f"No rates files found in {args.data_dir}.")
+        sys.exit(1)
+
+    results, segment_totals = Optimize(histories, random_samples=args.random, n_splits=args.splits,
+                                       processes=args.processes, objective=args.objective)
+    print(FormatResults(results, args.top))
+    for fold in WalkForward(segment_totals, args.splits, args.objective):
+        print(f"Fold {fold['fold']}: ATR {fold['atr_period']} x{fold['atr_multiplier']} RRR {fold['rrr']} "
+              f"train avg R {fold['train']['avg_r']:.3f}, test avg R {fold['test']['avg_r']:.3f}")
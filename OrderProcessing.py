@@ -1,6 +1,14 @@
+import atexit
+import threading
 import numpy as np
-import MetaTrader5 as mt5
-import requests # Added for Telegram API calls
+from Broker import mt5
+
+from Metrics import metrics
+from Profiler import profiler
+from MetadataCache import metadata_cache
+from SignalDigest import SignalDigest
+from TelegramDispatcher import TelegramDispatcher, chain_callbacks
+from TimeProcessing import TIMEFRAME_SECONDS, clock
 
 # --- Telegram Bot Configuration ---
 # IMPORTANT: Replace with your actual Telegram Bot Token and Chat ID
@@ -10,68 +18,258 @@ import requests # Added for Telegram API calls
 # Look for 'chat' -> 'id' in the JSON response.
 TELEGRAM_BOT_TOKEN = '8075859191:AAFI4-6kBSF9tKbPWd6XgqS-xXHjU0AgAgM'
 TELEGRAM_CHAT_ID = '-1002731577965'
+TELEGRAM_API_URL = 'https://api.telegram.org' # Can be pointed at a local HTTP stand-in for testing
 # ----------------------------------
 
-def send_telegram_message(message: str):
+# Signals produced within SIGNAL_DIGEST_WINDOW seconds of each other (e.g. every timeframe at
+# 00:00 UTC) are sent as one digest, longest timeframe first. 0 sends every signal on its own.
+# A boundary that produced a single signal sends it at once (see flush_lone_signal()).
+SIGNAL_DIGEST_WINDOW = 2.0
+
+def configure_telegram(bot_token: str = None, chat_id: str = None, api_url: str = None):
+    '''Overrides the Telegram settings above (e.g. from the daemon config). Call before the first signal.'''
+    global TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, TELEGRAM_API_URL
+    TELEGRAM_BOT_TOKEN = bot_token or TELEGRAM_BOT_TOKEN
+    TELEGRAM_CHAT_ID = chat_id or TELEGRAM_CHAT_ID
+    TELEGRAM_API_URL = api_url or TELEGRAM_API_URL
+
+def configure_signals(digest_window: float = None):
+    '''Overrides the signal settings above (e.g. from the daemon config). Call before the first signal.'''
+    global SIGNAL_DIGEST_WINDOW
+    if digest_window is not None:
+        SIGNAL_DIGEST_WINDOW = digest_window
+
+# Messages are sent by a background worker so signal evaluation never waits on Telegram
+_telegram_dispatcher = None
+_telegram_dispatcher_lock = threading.Lock()
+
+def get_telegram_dispatcher():
+    '''
+    Returns the shared TelegramDispatcher, creating it on first use. Pending messages
+    are flushed when the program exits.
+    '''
+    global _telegram_dispatcher
+    with _telegram_dispatcher_lock: # Signals may be sent from several evaluation workers
+        if _telegram_dispatcher is None:
+            _telegram_dispatcher = TelegramDispatcher(TELEGRAM_BOT_TOKEN, api_url=TELEGRAM_API_URL)
+            atexit.register(_telegram_dispatcher.stop)
+    return _telegram_dispatcher
+
+def send_telegram_message(message: str, on_sent=None, on_failed=None):
     """
-    Sends a message to a Telegram chat using the Telegram Bot API.
+    Queues a message for the configured Telegram chat and returns immediately.
+    The message is sent by the background TelegramDispatcher.
 
     Args:
         message (str): The text message to send.
+        on_sent (callable): Optional callback run by the dispatcher once the message is delivered.
+        on_failed (callable): Optional callback run if the message is dropped or given up on.
     """
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
         print("Telegram bot token or chat ID is not configured. Cannot send message.")
         return
 
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    payload = {
-        "chat_id": TELEGRAM_CHAT_ID,
-        "text": message,
-        "parse_mode": "Markdown" # Use Markdown for formatting (e.g., bold text)
-    }
-    try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
-        print(f"Telegram message sent successfully. Response: {response.json()}")
-    except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP error sending Telegram message: {http_err} - {response.text}")
-    except Exception as err:
-        print(f"Other error sending Telegram message: {err}")
+    # Use Markdown for formatting (e.g., bold text)
+    get_telegram_dispatcher().submit(TELEGRAM_CHAT_ID, message, parse_mode="Markdown", on_sent=on_sent, on_failed=on_failed)
+
+
+# Collects the signals of a shared candle boundary
+_signal_digest = None
+
+def get_signal_digest():
+    '''Returns the shared SignalDigest, creating it on first use. It is flushed when the program exits.'''
+    global _signal_digest
+    get_telegram_dispatcher() # Created first, so the digest is flushed before the dispatcher stops at exit
+    with _telegram_dispatcher_lock:
+        if _signal_digest is None:
+            _signal_digest = SignalDigest(lambda message, on_sent, on_failed: send_telegram_message(message, on_sent=on_sent, on_failed=on_failed),
+                                          window=SIGNAL_DIGEST_WINDOW)
+            atexit.register(_signal_digest.flush)
+    return _signal_digest
+
+
+def flush_lone_signal():
+    '''
+    Sends the digest at once if it holds a single signal. Called once every series of a
+    boundary was processed: there is nothing left to group a lone signal with.
+    '''
+    digest = _signal_digest
+    if digest is not None and digest.pending() == 1:
+        digest.flush()
+
+
+# Signal message layouts. {symbol} and {digits} are filled in once per symbol by signal_template(),
+# the doubled-brace fields for every signal from its order request.
+SIGNAL_MESSAGE_LAYOUTS = {
+    'buy': (
+        "🟢 *Buy Signal Alert*\n"
+        "📊 *Symbol*: {symbol}\n"
+        "⏳ *Timeframe*: {{timeframe}}\n"
+        "📈 *Entry Price*: {{price:.{digits}f}}\n"
+        "🚫 *Stop Loss (SL)*: {{sl:.{digits}f}}\n"
+        "🎯 *Take Profit 1 (TP1)*: {{tp1:.{digits}f}}\n"
+        "🎯 *Take Profit 2 (TP2)*: {{tp2:.{digits}f}}\n"
+        "🎯 *Take Profit 3 (TP3)*: {{tp3:.{digits}f}}"
+    ),
+    'sell': (
+        "🔴 *Sell Signal Alert*\n"
+        "📊 *Symbol*: {symbol}\n"
+        "⏳ *Timeframe*: {{timeframe}}\n"
+        "📉 *Entry Price*: {{price:.{digits}f}}\n"
+        "🚫 *Stop Loss (SL)*: {{sl:.{digits}f}}\n"
+        "🎯 *Take Profit 1 (TP1)*: {{tp1:.{digits}f}}\n"
+        "🎯 *Take Profit 2 (TP2)*: {{tp2:.{digits}f}}\n"
+        "🎯 *Take Profit 3 (TP3)*: {{tp3:.{digits}f}}"
+    ),
+}
+# One-line form used inside a digest
+SIGNAL_LINE_LAYOUTS = {
+    'buy': "🟢 *BUY* {symbol} {{timeframe}} @ {{price:.{digits}f}} | SL {{sl:.{digits}f}} | "
+           "TP {{tp1:.{digits}f}} / {{tp2:.{digits}f}} / {{tp3:.{digits}f}}",
+    'sell': "🔴 *SELL* {symbol} {{timeframe}} @ {{price:.{digits}f}} | SL {{sl:.{digits}f}} | "
+            "TP {{tp1:.{digits}f}} / {{tp2:.{digits}f}} / {{tp3:.{digits}f}}",
+}
+_signal_templates = {} # (symbol, side, compact) -> template
+
+def signal_template(symbol: str, side: str, compact: bool = False):
+    '''
+    Returns the message template of `symbol` for side 'buy' or 'sell' (the one-line digest
+    form if `compact`), with the symbol and its price digits already filled in.
+    '''
+    key = (symbol, side, compact)
+    template = _signal_templates.get(key)
+    if template is None:
+        layout = (SIGNAL_LINE_LAYOUTS if compact else SIGNAL_MESSAGE_LAYOUTS)[side]
+        template = _signal_templates[key] = layout.format(symbol=symbol, digits=metadata_cache.digits(symbol))
+    return template
+
+
+def send_signal(symbol: str, side: str, timeframe: str, request: dict, on_sent=None, on_failed=None, critical: bool = False):
+    '''
+    Renders a signal from its order request and sends it: on its own if it is critical or the
+    digest is disabled, otherwise through the signal digest.
+    '''
+    message = signal_template(symbol, side).format(timeframe=timeframe, **request)
+    if critical or SIGNAL_DIGEST_WINDOW <= 0:
+        send_telegram_message(message, on_sent=on_sent, on_failed=on_failed)
+        return
+    line = signal_template(symbol, side, compact=True).format(timeframe=timeframe, **request)
+    get_signal_digest().add(message, line, priority=TIMEFRAME_SECONDS.get(timeframe, 0), on_sent=on_sent, on_failed=on_failed)
+
+
+def _signal_latency_recorder(symbol: str, timeframe: str, bar_close: float):
+    '''
+    Returns an on_sent callback that records the time from the close of the signal candle
+    (`bar_close`, UTC epoch seconds) until the Telegram message was delivered, or None if
+    metrics are disabled or the close time is unknown.
+    '''
+    if not metrics.enabled or bar_close is None:
+        return None
+    return lambda: metrics.observe('signal_latency_seconds', clock.time() - bar_close, symbol=symbol, timeframe=timeframe)
+
+
+# Lot tiers in hundredths of a lot: balances up to 500 trade 0.01, up to 1000 trade 0.04, and every
+# further 1000 of balance adds 0.05 (1001-2000: 0.08, 2001-3000: 0.13, ...). These are the values of
+# round(mean([lower, upper]) / 20000, 2) over the [1000k, 1000k + 1001) windows get_lot used to search.
+LOT_TIER_SMALL = 1   # int(balance) <= 500
+LOT_TIER_MEDIUM = 4  # 501 <= int(balance) <= 1000
+LOT_TIER_BASE = 3    # int(balance) >= 1001: LOT_TIER_BASE + LOT_TIER_STEP * tier
+LOT_TIER_STEP = 5
 
 
 def get_lot(balance):
     '''
     This function calculates the lot size for a given trade based on the current account balance.
-    It uses a tiered approach to determine lot size.
+    It uses a tiered approach to determine lot size (see get_lots() for the tiers).
     '''
-    minimum, maximum = 1000, 2001
-    
-    while True:
-        if 0 <= int(balance) <= 500:
-            return round((250 / 20000), 2) # Example fixed lot for very small balances
-        elif 501 <= int(balance) <= 1000:
-            return round((np.mean([500, 1000]) / 20000), 2)
-        elif minimum <= int(balance) < maximum:
-            return round((np.mean([minimum, maximum]) / 20000), 2)
-        else:
-            # If balance is outside the current [minimum, maximum] range, expand the range
-            minimum += 1000
-            maximum += 1000
-            continue # Continue loop with expanded range
-    
+    balance = int(balance)
+    if balance <= 500:
+        return LOT_TIER_SMALL / 100 # Example fixed lot for very small balances
+    if balance <= 1000:
+        return LOT_TIER_MEDIUM / 100
+    return (LOT_TIER_BASE + LOT_TIER_STEP * ((balance - 1001) // 1000 + 1)) / 100
+
+
+def get_lots(balances):
+    '''
+    Vectorized get_lot(): returns the lot size for every balance in `balances` as a float array.
+    Balances are truncated to whole units like int(); negative balances get the smallest lot.
+    '''
+    balances = np.trunc(np.asarray(balances, dtype=np.float64))
+    tiers = np.floor_divide(balances - 1001, 1000) + 1
+    hundredths = np.where(balances <= 500, LOT_TIER_SMALL,
+                          np.where(balances <= 1000, LOT_TIER_MEDIUM, LOT_TIER_BASE + LOT_TIER_STEP * tiers))
+    return hundredths / 100
+
+
+def lot_multiplier(order_type: int, entryp: float, extreme_val: float, avg_val: float):
+    '''
+    Returns 2 if the entry price is closer to the average line than to the band the signal
+    came from (`extreme_val`: the minimum for buys, the maximum for sells), 1 otherwise.
+    '''
+    midpoint = np.mean([extreme_val, avg_val])
+    if order_type == mt5.ORDER_TYPE_BUY:
+        return 2 if entryp >= midpoint else 1
+    return 2 if entryp <= midpoint else 1
+
+
+# One row per follower account in FanOut()
+ORDER_PAYLOAD_DTYPE = np.dtype([
+    ('account', '<i8'), ('volume', '<f8'), ('type', '<i4'),
+    ('price', '<f8'), ('sl', '<f8'), ('tp1', '<f8'), ('tp2', '<f8'), ('tp3', '<f8'),
+])
+
+
+def FanOut(request: dict, balances, accounts=None, multiplier: int = 1):
+    '''
+    Builds the order payloads of one signal for many follower accounts in a single pass.
+
+    Args:
+        request (dict): The signal's request from Buy_req() / Sell_req(). Its type, price,
+                        SL and TPs are shared by every account.
+        balances (array-like): Balance of every follower account.
+        accounts (array-like, optional): Account numbers, in the order of `balances`.
+                                         Defaults to 0, 1, 2, ...
+        multiplier (int): Lot multiplier of the signal (see lot_multiplier()).
 
-def get_sl(entry, tp):
+    Returns:
+        np.ndarray: Structured array (ORDER_PAYLOAD_DTYPE) with one payload per account.
+    '''
+    balances = np.asarray(balances, dtype=np.float64)
+    payloads = np.empty(len(balances), dtype=ORDER_PAYLOAD_DTYPE)
+    payloads['account'] = np.arange(len(balances)) if accounts is None else accounts
+    payloads['volume'] = get_lots(balances) * multiplier
+    payloads['type'] = request['type']
+    for field in ('price', 'sl', 'tp1', 'tp2', 'tp3'):
+        payloads[field] = request[field]
+    return payloads
+
+
+# Follower accounts every signal is fanned out to (None: only the logged-in account)
+_followers = None
+
+def set_followers(accounts, balances):
+    '''
+    Registers the follower accounts (account numbers and balances, in the same order)
+    that Execute_Buy_Order / Execute_Sell_Order build order payloads for. Pass None to clear.
+    '''
+    global _followers
+    _followers = None if accounts is None else (np.asarray(accounts, dtype=np.int64), np.asarray(balances, dtype=np.float64))
+
+
+def get_sl(entry, tp, rrr=1.2):
     '''
-    This function calculates the stop loss value based on a risk-to-reward ratio (RRR) of 1.2.
+    This function calculates the stop loss value based on a risk-to-reward ratio (RRR).
     
     Args:
         entry (float): The trade entry price.
         tp (float): The take profit price.
+        rrr (float): The risk-to-reward ratio (1.2 by default, tunable for optimization).
         
     Returns:
         float: The calculated stop loss price.
     '''
-    return (entry - ((tp - entry) / 1.2))
+    return (entry - ((tp - entry) / rrr))
 
 
 def Buy_req(symbol, entryp, min_val, avg_val):
@@ -89,29 +287,20 @@ def Buy_req(symbol, entryp, min_val, avg_val):
         dict: A dictionary configured with relevant details for an MT5 buy order request (for values only),
               including TP1, TP2, and TP3.
     '''
-    # Get lot amount based on current account balance
-    account_info = mt5.account_info()._asdict()
-    if account_info:
-        current_balance = account_info.get('balance', 0.0)
-    else:
-        print("Could not retrieve MT5 account info. Using default balance 0.0.")
-        current_balance = 0.0
+    # Get lot amount based on current account balance (cached for a few seconds)
+    current_balance = metadata_cache.balance()
 
     lot = get_lot(current_balance)
     
     # Double the lot if the entry price is closer to the average line (as per original logic)
-    if entryp >= np.mean([min_val, avg_val]):
-        lot = round(lot * 2, 2)
+    lot = round(lot * lot_multiplier(mt5.ORDER_TYPE_BUY, entryp, min_val, avg_val), 2)
 
     # Get the number of decimal places for the current symbol (important for price precision)
-    symbol_info = mt5.symbol_info(symbol)
-    if symbol_info:
-        decimals = symbol_info.digits # Use symbol_info.digits for precision
-    else:
-        decimals = 5 if 'JPY' not in symbol else 3 # Fallback if symbol_info fails
+    decimals = metadata_cache.digits(symbol) # Cached symbol_info.digits, with fallback if it fails
 
     # Get the current ask price for buy order
-    current_ask_price = mt5.symbol_info_tick(symbol).ask
+    with metrics.time('symbol_info_tick'):
+        current_ask_price = mt5.symbol_info_tick(symbol).ask
         
     # Calculate TP3 (original TP)
     tp3 = round(avg_val, decimals)
@@ -157,29 +346,20 @@ def Sell_req(symbol, entryp, max_val, avg_val):
         dict: A dictionary configured with relevant details for an MT5 sell order request (for values only),
               including TP1, TP2, and TP3.
     '''
-    # Get lot amount based on current account balance
-    account_info = mt5.account_info()._asdict()
-    if account_info:
-        current_balance = account_info.get('balance', 0.0)
-    else:
-        print("Could not retrieve MT5 account info. Using default balance 0.0.")
-        current_balance = 0.0
+    # Get lot amount based on current account balance (cached for a few seconds)
+    current_balance = metadata_cache.balance()
 
     lot = get_lot(current_balance)
     
     # Double the lot if the entry price is closer to the average line (as per original logic)
-    if entryp <= np.mean([max_val, avg_val]):
-        lot = round(lot * 2, 2)
+    lot = round(lot * lot_multiplier(mt5.ORDER_TYPE_SELL, entryp, max_val, avg_val), 2)
     
     # Get the number of decimal places for the current symbol
-    symbol_info = mt5.symbol_info(symbol)
-    if symbol_info:
-        decimals = symbol_info.digits
-    else:
-        decimals = 5 if 'JPY' not in symbol else 3 # Fallback
+    decimals = metadata_cache.digits(symbol)
 
     # Get the current bid price for sell order
-    current_bid_price = mt5.symbol_info_tick(symbol).bid
+    with metrics.time('symbol_info_tick'):
+        current_bid_price = mt5.symbol_info_tick(symbol).bid
 
     # Calculate TP3 (original TP)
     tp3 = round(avg_val, decimals)
@@ -210,7 +390,8 @@ def Sell_req(symbol, entryp, max_val, avg_val):
     return req
 
 
-def Execute_Buy_Order(symbol: str, openp: float, min_val: float, avg_val: float, timeframe: str):
+def Execute_Buy_Order(symbol: str, openp: float, min_val: float, avg_val: float, timeframe: str, bar_close: float = None,
+                      on_sent=None, on_failed=None, critical: bool = False):
     '''
     This function simulates a buy order by sending a Telegram message with trade details.
     It no longer sends actual orders to MetaTrader 5.
@@ -221,35 +402,37 @@ def Execute_Buy_Order(symbol: str, openp: float, min_val: float, avg_val: float,
         min_val (float): The calculated 'minimum' indicator value.
         avg_val (float): The calculated 'average' indicator value.
         timeframe (str): The timeframe of the signal (e.g., '15m', '1h').
+        bar_close (float): UTC epoch time the signal candle closed, for the end-to-end latency metric.
+        on_sent (callable): Optional callback run once the Telegram message has been delivered.
+        on_failed (callable): Optional callback run if the Telegram message is dropped or given up on.
+        critical (bool): Send the signal at once in its own message instead of through the digest.
+
+    Returns:
+        np.ndarray: Order payloads for the registered follower accounts (see FanOut()), or None.
     '''
     # Create buy request to get the calculated price, SL, and TP
-    buy_request = Buy_req(symbol, openp, min_val, avg_val)
-    
-    # Extract relevant details for the Telegram message
-    trade_symbol = buy_request['symbol']
-    trade_price = buy_request['price']
-    trade_sl = buy_request['sl']
-    trade_tp1 = buy_request['tp1']
-    trade_tp2 = buy_request['tp2']
-    trade_tp3 = buy_request['tp3']
-
-    message = (
-        f"🟢 *Buy Signal Alert*\n"
-        f"📊 *Symbol*: {trade_symbol}\n"
-        f"⏳ *Timeframe*: {timeframe}\n"
-        f"📈 *Entry Price*: {trade_price:.{mt5.symbol_info(trade_symbol).digits}f}\n"
-        f"🚫 *Stop Loss (SL)*: {trade_sl:.{mt5.symbol_info(trade_symbol).digits}f}\n"
-        f"🎯 *Take Profit 1 (TP1)*: {trade_tp1:.{mt5.symbol_info(trade_symbol).digits}f}\n"
-        f"🎯 *Take Profit 2 (TP2)*: {trade_tp2:.{mt5.symbol_info(trade_symbol).digits}f}\n"
-        f"🎯 *Take Profit 3 (TP3)*: {trade_tp3:.{mt5.symbol_info(trade_symbol).digits}f}"
-    )
+    with metrics.time('order_build'), profiler.stage('order_build', symbol):
+        buy_request = Buy_req(symbol, openp, min_val, avg_val)
     
     print(f"Simulating Buy order for {symbol}. Sending Telegram message...")
-    send_telegram_message(message)
-    print(f"Buy signal message sent for {symbol}.")
+    metrics.inc('signals', side='buy', symbol=symbol, timeframe=timeframe)
+    with profiler.stage('send', symbol):
+        send_signal(symbol, 'buy', timeframe, buy_request,
+                    on_sent=chain_callbacks(_signal_latency_recorder(symbol, timeframe, bar_close), on_sent),
+                    on_failed=on_failed, critical=critical)
+    print(f"Buy signal message queued for {symbol}.")
 
+    if _followers is not None:
+        accounts, balances = _followers
+        multiplier = lot_multiplier(buy_request['type'], openp, min_val, avg_val)
+        payloads = FanOut(buy_request, balances, accounts, multiplier)
+        print(f"Buy order payloads built for {len(payloads)} follower accounts.")
+        return payloads
+    return None
 
-def Execute_Sell_Order(symbol: str, openp: float, max_val: float, avg_val: float, timeframe: str):
+
+def Execute_Sell_Order(symbol: str, openp: float, max_val: float, avg_val: float, timeframe: str, bar_close: float = None,
+                       on_sent=None, on_failed=None, critical: bool = False):
     '''
     This function simulates a sell order by sending a Telegram message with trade details.
     It no longer sends actual orders to MetaTrader 5.
@@ -260,29 +443,30 @@ def Execute_Sell_Order(symbol: str, openp: float, max_val: float, avg_val: float
         max_val (float): The calculated 'maximum' indicator value.
         avg_val (float): The calculated 'average' indicator value.
         timeframe (str): The timeframe of the signal (e.g., '15m', '1h').
+        bar_close (float): UTC epoch time the signal candle closed, for the end-to-end latency metric.
+        on_sent (callable): Optional callback run once the Telegram message has been delivered.
+        on_failed (callable): Optional callback run if the Telegram message is dropped or given up on.
+        critical (bool): Send the signal at once in its own message instead of through the digest.
+
+    Returns:
+        np.ndarray: Order payloads for the registered follower accounts (see FanOut()), or None.
     '''
     # Create sell request to get the calculated price, SL, and TP
-    sell_request = Sell_req(symbol, openp, max_val, avg_val)
-
-    # Extract relevant details for the Telegram message
-    trade_symbol = sell_request['symbol']
-    trade_price = sell_request['price']
-    trade_sl = sell_request['sl']
-    trade_tp1 = sell_request['tp1']
-    trade_tp2 = sell_request['tp2']
-    trade_tp3 = sell_request['tp3']
-
-    message = (
-        f"🔴 *Sell Signal Alert*\n"
-        f"📊 *Symbol*: {trade_symbol}\n"
-        f"⏳ *Timeframe*: {timeframe}\n"
-        f"📉 *Entry Price*: {trade_price:.{mt5.symbol_info(trade_symbol).digits}f}\n"
-        f"🚫 *Stop Loss (SL)*: {trade_sl:.{mt5.symbol_info(trade_symbol).digits}f}\n"
-        f"🎯 *Take Profit 1 (TP1)*: {trade_tp1:.{mt5.symbol_info(trade_symbol).digits}f}\n"
-        f"🎯 *Take Profit 2 (TP2)*: {trade_tp2:.{mt5.symbol_info(trade_symbol).digits}f}\n"
-        f"🎯 *Take Profit 3 (TP3)*: {trade_tp3:.{mt5.symbol_info(trade_symbol).digits}f}"
-    )
+    with metrics.time('order_build'), profiler.stage('order_build', symbol):
+        sell_request = Sell_req(symbol, openp, max_val, avg_val)
 
     print(f"Simulating Sell order for {symbol}. Sending Telegram message...")
-    send_telegram_message(message)
-    print(f"Sell signal message sent for {symbol}.")
+    metrics.inc('signals', side='sell', symbol=symbol, timeframe=timeframe)
+    with profiler.stage('send', symbol):
+        send_signal(symbol, 'sell', timeframe, sell_request,
+                    on_sent=chain_callbacks(_signal_latency_recorder(symbol, timeframe, bar_close), on_sent),
+                    on_failed=on_failed, critical=critical)
+    print(f"Sell signal message queued for {symbol}.")
+
+    if _followers is not None:
+        accounts, balances = _followers
+        multiplier = lot_multiplier(sell_request['type'], openp, max_val, avg_val)
+        payloads = FanOut(sell_request, balances, accounts, multiplier)
+        print(f"Sell order payloads built for {len(payloads)} follower accounts.")
+        return payloads
+    return None
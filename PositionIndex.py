@@ -0,0 +1,96 @@
+from Broker import mt5
+
+
+class PositionIndex:
+    '''
+    Snapshot of the open positions, refreshed once per cycle instead of calling
+    mt5.positions_get(symbol=...) for every series.
+
+    refresh() first asks mt5.positions_total(); if no positions are open the index is
+    cleared without fetching anything, otherwise all positions are fetched with a single
+    mt5.positions_get() and the index is updated by ticket, so only opened or closed
+    positions touch the per-symbol groups.
+
+    Positions are grouped by symbol and by (symbol, magic) and (symbol, comment), so a
+    series can be skipped per symbol or only for positions opened by a given EA/comment.
+    '''
+
+    def __init__(self):
+        self._positions = {}  # ticket -> position
+        self._by_symbol = {}  # symbol -> set of tickets
+        self._by_magic = {}   # (symbol, magic) -> set of tickets
+        self._by_comment = {} # (symbol, comment) -> set of tickets
+
+    def _groups(self, position):
+        return ((self._by_symbol, position.symbol),
+                (self._by_magic, (position.symbol, position.magic)),
+                (self._by_comment, (position.symbol, position.comment)))
+
+    def _add(self, position):
+        self._positions[position.ticket] = position
+        for groups, key in self._groups(position):
+            groups.setdefault(key, set()).add(position.ticket)
+
+    def _remove(self, ticket):
+        position = self._positions.pop(ticket)
+        for groups, key in self._groups(position):
+            tickets = groups[key]
+            tickets.discard(ticket)
+            if not tickets:
+                del groups[key]
+
+    def refresh(self):
+        '''
+        Brings the index up to date with the broker.
+
+        Returns:
+            bool: False if the broker did not return the positions (the previous snapshot is kept).
+        '''
+        total = mt5.positions_total()
+        if total == 0:
+            for ticket in list(self._positions):
+                self._remove(ticket)
+            return True
+
+        positions = mt5.positions_get()
+        if positions is None:
+            print(f"Failed to get open positions, error code={mt5.last_error()}.")
+            return False
+
+        current = {position.ticket: position for position in positions}
+        for ticket in [ticket for ticket in self._positions if ticket not in current]:
+            self._remove(ticket)
+        for ticket, position in current.items():
+            if ticket not in self._positions:
+                self._add(position)
+            else:
+                self._positions[ticket] = position # Same position, new sl/tp/volume values
+        return True
+
+    def count(self, symbol: str, magic: int = None, comment: str = None):
+        '''Number of open positions on `symbol`, optionally only those with the given magic or comment.'''
+        if magic is not None:
+            tickets = self._by_magic.get((symbol, magic), ())
+        elif comment is not None:
+            tickets = self._by_comment.get((symbol, comment), ())
+        else:
+            tickets = self._by_symbol.get(symbol, ())
+        if magic is not None and comment is not None:
+            tickets = [ticket for ticket in tickets if self._positions[ticket].comment == comment]
+        return len(tickets)
+
+    def has_open(self, symbol: str, magic: int = None, comment: str = None):
+        return self.count(symbol, magic, comment) > 0
+
+    def positions(self, symbol: str = None):
+        '''Open positions, optionally only those on `symbol`.'''
+        if symbol is None:
+            return list(self._positions.values())
+        return [self._positions[ticket] for ticket in self._by_symbol.get(symbol, ())]
+
+    def __len__(self):
+        return len(self._positions)
+
+
+# Shared instance refreshed by the trading loop
+position_index = PositionIndex()
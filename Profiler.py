@@ -0,0 +1,312 @@
+import os
+import signal
+import cProfile
+import pstats
+import threading
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+from time import perf_counter
+
+PROFILE_DIR = 'profiles'
+MAX_STACK_DEPTH = 64     # Deepest call chain written to the collapsed CPU stacks
+MIN_STACK_SECONDS = 1e-6 # Call paths cheaper than this are left out of the collapsed CPU stacks
+TRACEMALLOC_FRAMES = 32  # Frames kept per allocation traceback
+
+
+class _NullScope:
+    '''Shared no-op context manager returned while no cycle is being profiled.'''
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SCOPE = _NullScope()
+
+
+class _Cycle:
+    '''Context manager returned by CycleProfiler.cycle() for a cycle that is captured.'''
+
+    __slots__ = ('profiler',)
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def __enter__(self):
+        self.profiler._start_cycle()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._end_cycle()
+        return False
+
+
+class _Stage:
+    '''Context manager returned by CycleProfiler.stage() that moves the CPU samples to its tag.'''
+
+    __slots__ = ('profiler', 'tag')
+
+    def __init__(self, profiler, tag):
+        self.profiler = profiler
+        self.tag = tag
+
+    def __enter__(self):
+        self.profiler._push(self.tag)
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._pop()
+        return False
+
+
+def _frame_name(func):
+    '''Flame graph frame for a pstats function key (filename, line, name).'''
+    filename, line, name = func
+    if filename == '~': # Built-in functions
+        return name.replace(';', ':')
+    return f"{name} ({os.path.basename(filename)}:{line})".replace(';', ':')
+
+
+def CollapsedStacks(stats: dict, prefix=()):
+    '''
+    Converts cProfile stats (pstats.Stats.stats) to collapsed stacks: "frame;frame;... value"
+    lines with the self time of every call path in microseconds, the input format of
+    flamegraph.pl, speedscope and inferno. cProfile only records caller -> callee edges, so
+    the time of a function called from several places is split between its call paths in
+    proportion to the time spent through each caller.
+
+    Calls made by this module (switching between stage profiles) are left out.
+
+    Args:
+        prefix (tuple): Frames put on top of every stack (e.g. the symbol and stage tag).
+
+    Returns:
+        dict: Collapsed stack -> microseconds.
+    '''
+    callees = defaultdict(list)
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, (_, _, _, edge_time) in callers.items():
+            callees[caller].append((func, edge_time))
+    internal = {func for func in stats if func[0] == __file__}
+    roots = [func for func, (_, _, _, _, callers) in stats.items() if not callers and func not in internal]
+
+    stacks = defaultdict(float)
+    def walk(func, path, on_path, share):
+        _, _, self_time, total_time, _ = stats[func]
+        if self_time * share > 0:
+            stacks[';'.join(path)] += self_time * share * 1e6
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for callee, edge_time in callees.get(func, ()):
+            callee_total = stats[callee][3]
+            if callee in on_path or callee in internal or callee_total <= 0 or edge_time * share < MIN_STACK_SECONDS:
+                continue # Recursion is folded into the outer call
+            on_path.add(callee)
+            walk(callee, path + [_frame_name(callee)], on_path, edge_time * share / callee_total)
+            on_path.discard(callee)
+
+    for root in roots:
+        walk(root, list(prefix) + [_frame_name(root)], {root}, 1.0)
+    return {stack: value for stack, value in stacks.items() if value >= 1}
+
+
+def CollapsedAllocations(snapshot, baseline=None):
+    '''
+    Converts a tracemalloc snapshot (or its growth since `baseline`) to collapsed stacks
+    with the bytes still allocated by every traceback (tracebacks are oldest frame first).
+
+    Returns:
+        dict: Collapsed stack -> bytes.
+    '''
+    # Leave out the memory used by the profiling itself
+    ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__),
+              tracemalloc.Filter(False, pstats.__file__), tracemalloc.Filter(False, cProfile.__file__))
+    snapshot = snapshot.filter_traces(ignore)
+    if baseline is None:
+        stats = snapshot.statistics('traceback')
+        sizes = ((stat.traceback, stat.size) for stat in stats)
+    else:
+        stats = snapshot.compare_to(baseline.filter_traces(ignore), 'traceback')
+        sizes = ((stat.traceback, stat.size_diff) for stat in stats if stat.size_diff > 0)
+
+    stacks = defaultdict(int)
+    for traceback, size in sizes:
+        frames = [f"{os.path.basename(frame.filename)}:{frame.lineno}".replace(';', ':')
+                  for frame in traceback]
+        stacks[';'.join(frames)] += size
+    return dict(stacks)
+
+
+def _write_collapsed(path: str, stacks: dict):
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, value in sorted(stacks.items()):
+            f.write(f"{stack} {int(value)}\n")
+
+
+class CycleProfiler:
+    '''
+    On-demand profiler for boundary cycles of the trading loop. While it is not armed,
+    cycle() and stage() return a shared no-op context manager, so the loop pays one
+    attribute check per call and nothing else.
+
+    Once armed (arm(), a signal, or a trigger file), each cycle is run under cProfile and
+    tracemalloc. Every captured cycle writes to `output_dir`:
+
+        <name>.cpu.folded    Collapsed CPU stacks in microseconds, tagged "symbol;stage;..."
+        <name>.alloc.folded  Collapsed stacks of the memory the cycle allocated and kept, in bytes
+        <name>.pstats        cProfile stats of the whole cycle (pstats, snakeviz)
+        <name>.tracemalloc   tracemalloc snapshot taken at the end of the cycle
+
+    Stages are tagged with `with profiler.stage('fetch', symbol):`. Each tag gets its own
+    cProfile.Profile, so the CPU samples of a stage appear under "symbol;stage" in the
+    flame graph. Only the thread that runs the cycle is profiled; the trading loop runs
+    the series of a captured cycle one after another.
+
+    Args:
+        output_dir (str): Directory the profiles are written to.
+        output (callable): Receives a line for every profile written.
+    '''
+
+    def __init__(self, output_dir: str = PROFILE_DIR, output=print):
+        self.output_dir = output_dir
+        self.output = output
+        self.active = False     # True while a cycle is being captured
+        self.remaining = 0      # Cycles still to capture (None: until disarmed)
+        self.threshold = None   # Only keep cycles slower than this many seconds
+        self.captured = 0
+
+        self._thread = None
+        self._profiles = {}     # tag -> cProfile.Profile of the current cycle
+        self._tags = []         # Stack of the open stage tags
+        self._started = None
+        self._baseline = None
+        self._started_tracemalloc = False
+
+    @property
+    def armed(self):
+        return self.remaining is None or self.remaining > 0
+
+    def arm(self, cycles: int = 1, threshold: float = None):
+        '''
+        Captures the next `cycles` cycles (None: until disarm()). With a `threshold` in
+        seconds, every cycle is profiled but only those slower than the threshold are
+        written and counted.
+        '''
+        self.threshold = threshold
+        self.remaining = cycles
+        condition = f" slower than {threshold:g}s" if threshold is not None else ''
+        count = 'every cycle' if cycles is None else f"the next {cycles} cycle{'s' if cycles != 1 else ''}"
+        self.output(f"Profiling {count}{condition} into {self.output_dir}/")
+
+    def disarm(self):
+        self.remaining = 0
+
+    def install_signal(self, signum=None, cycles: int = 1, threshold: float = None):
+        '''
+        Arms the profiler whenever the process receives `signum` (SIGUSR1 by default).
+        Returns False where the signal does not exist (e.g. on Windows); use check_trigger() there.
+        '''
+        signum = signum if signum is not None else getattr(signal, 'SIGUSR1', None)
+        if signum is None:
+            return False
+        signal.signal(signum, lambda *_: self.arm(cycles, threshold))
+        return True
+
+    def check_trigger(self, path: str):
+        '''
+        Arms the profiler if the file `path` exists, then removes it. The file may contain
+        the number of cycles and a threshold in seconds ("5" or "10 2.5"); empty means one cycle.
+        '''
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, encoding='utf-8') as f:
+                fields = f.read().split()
+            os.remove(path)
+            cycles = int(fields[0]) if fields else 1
+            threshold = float(fields[1]) if len(fields) > 1 else None
+        except (OSError, ValueError) as err:
+            self.output(f"Ignoring profile trigger {path}: {err}")
+            return
+        self.arm(cycles, threshold)
+
+    def cycle(self):
+        '''Context manager around one boundary cycle; a no-op unless the profiler is armed.'''
+        if not self.armed or self.active:
+            return _NULL_SCOPE
+        return _Cycle(self)
+
+    def stage(self, stage: str, symbol: str = None):
+        '''Context manager tagging the CPU time of a stage of a captured cycle; a no-op otherwise.'''
+        if not self.active or threading.get_ident() != self._thread:
+            return _NULL_SCOPE
+        return _Stage(self, (symbol, stage) if symbol is not None else (stage,))
+
+    def _push(self, tag):
+        self._profiles[self._tags[-1]].disable()
+        self._tags.append(tag)
+        profile = self._profiles.get(tag)
+        if profile is None:
+            profile = self._profiles[tag] = cProfile.Profile()
+        profile.enable()
+
+    def _pop(self):
+        self._profiles[self._tags.pop()].disable()
+        self._profiles[self._tags[-1]].enable()
+
+    def _start_cycle(self):
+        self.active = True
+        self._thread = threading.get_ident()
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._baseline = tracemalloc.take_snapshot()
+        self._tags = [('cycle',)]
+        self._profiles = {('cycle',): cProfile.Profile()}
+        self._started = perf_counter()
+        self._profiles[('cycle',)].enable()
+
+    def _end_cycle(self):
+        self._profiles[self._tags[-1]].disable()
+        elapsed = perf_counter() - self._started
+        snapshot = tracemalloc.take_snapshot()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        self.active = False
+        profiles, baseline = self._profiles, self._baseline
+        self._profiles, self._tags, self._baseline = {}, [], None
+
+        if self.threshold is not None and elapsed < self.threshold:
+            return
+        if self.remaining is not None:
+            self.remaining -= 1
+        self.captured += 1
+        self._write(profiles, snapshot, baseline, elapsed)
+
+    def _write(self, profiles, snapshot, baseline, elapsed):
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = f"cycle-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{self.captured}"
+        base = os.path.join(self.output_dir, name)
+
+        cpu_stacks = {}
+        combined = None
+        for tag, profile in profiles.items():
+            stats = pstats.Stats(profile)
+            if not stats.stats:
+                continue
+            cpu_stacks.update(CollapsedStacks(stats.stats, prefix=tag))
+            combined = stats if combined is None else combined.add(profile)
+        _write_collapsed(base + '.cpu.folded', cpu_stacks)
+        _write_collapsed(base + '.alloc.folded', CollapsedAllocations(snapshot, baseline))
+        if combined is not None:
+            combined.dump_stats(base + '.pstats')
+        snapshot.dump(base + '.tracemalloc')
+        self.output(f"Profiled a {elapsed:.3f}s cycle into {base}.*")
+
+
+# Shared instance used by the trading loop
+profiler = CycleProfiler()
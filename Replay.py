@@ -0,0 +1,364 @@
+import gzip
+import atexit
+import pickle
+import bisect
+import threading
+import numpy as np
+from collections import namedtuple, defaultdict
+from datetime import datetime
+from time import monotonic, perf_counter
+
+import OrderProcessing
+from Broker import RATES_DTYPE, TIMEFRAME_PERIODS, SimulatedBroker, Tick, _epoch, set_broker
+from Metrics import metrics
+from TimeProcessing import VirtualClock, clock, set_clock
+
+CAPTURE_FORMAT = 'mt5-capture'
+CAPTURE_VERSION = 1
+CAPTURE_FLUSH_INTERVAL = 5.0 # Seconds between flushes of the compressed stream to disk
+
+SECRET_ARGUMENTS = ('password',) # Keyword arguments never written to a capture
+
+# Broker structs (SymbolInfo, Tick, TradePosition, ...) are stored as plain tuples, so a capture
+# recorded from the MetaTrader5 package can be replayed where the package is not installed
+Struct = namedtuple('Struct', ['type', 'fields', 'values'])
+
+_struct_types = {} # (type, fields) -> namedtuple class rebuilt from a capture
+
+
+def _encode(value):
+    '''Converts a broker call argument or result into the form stored in a capture.'''
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if hasattr(value, '_asdict'):
+        fields = value._asdict()
+        return Struct(type(value).__name__, tuple(fields), tuple(_encode(field) for field in fields.values()))
+    if isinstance(value, (tuple, list)):
+        return type(value)(_encode(item) for item in value)
+    return value
+
+
+def _decode(value):
+    '''Rebuilds a broker result stored by _encode() (structs become namedtuples of the same name).'''
+    if isinstance(value, Struct):
+        struct_type = _struct_types.get((value.type, value.fields))
+        if struct_type is None:
+            struct_type = _struct_types[(value.type, value.fields)] = namedtuple(value.type, value.fields, rename=True)
+        return struct_type(*(_decode(field) for field in value.values))
+    if isinstance(value, (tuple, list)):
+        return type(value)(_decode(item) for item in value)
+    return value
+
+
+def _call_symbol(args, kwargs):
+    '''The symbol a broker call is about (first positional argument or `symbol=`), or None.'''
+    if args and isinstance(args[0], str):
+        return args[0]
+    return kwargs.get('symbol')
+
+
+def LoadCapture(path: str):
+    '''
+    Reads a capture written by RecordingBroker. A capture cut off by a crash is read up to
+    its last complete record.
+
+    Returns:
+        tuple: (header dict, list of (time, call, args, kwargs, result) records).
+
+    Raises:
+        ValueError: If the file is not a capture.
+    '''
+    with gzip.open(path, 'rb') as f:
+        try:
+            header = pickle.load(f)
+        except (EOFError, OSError, pickle.UnpicklingError) as err:
+            raise ValueError(f"{path} is not a capture file: {err}") from None
+        if not isinstance(header, dict) or header.get('format') != CAPTURE_FORMAT:
+            raise ValueError(f"{path} is not a capture file")
+        if header.get('version') != CAPTURE_VERSION:
+            raise ValueError(f"{path} has capture version {header.get('version')}, expected {CAPTURE_VERSION}")
+        records = []
+        while True:
+            try:
+                records.append(pickle.load(f))
+            except (EOFError, pickle.UnpicklingError):
+                break
+    return header, records
+
+
+class RecordingBroker:
+    '''
+    Wraps a broker backend and records every call made to it, with its arguments
+    (passwords left out), its result and the time it returned, to a capture file that
+    ReplayBroker serves again. Constants are passed through without being recorded.
+
+    The capture is a gzip-compressed stream of pickles: a header dict followed by one
+    (time, call, args, kwargs, result) tuple per call. Rates arrays keep their structured
+    dtype and broker structs are stored as Struct tuples. Captures are pickles, so only
+    replay files you recorded yourself.
+
+    Args:
+        broker: Backend to record (e.g. the MT5Broker adapter).
+        path (str): Capture file to create.
+        **header: Extra header fields (e.g. series=[(symbol, timeframe), ...]).
+    '''
+
+    def __init__(self, broker, path: str, **header):
+        self._broker = broker
+        self.path = path
+        self.records = 0
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, 'wb')
+        self._flushed = monotonic()
+        self._write(dict(header, format=CAPTURE_FORMAT, version=CAPTURE_VERSION, started=clock.time()))
+        atexit.register(self.close)
+
+    def __getattr__(self, name):
+        attr = getattr(self._broker, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            self.record(name, args, kwargs, result)
+            return result
+        return call
+
+    def record(self, name: str, args: tuple, kwargs: dict, result):
+        kwargs = {key: _encode(value) for key, value in kwargs.items() if key not in SECRET_ARGUMENTS}
+        self._write((clock.time(), name, _encode(tuple(args)), kwargs, _encode(result)))
+        self.records += 1
+
+    def _write(self, record):
+        with self._lock:
+            if self._file is None:
+                return # Closed: calls made while the program exits are not recorded
+            pickle.dump(record, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+            if monotonic() - self._flushed >= CAPTURE_FLUSH_INTERVAL:
+                self._file.flush() # A crash loses at most the last few seconds
+                self._flushed = monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class CapturedSeries:
+    '''
+    Every version of the candles of one series seen in a capture, sorted by open time and
+    then by the time they were recorded. Unchanged repeats of a candle are dropped.
+
+    Args:
+        period (int): Candle length in seconds.
+        versions (list): (recorded at, rates array) pairs.
+    '''
+
+    def __init__(self, period: int, versions):
+        rows = np.concatenate([np.asarray(rates).astype(RATES_DTYPE) for _, rates in versions])
+        observed = np.concatenate([np.full(len(rates), float(t)) for t, rates in versions])
+        order = np.lexsort((observed, rows['time']))
+        rows, observed = rows[order], observed[order]
+        keep = np.concatenate(([True], rows[1:] != rows[:-1])) # Keep the time a version was first seen
+        self.rows, self.observed = rows[keep], observed[keep]
+        self.period = period
+        self.times, self.first = np.unique(self.rows['time'], return_index=True) # First version of every candle
+        self.last = np.append(self.first[1:], len(self.rows)) - 1                # Final version of every candle
+
+    def opened(self, now: float):
+        '''Number of candles opened by `now`.'''
+        return int(np.searchsorted(self.times, now, side='right'))
+
+    def candles(self, now: float, start: int, stop: int):
+        '''
+        Candles start..stop-1 of those opened by `now`: closed candles in their final
+        version, the forming candle as last recorded by `now` (its first version if it
+        was only recorded later).
+        '''
+        rates = self.rows[self.last[start:stop]]
+        if stop > start and stop == self.opened(now) and self.times[stop - 1] + self.period > now:
+            first, last = self.first[stop - 1], self.last[stop - 1]
+            k = first + int(np.searchsorted(self.observed[first:last + 1], now, side='right')) - 1
+            rates[-1] = self.rows[max(k, first)]
+        return rates
+
+
+class ReplayBroker(SimulatedBroker):
+    '''
+    Serves a capture recorded by RecordingBroker on the active clock (the VirtualClock of
+    a replay), so the trading loop sees the market of the recorded session.
+
+    Candles are answered from everything the capture saw of a series rather than by
+    matching the recorded calls, so code that fetches differently (another cache or
+    resampling strategy) gets the same data: a candle is served once its open time has
+    passed, closed candles in their final version and the forming candle as last
+    recorded at that time. Series the recorded run never fetched have no candles.
+
+    Every other call returns its last result recorded at or before the current time (its
+    first result before that). Calls the capture has no result for are answered like
+    SimulatedBroker, except ticks, which follow the close of the symbol's shortest series.
+
+    Args:
+        path (str): Capture file.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        self.header, records = LoadCapture(path)
+        super().__init__(speedup=0, start_time=self.header['started'])
+        self.start = self.header['started']
+        self.end = max((record[0] for record in records), default=self.start)
+
+        self.calls = {} # (call, symbol or None) -> (recorded times, decoded results)
+        versions = defaultdict(list)
+        for t, name, args, kwargs, result in records:
+            if name.startswith('copy_rates_'):
+                timeframe = args[1] if len(args) > 1 else kwargs.get('timeframe')
+                if result is not None and len(result) > 0:
+                    versions[(_call_symbol(args, kwargs), timeframe)].append((t, result))
+                continue
+            times, results = self.calls.setdefault((name, _call_symbol(args, kwargs)), ([], []))
+            times.append(t)
+            results.append(_decode(result))
+        self.series = {key: CapturedSeries(TIMEFRAME_PERIODS[key[1]], series_versions)
+                       for key, series_versions in versions.items()}
+
+    def now(self):
+        return clock.time()
+
+    def _replayed(self, name: str, symbol, fallback, *args, **kwargs):
+        calls = self.calls.get((name, symbol))
+        if calls is None:
+            return fallback(*args, **kwargs)
+        times, results = calls
+        return results[max(bisect.bisect_right(times, self.now()) - 1, 0)]
+
+    # --- Candles -------------------------------------------------------------------------
+
+    def _slice(self, symbol: str, timeframe: int, start, stop):
+        '''Candles [start, stop) of the series (indices into the candles opened by now, clipped).'''
+        series = self.series.get((symbol, timeframe))
+        if series is None:
+            return np.zeros(0, dtype=RATES_DTYPE)
+        opened = series.opened(self.now())
+        start, stop = max(0, start), min(opened, stop)
+        return series.candles(self.now(), start, max(start, stop))
+
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int):
+        series = self.series.get((symbol, timeframe))
+        end = (series.opened(self.now()) if series is not None else 0) - start_pos
+        return self._slice(symbol, timeframe, end - count, end)
+
+    def copy_rates_from(self, symbol: str, timeframe: int, date_from, count: int):
+        series = self.series.get((symbol, timeframe))
+        end = int(np.searchsorted(series.times, _epoch(date_from), side='right')) if series is not None else 0
+        return self._slice(symbol, timeframe, end - count, end)
+
+    def copy_rates_range(self, symbol: str, timeframe: int, date_from, date_to):
+        series = self.series.get((symbol, timeframe))
+        if series is None:
+            return np.zeros(0, dtype=RATES_DTYPE)
+        start = int(np.searchsorted(series.times, _epoch(date_from), side='left'))
+        end = int(np.searchsorted(series.times, _epoch(date_to), side='right'))
+        return self._slice(symbol, timeframe, start, end)
+
+    # --- Other calls ---------------------------------------------------------------------
+
+    def initialize(self, **kwargs):
+        return self._replayed('initialize', None, super().initialize, **kwargs)
+
+    def login(self, login=None, password=None, server=None, **kwargs):
+        return self._replayed('login', None, super().login, login, password, server)
+
+    def last_error(self):
+        return self._replayed('last_error', None, super().last_error)
+
+    def terminal_info(self):
+        return self._replayed('terminal_info', None, super().terminal_info)
+
+    def symbol_select(self, symbol: str, enable: bool = True):
+        return self._replayed('symbol_select', symbol, super().symbol_select, symbol, enable)
+
+    def positions_get(self, symbol: str = None, **kwargs):
+        if symbol is not None and ('positions_get', symbol) not in self.calls:
+            return tuple(position for position in self.positions_get() if position.symbol == symbol)
+        return self._replayed('positions_get', symbol, super().positions_get, symbol)
+
+    def positions_total(self):
+        return self._replayed('positions_total', None, lambda: len(self.positions_get()))
+
+    def account_info(self):
+        return self._replayed('account_info', None, super().account_info)
+
+    def symbol_info(self, symbol: str):
+        return self._replayed('symbol_info', symbol, super().symbol_info, symbol)
+
+    def symbol_info_tick(self, symbol: str):
+        return self._replayed('symbol_info_tick', symbol, self._candle_tick, symbol)
+
+    def _candle_tick(self, symbol: str):
+        '''Tick at the close of the forming candle of the symbol's shortest captured series.'''
+        timeframes = sorted((timeframe for series_symbol, timeframe in self.series if series_symbol == symbol),
+                            key=TIMEFRAME_PERIODS.get)
+        rates = self.copy_rates_from_pos(symbol, timeframes[0], 0, 1) if timeframes else ()
+        info = self.symbol_info(symbol)
+        if len(rates) == 0 or info is None:
+            return None
+        bid, now = float(rates['close'][-1]), self.now()
+        return Tick(time=int(now), bid=bid, ask=bid + info.spread * info.point, last=bid,
+                    volume=0, time_msc=int(now * 1000))
+
+
+class Replay:
+    '''
+    Runs the trading loop on a capture instead of the MT5 terminal. install() makes the
+    ReplayBroker the active broker and a VirtualClock spanning the capture the active clock
+    (its sleep() raises TimeProcessing.ClockStopped once the capture is used up), replaces
+    the Telegram sender with one that only collects the messages, sends every signal on
+    its own (no digest timer) and keeps metrics in memory for report().
+
+    Args:
+        path (str): Capture file written by RecordingBroker.
+    '''
+
+    def __init__(self, path: str):
+        self.broker = ReplayBroker(path)
+        self.clock = VirtualClock(self.broker.start, self.broker.end)
+        self.messages = [] # (virtual send time, message)
+        self._started = None
+
+    def install(self):
+        set_broker(self.broker)
+        set_clock(self.clock)
+        OrderProcessing.send_telegram_message = self._send
+        OrderProcessing.SIGNAL_DIGEST_WINDOW = 0
+        metrics.enabled = True
+        self._started = perf_counter()
+
+    def _send(self, message: str, on_sent=None, on_failed=None):
+        self.messages.append((clock.time(), message))
+        if on_sent is not None:
+            on_sent()
+
+    def report(self, signal_keys, output=print):
+        '''Prints the replayed span, the cycle throughput and the signal latency.'''
+        elapsed = perf_counter() - self._started
+        replayed = self.clock.time() - self.broker.start
+        cycles = metrics.combined('stage_seconds', stage='cycle')
+        latency = metrics.combined('signal_latency_seconds')
+        output(f"Replayed {replayed / 3600:.1f}h of {self.broker.path} in {elapsed:.2f}s "
+               f"({replayed / elapsed:.0f}x real time)")
+        if cycles.count:
+            output(f"Cycles: {cycles.count}, {cycles.count / cycles.sum:.1f} cycles/s of processing, "
+                   f"mean {cycles.sum / cycles.count * 1e3:.2f}ms p95<={cycles.quantile(0.95) * 1e3:.1f}ms "
+                   f"max {cycles.max * 1e3:.1f}ms")
+        output(f"Signals: {len(signal_keys)} ({len(self.messages)} messages)" + (
+               f", latency from candle close mean {latency.sum / latency.count:.3f}s "
+               f"p95<={latency.quantile(0.95):.3f}s max {latency.max:.3f}s" if latency.count else ''))
+
+    @staticmethod
+    def write_signals(path: str, signal_keys):
+        '''Writes one signal key per line, so the signals of two replays can be compared with diff.'''
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(f"{key}\n" for key in signal_keys)
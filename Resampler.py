@@ -0,0 +1,129 @@
+import numpy as np
+from Broker import mt5
+from pytz import utc # For UTC timezone awareness
+from datetime import datetime
+
+from BarCache import BarCache
+from Metrics import metrics
+from TimeProcessing import TIMEFRAME_SECONDS, clock, get_mt5_interval
+
+
+def BaseTimeframes(series):
+    '''
+    Picks the base timeframe of every symbol in a list of (symbol, timeframe) pairs: its
+    shortest timeframe, provided every other timeframe of the symbol is a whole multiple
+    of it. Symbols whose timeframes do not divide evenly get no base timeframe.
+
+    Returns:
+        dict: symbol -> base timeframe, only for symbols listed with more than one timeframe.
+    '''
+    timeframes = {}
+    for symbol, timeframe in series:
+        timeframes.setdefault(symbol, set()).add(timeframe)
+
+    bases = {}
+    for symbol, tframes in timeframes.items():
+        if len(tframes) < 2:
+            continue
+        base = min(tframes, key=TIMEFRAME_SECONDS.get)
+        if all(TIMEFRAME_SECONDS[tframe] % TIMEFRAME_SECONDS[base] == 0 for tframe in tframes):
+            bases[symbol] = base
+    return bases
+
+
+def ResampleRates(rates, period: int):
+    '''
+    Aggregates candles (oldest first, mt5.copy_rates_* fields) into candles of `period`
+    seconds aligned to UTC multiples of the period, the same boundaries MT5 uses for
+    M1..D1. Open is the first open, high/low the extremes, close the last close, volumes
+    are summed and every other field takes the value of the last candle in the bucket.
+    '''
+    if len(rates) == 0:
+        return rates[:0].copy()
+    buckets = rates['time'] // period * period
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(rates)] - 1
+
+    resampled = rates[ends]
+    resampled['time'] = buckets[starts]
+    resampled['open'] = rates['open'][starts]
+    resampled['high'] = np.maximum.reduceat(rates['high'], starts)
+    resampled['low'] = np.minimum.reduceat(rates['low'], starts)
+    for field in ('tick_volume', 'real_volume'):
+        if field in rates.dtype.names:
+            resampled[field] = np.add.reduceat(rates[field], starts)
+    return resampled
+
+
+class ResampledBarCache(BarCache):
+    '''
+    BarCache for a higher timeframe that, after being seeded once (from the HistoryStore
+    or the broker), is advanced from the candles of a base-timeframe BarCache of the same
+    symbol instead of fetching its own candles. One delta fetch of the base series then
+    updates every timeframe of the symbol.
+
+    On every sync the still-forming higher-timeframe candle and any newer ones are rebuilt
+    from the base candles. If the base window no longer reaches back to the start of the
+    forming candle (long downtime, base re-seed) the window is seeded from the broker again.
+
+    Args:
+        base (BarCache): Cache of the base timeframe. Its timeframe must divide `timeframe`.
+        base_max_age (float): Passed to base.sync(max_age=...), so the base series is only
+                              fetched once when several timeframes sync in the same cycle.
+        verify (bool): If True, every newly closed candle is compared with the broker's
+                       candle and the window is seeded again on a mismatch.
+    '''
+
+    def __init__(self, symbol: str, timeframe: str, base: BarCache, size: int = 550, store=None,
+                 base_max_age: float = 1.0, verify: bool = False):
+        if TIMEFRAME_SECONDS[timeframe] % TIMEFRAME_SECONDS[base.timeframe] != 0:
+            raise ValueError(f"{timeframe} candles cannot be built from {base.timeframe} candles")
+        super().__init__(symbol, timeframe, size, store=store)
+        self.base = base
+        self.base_max_age = base_max_age
+        self.verify = verify
+        self.period = TIMEFRAME_SECONDS[timeframe]
+
+    def _verify_closed(self, closed):
+        '''Returns False if the broker's candle for the closed candle `closed` differs.'''
+        open_time = datetime.fromtimestamp(int(closed['time']), tz=utc)
+        broker_rates = mt5.copy_rates_range(self.symbol, get_mt5_interval(self.timeframe), open_time, open_time)
+        if broker_rates is None or len(broker_rates) == 0:
+            return True # Nothing to compare with
+        broker_bar = broker_rates[0]
+        return all(np.isclose(closed[field], broker_bar[field]) for field in ('open', 'high', 'low', 'close'))
+
+    def sync(self, max_age: float = None):
+        '''
+        Brings the window up to date from the base series and returns rates() (None on failure).
+        `max_age` has the same meaning as in BarCache.sync().
+        '''
+        if self.length < 2:
+            return super().sync(max_age)
+        if self._is_fresh(max_age):
+            return self.rates()
+        self.synced_at = clock.monotonic()
+        self.resynced = False
+        base_rates = self.base.sync(max_age=self.base_max_age)
+
+        forming_time = self.rates()[-1]['time']
+        if base_rates is None or len(base_rates) == 0 or base_rates[0]['time'] > forming_time:
+            return self._seed()
+
+        resampled = ResampleRates(base_rates[base_rates['time'] >= forming_time], self.period)
+        if len(resampled) == 0 or resampled[0]['time'] != forming_time:
+            return self._seed()
+        if len(resampled) - 1 >= self.size:
+            return self._seed()
+
+        metrics.inc('resampled_syncs', timeframe=self.timeframe)
+        self._replace_last(resampled[0])
+        for bar in resampled[1:]:
+            self._append(bar)
+        if len(resampled) > 1:
+            if self.verify and not self._verify_closed(self.rates()[-2]):
+                print(f"Resampled {self.timeframe} candles for {self.symbol} do not match the broker. Re-syncing...")
+                metrics.inc('resample_mismatches', timeframe=self.timeframe)
+                return self._seed()
+            self._store_closed()
+        return self.rates()
@@ -0,0 +1,365 @@
+import sys
+import json
+import threading
+from Broker import mt5
+from pytz import utc # For UTC timezone awareness
+from datetime import datetime
+from concurrent.futures import as_completed
+
+from BarCache import BarCache
+from DataProcessing import IndicatorState
+from Metrics import metrics
+from OrderProcessing import Execute_Buy_Order, Execute_Sell_Order
+from PositionIndex import position_index
+from Profiler import profiler
+from Resampler import BaseTimeframes, ResampledBarCache
+from SessionCalendar import SessionCalendar
+from StateJournal import StateJournal
+from TelegramDispatcher import chain_callbacks
+
+
+class SeriesProcessor:
+    '''
+    The work of the trading loop at a candle boundary: brings the candles of every due
+    series up to date, advances its streaming indicator state, evaluates the strategies
+    and sends their signals. main.py runs it on the live terminal; Benchmark.py runs the
+    same code on a SimulatedBroker.
+
+    The rolling candle cache and indicator state of every series are kept in `bar_caches`
+    and `indicator_states`, keyed by (symbol, timeframe). Both are seeded once from the
+    full history and afterwards only advanced with the candles that changed.
+
+    Args:
+        symbol_table (SymbolTable): The series; `last_processed` is updated in it.
+        journal (StateJournal): Journal of processed candles and sent signals.
+        strategy_pipeline (StrategyPipeline): Strategies evaluated on every new candle.
+        history_bars (int): Candles kept per series (and fetched when a cache is seeded).
+        store (HistoryStore, optional): On-disk history the caches are seeded from and write to.
+        resample (bool): Build the higher timeframes of a symbol from its shortest timeframe.
+        sync_max_age (float): Seconds a synced base series is reused by the other timeframes of its symbol.
+        verify_resampled (bool): Compare every resampled candle with the broker's once it closes.
+        calendar (SessionCalendar, optional): Trading sessions; symbols outside theirs are skipped.
+        critical_strategies (list): Strategies whose signals skip the signal digest.
+        follower_orders_path (str, optional): File the follower order payloads are appended to.
+        pool (ThreadPoolExecutor, optional): Evaluates the symbols of a boundary concurrently.
+    '''
+
+    def __init__(self, symbol_table, journal, strategy_pipeline, history_bars: int = 550, store=None,
+                 resample: bool = True, sync_max_age: float = 1, verify_resampled: bool = False, calendar=None,
+                 critical_strategies=(), follower_orders_path: str = None, pool=None):
+        self.symbol_table = symbol_table
+        self.journal = journal
+        self.strategy_pipeline = strategy_pipeline
+        self.history_bars = history_bars
+        self.store = store
+        self.base_timeframes = BaseTimeframes(list(symbol_table)) if resample else {}
+        self.sync_max_age = sync_max_age
+        self.verify_resampled = verify_resampled
+        self.calendar = calendar or SessionCalendar()
+        self.critical_strategies = critical_strategies
+        self.follower_orders_path = follower_orders_path
+        self.pool = pool
+        self.bar_caches = {}
+        self.indicator_states = {}
+        self._follower_orders_lock = threading.Lock()
+        self._undelivered = [] # (series index, candle) of candles with signals that were not delivered
+        self._undelivered_lock = threading.Lock()
+
+    # --- Journal -------------------------------------------------------------------------
+
+    def claim_signal(self, symbol: str, timeframe: str, candle: int, side: str, strategy: str = None):
+        '''
+        Records a signal in the journal before it is sent.
+
+        Returns:
+            callable: on_sent callback that marks the signal as delivered, or None if this
+                      signal was already delivered (e.g. before a restart) and must not be sent.
+        '''
+        key = StateJournal.signal_key(symbol, timeframe, candle, side, strategy)
+        if not self.journal.claim_signal(key, symbol, timeframe, candle, side):
+            return None
+        return lambda: self.journal.mark_sent(key)
+
+    def journal_once_delivered(self, i: int, candle: int, state: dict, pending: int):
+        '''
+        Journals the candle `candle` of series `i` as processed (with the indicator `state`) once
+        its `pending` signals were delivered: at once if there are none, otherwise from the returned
+        (on_sent, on_failed) callbacks, one of which must be called once per signal. If a signal
+        was not delivered, the candle stays unjournaled and, once every signal has an outcome,
+        the series is queued for resend_undelivered().
+        '''
+        symbol, timeframe = self.symbol_table.series(i)
+        if pending == 0:
+            self.journal.record_series(symbol, timeframe, candle, state)
+            return None, None
+        outcome = {'remaining': pending, 'failed': 0}
+        lock = threading.Lock()
+        def settle(failed: int):
+            with lock: # Outcomes are reported by the Telegram dispatcher thread
+                outcome['remaining'] -= 1
+                outcome['failed'] += failed
+                if outcome['remaining']:
+                    return
+            if not outcome['failed']:
+                self.journal.record_series(symbol, timeframe, candle, state)
+                return
+            print(f"{outcome['failed']} of {pending} signals for {symbol} ({timeframe}) were not delivered. Sending them again.")
+            metrics.inc('signals_undelivered', outcome['failed'], symbol=symbol, timeframe=timeframe)
+            with self._undelivered_lock:
+                self._undelivered.append((i, candle))
+        return (lambda: settle(0)), (lambda: settle(1))
+
+    def resend(self, scheduler, i: int, candle: int, delay: float = 0):
+        '''
+        Makes series `i` due again for its candle `candle` on the CandleScheduler `scheduler`,
+        so it is processed again: claim_signal() skips the signals that were delivered and lets
+        the others be sent again. Does nothing once a newer candle was processed or `candle`
+        has closed.
+
+        Returns:
+            bool: True if the series was scheduled.
+        '''
+        if candle < self.symbol_table.last_processed[i] or scheduler.clock() >= candle + self.symbol_table.period[i]:
+            return False
+        self.symbol_table.last_processed[i] = candle - 1
+        scheduler.candle_open[i] = candle
+        scheduler.retry(i, delay)
+        return True
+
+    def resend_undelivered(self, scheduler, delay: float = 0):
+        '''
+        Schedules every series queued by journal_once_delivered() with resend(), `delay` seconds
+        from now. Call it from the thread that runs the scheduler.
+
+        Returns:
+            int: The number of series scheduled.
+        '''
+        with self._undelivered_lock:
+            undelivered, self._undelivered = self._undelivered, []
+        return sum(self.resend(scheduler, i, candle, delay) for i, candle in dict.fromkeys(undelivered))
+
+    def queue_follower_orders(self, symbol: str, timeframe: str, candle: int, side: str, strategy: str, payloads):
+        '''Appends the follower order payloads of one signal to `follower_orders_path` (payloads may be None).'''
+        if payloads is None or self.follower_orders_path is None:
+            return
+        line = json.dumps({'signal': StateJournal.signal_key(symbol, timeframe, candle, side, strategy),
+                           'orders': [dict(zip(payloads.dtype.names, row)) for row in payloads.tolist()]})
+        with self._follower_orders_lock: # Signals may come from several evaluation workers
+            with open(self.follower_orders_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+    # --- Candles and indicator state -----------------------------------------------------
+
+    def get_bar_cache(self, symbol: str, timeframe: str):
+        '''
+        Returns the BarCache of a series, creating it on first use. Higher timeframes of a
+        symbol with a base timeframe get a ResampledBarCache fed by the base series' cache.
+        '''
+        cache = self.bar_caches.get((symbol, timeframe))
+        if cache is None:
+            base_timeframe = self.base_timeframes.get(symbol)
+            if base_timeframe is None or base_timeframe == timeframe:
+                cache = BarCache(symbol, timeframe, self.history_bars, store=self.store)
+            else:
+                cache = ResampledBarCache(symbol, timeframe, self.get_bar_cache(symbol, base_timeframe), self.history_bars,
+                                          store=self.store, base_max_age=self.sync_max_age, verify=self.verify_resampled)
+            self.bar_caches[(symbol, timeframe)] = cache
+        return cache
+
+    def current_indicator_state(self, symbol: str, timeframe: str, cache, rates):
+        '''
+        Returns the indicator state of a series, or a new IndicatorState if the cache was
+        re-synced or no longer covers the state. The first seed of a cache keeps a state
+        restored from the journal (or built by the pre-warm) if the cache still covers it.
+        '''
+        state = self.indicator_states.get((symbol, timeframe))
+        if state is None or (cache.resynced and cache.generation > 1) or state.last_time is None or \
+           (rates is not None and len(rates) > 0 and state.last_time < rates[0]['time']):
+            return IndicatorState()
+        return state
+
+    def advance_indicator_state(self, symbol: str, timeframe: str, state, rates):
+        '''Feeds the closed candles (all but the forming last one) the state has not seen yet and keeps the state.'''
+        closed = rates[:-1]
+        if state.last_time is not None:
+            closed = closed[closed['time'] > state.last_time]
+        with metrics.time('indicator'), profiler.stage('indicator', symbol):
+            state.update_many(closed['high'], closed['low'], closed['close'], closed['time'])
+        self.indicator_states[(symbol, timeframe)] = state
+
+    # --- Boundary processing -------------------------------------------------------------
+
+    def process_series(self, i: int, bar_close: float = None):
+        '''
+        Processes the newly opened candle of series `i` in the symbol table: advances its
+        indicator state and sends a buy/sell signal if the conditions are met. `bar_close` is
+        the UTC epoch time of the candle boundary, used for the signal latency metric.
+
+        Returns:
+            bool: False if the broker has not opened the new candle yet (the caller may retry),
+                  True otherwise.
+        '''
+        symbol, timeframe = self.symbol_table.series(i)
+
+        # Select symbol on Market Watch (necessary before getting rates/ticks)
+        if not mt5.symbol_select(symbol, True): # True to add if not exists
+            print(f'Failed to select {symbol} on Market Watch, error code={mt5.last_error()}\nShutting down the program...')
+            metrics.inc('errors', stage='symbol_select')
+            mt5.shutdown()
+            sys.exit()
+
+        # Process candles only if symbol has no open positions (snapshot taken once per cycle by process_due)
+        if position_index.has_open(symbol):
+            print(f"Skipping {symbol} as there are open positions already. Waiting for position close or manual intervention.")
+            return True
+
+        # Bring the cached candles up to date; only the candles newer than the cache (or the store) are fetched
+        cache = self.get_bar_cache(symbol, timeframe)
+        with metrics.time('bar_sync', timeframe=timeframe), profiler.stage('fetch', symbol):
+            rates = cache.sync(max_age=self.sync_max_age)
+
+        # Re-seed the indicator state if the cache was re-synced or no longer covers the state
+        state = self.current_indicator_state(symbol, timeframe, cache, rates)
+
+        if rates is None or len(rates) == 0:
+            print(f'Failed to retrieve sufficient historical rates for {symbol} from MT5 terminal. Skipping...')
+            metrics.inc('errors', stage='fetch')
+            return True
+
+        # The last candle returned by MT5 is the one that just opened (UTC epoch seconds)
+        current_candle_time = int(rates[-1]['time'])
+        if current_candle_time <= self.symbol_table.last_processed[i]: # SymbolTable.NO_CANDLE before the first candle
+            metrics.inc('candle_not_ready')
+            return False # The broker has not opened the new candle yet
+
+        print(f"--- Processing new candle for {symbol} ({timeframe}): {datetime.fromtimestamp(current_candle_time, tz=utc)} ---")
+        # Update the last processed candle timestamp for this series
+        self.symbol_table.last_processed[i] = current_candle_time
+
+        # Ensure enough data exists for indicator calculation (min 20 candles: 2 for prev_high/low + ATR period)
+        if state.count == 0 and len(rates) < 20:
+            print(f"Not enough historical data ({len(rates)} candles) for {symbol} to calculate indicators. Skipping.")
+            return True
+
+        # Feed only the closed candles (all but the last one) that the state has not seen yet
+        self.advance_indicator_state(symbol, timeframe, state, rates)
+
+        # Evaluate every strategy on the new candle; they share the candles and the intermediates
+        # (including the indicator state advanced above) computed once for this series
+        with profiler.stage('strategies', symbol):
+            signals = self.strategy_pipeline.evaluate(symbol, timeframe, rates, state)
+
+        # Claim every signal in the journal; signals delivered before a restart are not sent again
+        claims = []
+        for signal in signals:
+            on_sent = self.claim_signal(symbol, timeframe, rates[-1]['time'], signal.side, signal.strategy)
+            if on_sent is None:
+                print(f"{signal.side.capitalize()} signal of {signal.strategy} for {symbol} ({timeframe}) was already sent. Skipping.")
+            else:
+                claims.append((signal, on_sent))
+
+        # The candle is journaled as processed only once all of its signals were delivered. While the candle
+        # is still the newest one, a signal Telegram did not deliver makes the loop process it again and
+        # re-send it (claim_signal() lets a queued but undelivered signal through), as does a restart.
+        journal_sent, journal_failed = self.journal_once_delivered(i, current_candle_time, state.to_dict(), len(claims))
+
+        # Execute Sell/Buy Order for every signal
+        # These functions now send Telegram messages instead of executing trades
+        for signal, on_sent in claims:
+            on_sent = chain_callbacks(on_sent, journal_sent)
+            critical = signal.critical or signal.strategy in self.critical_strategies
+            if signal.side == 'buy':
+                print(f"Buy condition met for {symbol} ({signal.strategy}). Sending buy signal to Telegram...")
+                # Pass the timeframe to the Execute_Buy_Order function
+                payloads = Execute_Buy_Order(symbol=symbol, openp=signal.open, min_val=signal.extreme, avg_val=signal.average,
+                                             timeframe=timeframe, bar_close=bar_close, on_sent=on_sent,
+                                             on_failed=journal_failed, critical=critical)
+            else:
+                print(f"Sell condition met for {symbol} ({signal.strategy}). Sending sell signal to Telegram...")
+                # Pass the timeframe to the Execute_Sell_Order function
+                payloads = Execute_Sell_Order(symbol=symbol, openp=signal.open, max_val=signal.extreme, avg_val=signal.average,
+                                              timeframe=timeframe, bar_close=bar_close, on_sent=on_sent,
+                                              on_failed=journal_failed, critical=critical)
+            self.queue_follower_orders(symbol, timeframe, rates[-1]['time'], signal.side, signal.strategy, payloads)
+        if not signals:
+            print(f"No trade condition met for {symbol}.")
+        return True
+
+    def process_symbol_series(self, due):
+        '''
+        Processes the due series of one symbol, given as (index, bar_close) pairs, one after another.
+
+        Returns:
+            list: Indices of the series whose new candle the broker has not opened yet.
+        '''
+        pending = []
+        for i, bar_close in due:
+            with metrics.time('process_series'):
+                if not self.process_series(i, bar_close=bar_close):
+                    pending.append(i)
+        return pending
+
+    def process_due(self, due, scheduler):
+        '''
+        Processes every due series of the CandleScheduler `scheduler`, grouped by symbol.
+        Symbols outside their trading session are skipped without fetching anything. Open
+        positions are fetched once for all the others. With an evaluation pool the symbols
+        are processed concurrently (except in a profiled cycle); exceptions raised by a
+        worker (including sys.exit()) are re-raised here. If the open positions cannot be
+        fetched nothing is evaluated, since a stale snapshot could let a duplicate signal through.
+
+        Returns:
+            list: Indices of the series whose new candle the broker has not opened yet, or of
+                  every series evaluated if the positions could not be fetched.
+        '''
+        now = scheduler.clock()
+        groups = []
+        for symbol, indices in self.symbol_table.by_symbol(due):
+            if not self.calendar.is_open(symbol, now):
+                print(f"Skipping {symbol}: outside its trading session.")
+                metrics.inc('session_closed', symbol=symbol)
+                continue
+            groups.append(list(zip(indices.tolist(), scheduler.candle_open[indices].tolist())))
+        if not groups:
+            return []
+        with metrics.time('positions_get'):
+            refreshed = position_index.refresh()
+        if not refreshed:
+            print("Skipping the due series until the open positions can be fetched.")
+            metrics.inc('errors', stage='positions_get')
+            return [i for group in groups for i, _ in group]
+
+        if self.pool is None or len(groups) < 2 or profiler.active:
+            return [i for group in groups for i in self.process_symbol_series(group)]
+
+        futures = [self.pool.submit(self.process_symbol_series, group) for group in groups]
+        pending = []
+        for future in as_completed(futures):
+            pending.extend(future.result())
+        return pending
+
+    # --- Pre-warm ------------------------------------------------------------------------
+
+    def prewarm_symbol_series(self, indices):
+        '''Seeds the bar cache and indicator state of the given series of one symbol, without evaluating signals.'''
+        for i in indices:
+            symbol, timeframe = self.symbol_table.series(i)
+            cache = self.get_bar_cache(symbol, timeframe)
+            rates = cache.sync(max_age=self.sync_max_age)
+            if rates is None or len(rates) < 2:
+                print(f'Could not pre-warm {symbol} ({timeframe}): no historical rates.')
+                continue
+            self.advance_indicator_state(symbol, timeframe, self.current_indicator_state(symbol, timeframe, cache, rates), rates)
+
+    def prewarm_series(self):
+        '''
+        Loads the history and indicator state of every series before the first boundary, on the
+        evaluation pool if there is one, so the first signal costs no more than a steady-state one.
+        '''
+        groups = [indices.tolist() for _, indices in self.symbol_table.by_symbol()]
+        if self.pool is None:
+            for indices in groups:
+                self.prewarm_symbol_series(indices)
+            return
+        for future in as_completed([self.pool.submit(self.prewarm_symbol_series, indices) for indices in groups]):
+            future.result()
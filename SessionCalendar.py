@@ -0,0 +1,218 @@
+import os
+import json
+import bisect
+from datetime import datetime
+from pytz import utc
+
+WEEK_SECONDS = 7 * 86400
+DAY_SECONDS = 86400
+WEEK_ORIGIN = 345600 # 1970-01-05 00:00 UTC, the first Monday after the epoch
+WEEKDAYS = {'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6}
+
+# The window TimeProcessing.MarketIsOpen() applies to every symbol: Sunday 22:00 to Friday 21:59 UTC
+DEFAULT_SESSION = {'weekly': [['Sun 22:00', 'Fri 21:59']]}
+
+COMPILE_WEEKS = 8 # Weeks of open intervals compiled at a time
+
+
+def _weekly_offset(text: str):
+    '''Seconds from Monday 00:00 UTC for "Day HH:MM" (e.g. "Sun 22:00").'''
+    day, clock = text.split()
+    return WEEKDAYS[day[:3].lower()] * DAY_SECONDS + _daily_offset(clock)
+
+
+def _daily_offset(text: str):
+    '''Seconds from 00:00 UTC for "HH:MM".'''
+    hours, minutes = text.split(':')
+    return int(hours) * 3600 + int(minutes) * 60
+
+
+def _instant(text: str):
+    '''UTC epoch seconds for an ISO date or date and time ("2024-12-25" or "2024-12-25T22:00").'''
+    value = datetime.fromisoformat(text)
+    if value.tzinfo is None:
+        value = utc.localize(value)
+    return int(value.timestamp())
+
+
+def _merge(intervals):
+    '''Sorts (start, end) intervals and joins the ones that overlap or touch.'''
+    merged = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _subtract(intervals, holes):
+    '''Removes the merged `holes` from the merged `intervals`.'''
+    result = []
+    k = 0
+    for start, end in intervals:
+        while k < len(holes) and holes[k][1] <= start:
+            k += 1
+        j = k
+        while j < len(holes) and holes[j][0] < end:
+            if holes[j][0] > start:
+                result.append([start, holes[j][0]])
+            start = max(start, holes[j][1])
+            j += 1
+        if start < end:
+            result.append([start, end])
+    return result
+
+
+class Session:
+    '''
+    The trading hours of one instrument, compiled into sorted arrays of open intervals
+    (UTC epoch seconds) so is_open() and next_open() are a binary search. Intervals are
+    compiled COMPILE_WEEKS weeks at a time around the queried time and recompiled when a
+    query leaves that range.
+
+    Args:
+        weekly (list): Open windows as ("Day HH:MM", "Day HH:MM") UTC pairs. A window
+                       ending before it starts wraps into the next week.
+        breaks (list): Daily closed windows as ("HH:MM", "HH:MM") UTC pairs (e.g. a rollover
+                       break); a break ending before it starts runs past midnight.
+        closed (list): Closed periods (holidays) as (start, end) ISO dates or date-times in UTC.
+    '''
+
+    def __init__(self, weekly, breaks=(), closed=()):
+        self.weekly = [(_weekly_offset(start), _weekly_offset(end)) for start, end in weekly]
+        self.breaks = [(_daily_offset(start), _daily_offset(end)) for start, end in breaks]
+        self.closed = _merge((_instant(start), _instant(end)) for start, end in closed)
+
+        self.starts = []     # Open interval starts, sorted
+        self.ends = []       # Matching interval ends (exclusive)
+        self._range = (0, 0) # [from, to) covered by starts/ends
+
+    def _compile(self, t: int):
+        first_week = (t - WEEK_ORIGIN) // WEEK_SECONDS * WEEK_SECONDS + WEEK_ORIGIN - WEEK_SECONDS
+        last = first_week + (COMPILE_WEEKS + 1) * WEEK_SECONDS
+
+        opened = []
+        for week in range(first_week - WEEK_SECONDS, last, WEEK_SECONDS): # The week before may wrap into range
+            for start, end in self.weekly:
+                length = (end - start) % WEEK_SECONDS or WEEK_SECONDS
+                opened.append((week + start, week + start + length))
+        closed = [(day + start, day + start + ((end - start) % DAY_SECONDS or DAY_SECONDS))
+                  for day in range(first_week - DAY_SECONDS, last, DAY_SECONDS) for start, end in self.breaks]
+        closed.extend((start, end) for start, end in self.closed if end > first_week and start < last)
+
+        intervals = [interval for interval in _subtract(_merge(opened), _merge(closed))
+                     if interval[1] > first_week and interval[0] < last]
+        self.starts = [max(start, first_week) for start, _ in intervals]
+        self.ends = [min(end, last) for _, end in intervals]
+        self._range = (first_week, last)
+
+    def _covers(self, t: int):
+        if not self._range[0] <= t < self._range[1]:
+            self._compile(t)
+
+    def is_open(self, t: float):
+        '''Returns True if the instrument trades at UTC epoch time `t`.'''
+        t = int(t)
+        self._covers(t)
+        i = bisect.bisect_right(self.starts, t) - 1
+        return i >= 0 and t < self.ends[i]
+
+    def next_open(self, t: float):
+        '''
+        Returns the first UTC epoch time at or after `t` when the instrument trades (`t`
+        itself if it is open), or None if it does not open within COMPILE_WEEKS weeks.
+        '''
+        t = int(t)
+        for _ in range(2):
+            self._covers(t)
+            i = bisect.bisect_right(self.starts, t) - 1
+            if i >= 0 and t < self.ends[i]:
+                return t
+            if i + 1 < len(self.starts):
+                return self.starts[i + 1]
+            t = self._range[1] # Nothing left in the compiled range: look at the next one
+        return None
+
+
+class SessionCalendar:
+    '''
+    Trading sessions per symbol. Symbols without their own entry use the default session,
+    and symbols with identical definitions share one compiled Session.
+
+    The MetaTrader5 Python API does not expose the symbol session tables, so the sessions
+    are read from a definitions file (see sessions.example.json):
+
+        {
+            "default": {"weekly": [["Sun 22:00", "Fri 21:59"]], "closed": [["2024-12-25", "2024-12-26"]]},
+            "symbols": {
+                "XAUUSD-VIP": {"weekly": [["Sun 23:00", "Fri 21:58"]], "breaks": [["21:59", "23:01"]]}
+            }
+        }
+
+    A symbol entry replaces the default "weekly" and "breaks" lists it defines; its "closed"
+    periods are added to the default ones. Without a file every symbol trades Sunday 22:00
+    to Friday 21:59 UTC, like TimeProcessing.MarketIsOpen().
+    '''
+
+    def __init__(self, definitions: dict = None):
+        definitions = definitions or {}
+        self.default = dict(DEFAULT_SESSION, **(definitions.get('default') or {}))
+        self.definitions = definitions.get('symbols') or {}
+        self._compiled = {} # Canonical definition -> Session
+        self._sessions = {} # symbol -> Session
+
+    @classmethod
+    def load(cls, path: str):
+        '''
+        Reads a definitions file; a missing file gives the default calendar.
+
+        Raises:
+            ValueError: If the file is not valid JSON or a session entry is malformed.
+        '''
+        if not path or not os.path.exists(path):
+            return cls()
+        with open(path, encoding='utf-8') as f:
+            try:
+                calendar = cls(json.load(f))
+            except json.JSONDecodeError as err:
+                raise ValueError(f"Invalid session definitions in {path}: {err}") from None
+        calendar.validate()
+        return calendar
+
+    def validate(self):
+        '''Compiles every defined session once, so malformed entries fail at startup (ValueError).'''
+        for symbol in [None] + list(self.definitions):
+            try:
+                self.session(symbol).is_open(0)
+            except (KeyError, ValueError, TypeError) as err:
+                raise ValueError(f"Invalid session definition for {symbol or 'default'}: {err!r}") from None
+
+    def session(self, symbol: str):
+        '''Returns the compiled Session of `symbol` (the default session for None or unknown symbols).'''
+        session = self._sessions.get(symbol)
+        if session is None:
+            definition = self.definitions.get(symbol) or {}
+            weekly = definition.get('weekly', self.default['weekly'])
+            breaks = definition.get('breaks', self.default.get('breaks', ()))
+            closed = list(self.default.get('closed', ())) + list(definition.get('closed', ()))
+            key = json.dumps([weekly, breaks, closed])
+            session = self._compiled.get(key)
+            if session is None:
+                session = self._compiled[key] = Session(weekly, breaks, closed)
+            self._sessions[symbol] = session
+        return session
+
+    def is_open(self, symbol: str, t: float):
+        return self.session(symbol).is_open(t)
+
+    def next_open(self, symbol: str, t: float):
+        return self.session(symbol).next_open(t)
+
+    def any_open(self, symbols, t: float):
+        '''Returns True if any of `symbols` trades at `t` (each distinct session is checked once).'''
+        sessions = {id(session): session for session in map(self.session, symbols)}
+        return any(session.is_open(t) for session in sessions.values())
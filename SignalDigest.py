@@ -0,0 +1,94 @@
+import threading
+
+from TelegramDispatcher import chain_callbacks
+
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096 # Characters per Telegram message
+
+
+class SignalDigest:
+    '''
+    Collects the signals produced within `window` seconds of the first one and sends them
+    together, so a boundary shared by many timeframes costs one or a few Telegram messages
+    instead of one per signal.
+
+    Every signal is added with its full message and a one-line summary. If the window closes
+    with a single signal its full message is sent unchanged; otherwise the summaries are
+    sorted by priority (highest first, then in arrival order) and packed into as few
+    messages of at most `max_length` characters as possible.
+
+    Args:
+        send (callable): send(text, on_sent, on_failed) queues one Telegram message.
+        window (float): Seconds to wait for more signals after the first one.
+        max_length (int): Maximum characters per message.
+        header (str): First line of every digest message.
+    '''
+
+    def __init__(self, send, window: float = 2.0, max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH,
+                 header: str = '📋 *Signal Digest*'):
+        self.send = send
+        self.window = window
+        self.max_length = max_length
+        self.header = header
+
+        self._lock = threading.Lock()
+        self._entries = []
+        self._sequence = 0
+        self._timer = None
+
+    def add(self, message: str, line: str, priority: float = 0, on_sent=None, on_failed=None):
+        '''
+        Queues a signal for the current window, opening a new window if none is open. The
+        callbacks are passed on with the message that carries the signal.
+        '''
+        with self._lock:
+            self._entries.append((-priority, self._sequence, message, line, on_sent, on_failed))
+            self._sequence += 1
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def pending(self):
+        '''Number of signals waiting for the current window to close.'''
+        with self._lock:
+            return len(self._entries)
+
+    def flush(self):
+        '''Sends everything collected so far (called when the window closes and on exit).'''
+        with self._lock:
+            entries, self._entries = self._entries, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not entries:
+            return
+        entries.sort(key=lambda entry: entry[:2])
+
+        if len(entries) == 1:
+            _, _, message, _, on_sent, on_failed = entries[0]
+            self.send(message, on_sent, on_failed)
+            return
+        for text, sent_callbacks, failed_callbacks in self._pack(entries):
+            self.send(text, chain_callbacks(*sent_callbacks), chain_callbacks(*failed_callbacks))
+
+    def _pack(self, entries):
+        '''Splits the summary lines into messages that fit max_length, headers included.'''
+        # Room for the header line with a "(99 signals, part 9/9)" suffix
+        header_room = len(self.header) + 32
+        parts, lines, sent, failed, length = [], [], [], [], header_room
+        for _, _, _, line, on_sent, on_failed in entries:
+            line = line[:self.max_length - header_room - 1]
+            if lines and length + 1 + len(line) > self.max_length:
+                parts.append((lines, sent, failed))
+                lines, sent, failed, length = [], [], [], header_room
+            lines.append(line)
+            sent.append(on_sent)
+            failed.append(on_failed)
+            length += 1 + len(line)
+        parts.append((lines, sent, failed))
+
+        messages = []
+        for number, (lines, sent, failed) in enumerate(parts, start=1):
+            suffix = f" ({len(entries)} signals" + (f", part {number}/{len(parts)})" if len(parts) > 1 else ")")
+            messages.append(('\n'.join([self.header + suffix] + lines), sent, failed))
+        return messages
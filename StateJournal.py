@@ -0,0 +1,119 @@
+import json
+import sqlite3
+import threading
+from time import time
+
+
+class StateJournal:
+    '''
+    Durable record of the trading loop's progress in an SQLite database (WAL mode), so a
+    restart continues where the previous run stopped instead of treating every series as new.
+
+    For every (symbol, timeframe) series it keeps the open time of the last processed
+    candle and, where available, the serialized IndicatorState. Every signal is recorded
+    under an idempotency key (series, candle and side) before it is queued and marked as
+    sent once Telegram accepted it, so a signal that was delivered is never sent again.
+
+    The connection may be used from several threads; writes are serialized with a lock.
+
+    Args:
+        path (str): Database file. Use ':memory:' for a journal that is not persisted.
+    '''
+
+    def __init__(self, path: str = 'state.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL') # WAL + NORMAL: durable across crashes of the program
+        self._db.execute('''CREATE TABLE IF NOT EXISTS series (
+            symbol TEXT NOT NULL, timeframe TEXT NOT NULL,
+            last_candle INTEGER, state TEXT, updated REAL,
+            PRIMARY KEY (symbol, timeframe))''')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS signals (
+            key TEXT PRIMARY KEY, symbol TEXT, timeframe TEXT, candle INTEGER, side TEXT,
+            status TEXT NOT NULL, queued_at REAL, sent_at REAL)''')
+
+    @staticmethod
+    def signal_key(symbol: str, timeframe: str, candle: int, side: str, strategy: str = None):
+        '''Idempotency key of the signal (of `strategy`) for the candle opened at `candle` (epoch seconds).'''
+        key = f"{symbol}|{timeframe}|{int(candle)}|{side}"
+        return key if strategy is None else f"{key}|{strategy}"
+
+    def load(self):
+        '''
+        Returns:
+            dict: (symbol, timeframe) -> (last processed candle open time or None,
+                  IndicatorState dict from IndicatorState.to_dict() or None).
+        '''
+        with self._lock:
+            rows = self._db.execute('SELECT symbol, timeframe, last_candle, state FROM series').fetchall()
+        return {(symbol, timeframe): (last_candle, json.loads(state) if state else None)
+                for symbol, timeframe, last_candle, state in rows}
+
+    def record_series(self, symbol: str, timeframe: str, last_candle: int, state: dict = None):
+        '''
+        Stores the last processed candle (and the indicator state) of a series. A candle older
+        than the one already stored is ignored, so a late delivery never moves a series back.
+        '''
+        state_json = json.dumps(state) if state is not None else None
+        with self._lock:
+            self._db.execute('''INSERT INTO series (symbol, timeframe, last_candle, state, updated)
+                                VALUES (?, ?, ?, ?, ?)
+                                ON CONFLICT (symbol, timeframe) DO UPDATE SET
+                                last_candle = excluded.last_candle, state = excluded.state, updated = excluded.updated
+                                WHERE series.last_candle IS NULL OR excluded.last_candle >= series.last_candle''',
+                             (symbol, timeframe, int(last_candle), state_json, time()))
+
+    def claim_signal(self, key: str, symbol: str = None, timeframe: str = None, candle: int = None, side: str = None):
+        '''
+        Records a signal before it is queued.
+
+        Returns:
+            bool: False if the signal with this key was already delivered (do not send it again).
+                  A signal that was queued but never delivered (e.g. the program stopped first)
+                  can be claimed again.
+        '''
+        with self._lock:
+            row = self._db.execute('SELECT status FROM signals WHERE key = ?', (key,)).fetchone()
+            if row is not None and row[0] == 'sent':
+                return False
+            self._db.execute('''INSERT OR REPLACE INTO signals (key, symbol, timeframe, candle, side, status, queued_at)
+                                VALUES (?, ?, ?, ?, ?, 'queued', ?)''',
+                             (key, symbol, timeframe, None if candle is None else int(candle), side, time()))
+            return True
+
+    def mark_sent(self, key: str):
+        '''Marks a claimed signal as delivered.'''
+        with self._lock:
+            self._db.execute("UPDATE signals SET status = 'sent', sent_at = ? WHERE key = ?", (time(), key))
+
+    def signal_status(self, key: str):
+        '''Returns 'queued', 'sent' or None if the signal is unknown.'''
+        with self._lock:
+            row = self._db.execute('SELECT status FROM signals WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def signal_keys(self, status: str = None):
+        '''Returns the keys of the journaled signals (only those with `status` if given), sorted.'''
+        with self._lock:
+            if status is None:
+                rows = self._db.execute('SELECT key FROM signals ORDER BY key').fetchall()
+            else:
+                rows = self._db.execute('SELECT key FROM signals WHERE status = ? ORDER BY key', (status,)).fetchall()
+        return [key for key, in rows]
+
+    def undelivered_signals(self):
+        '''Returns the distinct (symbol, timeframe, candle) of the signals that were queued but never delivered.'''
+        with self._lock:
+            return self._db.execute('''SELECT DISTINCT symbol, timeframe, candle FROM signals
+                                       WHERE status = 'queued' ORDER BY candle''').fetchall()
+
+    def prune_signals(self, older_than: float):
+        '''Deletes signals queued before `older_than` (epoch seconds); they can no longer be re-sent.'''
+        with self._lock:
+            self._db.execute('DELETE FROM signals WHERE queued_at < ?', (older_than,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
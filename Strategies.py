@@ -0,0 +1,190 @@
+import numpy as np
+from collections import namedtuple
+
+from DataProcessing import ATR, IndicatorState
+
+# A strategy's decision for the bar that just opened. `extreme` is the band the entry is
+# measured against (the minimum line for buys, the maximum line for sells), like the
+# min_val / max_val arguments of Execute_Buy_Order / Execute_Sell_Order. A `critical` signal is
+# sent at once in its own message instead of waiting for the signal digest.
+Signal = namedtuple('Signal', ['strategy', 'side', 'open', 'extreme', 'average', 'critical'], defaults=(False,))
+
+
+# --- Intermediates -------------------------------------------------------------------
+# Functions computing one shared value of a series for the current bar from a BarContext.
+# They are registered under a name and called with the parameters a strategy asks for.
+
+INTERMEDIATES = {}
+
+def intermediate(name: str):
+    '''Registers the decorated function as the intermediate `name`.'''
+    def register(func):
+        INTERMEDIATES[name] = func
+        return func
+    return register
+
+
+def _read_only(value):
+    if isinstance(value, np.ndarray):
+        value = value.view()
+        value.flags.writeable = False
+    return value
+
+
+@intermediate('open')
+def _open(ctx):
+    '''Open of the bar that just opened.'''
+    return float(ctx.rates[-1]['open'])
+
+
+@intermediate('prior_bar')
+def _prior_bar(ctx):
+    '''(high, low) of the last closed bar.'''
+    return float(ctx.rates[-2]['high']), float(ctx.rates[-2]['low'])
+
+
+@intermediate('hl2')
+def _hl2(ctx):
+    '''(high + low) / 2 of every closed bar.'''
+    closed = ctx.closed
+    return (closed['high'] + closed['low']) / 2
+
+
+@intermediate('atr')
+def _atr(ctx, period: int):
+    '''Wilder ATR(period) of every closed bar (TA-Lib).'''
+    closed = ctx.closed
+    return ATR(high=closed['high'].astype(np.float64), low=closed['low'].astype(np.float64),
+               close=closed['close'].astype(np.float64), timeperiod=period)
+
+
+@intermediate('indicator')
+def _indicator(ctx, atr_period: int = 18, atr_multiplier: float = 5):
+    '''
+    IndicatorState advanced over every closed bar. The trading loop's own streaming state is
+    used when its parameters match, otherwise a state is built from the cached bars.
+    '''
+    state = ctx.indicator_state
+    if state is not None and state.atr_period == atr_period and state.atr_multiplier == atr_multiplier:
+        return state
+    state = IndicatorState(atr_period, atr_multiplier)
+    closed = ctx.closed
+    state.update_many(closed['high'], closed['low'], closed['close'], closed['time'])
+    return state
+
+
+@intermediate('bands')
+def _bands(ctx, atr_period: int = 18, atr_multiplier: float = 5):
+    '''(upper, lower) ATR bands of the Indicator recurrence for the last closed bar.'''
+    state = ctx.get('indicator', atr_period, atr_multiplier)
+    return state.upper, state.lower
+
+
+class BarContext:
+    '''
+    The intermediates of one series for one bar. Each distinct (name, *params) is computed
+    at most once and the same (read-only) value is handed to every strategy.
+
+    Args:
+        rates: Cached candles of the series, oldest first; the last one is the bar that just opened.
+        indicator_state (IndicatorState, optional): The series' streaming state, already advanced
+                                                    over the closed candles.
+    '''
+
+    def __init__(self, symbol: str, timeframe: str, rates, indicator_state=None):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.rates = _read_only(rates)
+        self.closed = self.rates[:-1]
+        self.indicator_state = indicator_state
+        self._values = {}
+
+    def get(self, name: str, *params):
+        key = (name,) + params
+        if key not in self._values:
+            self._values[key] = _read_only(INTERMEDIATES[name](self, *params))
+        return self._values[key]
+
+
+# --- Strategies ----------------------------------------------------------------------
+
+STRATEGIES = {}
+
+def register_strategy(cls):
+    '''Class decorator that makes a Strategy available by its `name`.'''
+    for key in cls.requires:
+        if key[0] not in INTERMEDIATES:
+            raise ValueError(f"Strategy {cls.name} requires unknown intermediate {key[0]!r}")
+    STRATEGIES[cls.name] = cls
+    return cls
+
+
+class Strategy:
+    '''
+    Base class of the strategy plugins. `requires` lists the intermediates the strategy
+    reads, as (name, *params) tuples; evaluate() reads them with ctx.get(name, *params)
+    and returns a Signal or None. Strategies must not modify the values they are given.
+    Signals of a strategy with `critical` set bypass the signal digest.
+    '''
+
+    name = None
+    requires = ()
+    critical = False
+
+    def evaluate(self, ctx: BarContext):
+        raise NotImplementedError
+
+
+@register_strategy
+class IndicatorBands(Strategy):
+    '''
+    The original Indicator rules, evaluated on the last closed bar when a new bar opens:
+        buy:  prv_low <= minimum and curr_open < average
+        sell: prv_high >= maximum and curr_open > average
+    '''
+
+    name = 'indicator_bands'
+    requires = (('indicator', 18, 5), ('prior_bar',), ('open',))
+
+    def evaluate(self, ctx: BarContext):
+        maximum, minimum, average = ctx.get('indicator', 18, 5).value()
+        if np.isnan(maximum) or np.isnan(minimum) or np.isnan(average):
+            return None
+        prv_high, prv_low = ctx.get('prior_bar')
+        curr_open = ctx.get('open')
+
+        if prv_low <= minimum and curr_open < average:
+            return Signal(self.name, 'buy', curr_open, minimum, average, self.critical)
+        if prv_high >= maximum and curr_open > average:
+            return Signal(self.name, 'sell', curr_open, maximum, average, self.critical)
+        return None
+
+
+class StrategyPipeline:
+    '''
+    Evaluates several strategies on the same bar. The intermediates every strategy declares
+    are computed once per series per bar from the bars the trading loop already fetched.
+
+    Args:
+        strategies (list): Strategy instances or registered strategy names.
+    '''
+
+    def __init__(self, strategies):
+        self.strategies = [STRATEGIES[strategy]() if isinstance(strategy, str) else strategy
+                           for strategy in strategies]
+        self.requires = list(dict.fromkeys(key for strategy in self.strategies for key in strategy.requires))
+
+    def evaluate(self, symbol: str, timeframe: str, rates, indicator_state=None):
+        '''
+        Returns:
+            list: The Signal of every strategy that signals on this bar, in strategy order.
+        '''
+        ctx = BarContext(symbol, timeframe, rates, indicator_state)
+        for key in self.requires:
+            ctx.get(*key)
+        signals = []
+        for strategy in self.strategies:
+            signal = strategy.evaluate(ctx)
+            if signal is not None:
+                signals.append(signal)
+        return signals
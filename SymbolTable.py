@@ -0,0 +1,130 @@
+import numpy as np
+
+from TimeProcessing import TIMEFRAME_SECONDS
+
+# Timeframes are interned in the order of TIMEFRAME_SECONDS
+TIMEFRAMES = list(TIMEFRAME_SECONDS)                      # timeframe id -> timeframe
+TIMEFRAME_IDS = {tframe: i for i, tframe in enumerate(TIMEFRAMES)}
+TIMEFRAME_PERIODS = np.array([TIMEFRAME_SECONDS[tframe] for tframe in TIMEFRAMES], dtype=np.int64)
+
+NO_CANDLE = -1 # last_processed of a series that has not processed a candle yet
+
+
+class SymbolTable:
+    '''
+    Registry of the (symbol, timeframe) series the bot tracks, kept as parallel arrays
+    (struct of arrays) so per-series state stays a few bytes per series and scans over
+    thousands of series are vectorized:
+
+        symbol_id       int32  Interned symbol (see symbols / symbol_ids)
+        timeframe_id    int8   Interned timeframe (see TIMEFRAMES)
+        period          int64  Candle length in seconds
+        last_processed  int64  Open time (UTC epoch) of the last processed candle, or NO_CANDLE
+
+    Series are addressed by their index, which is also their index in the CandleScheduler.
+    Adding a series that is already registered returns its existing index.
+
+    Args:
+        series (iterable): (symbol, timeframe) pairs to register.
+        capacity (int): Initial number of rows; the arrays grow by doubling.
+    '''
+
+    def __init__(self, series=(), capacity: int = 64):
+        self.symbols = []    # symbol id -> symbol
+        self.symbol_ids = {} # symbol -> symbol id
+        self._rows = {}      # (symbol id, timeframe id) -> series index
+        self._size = 0
+        self._symbol_id = np.empty(capacity, dtype=np.int32)
+        self._timeframe_id = np.empty(capacity, dtype=np.int8)
+        self._last_processed = np.empty(capacity, dtype=np.int64)
+        for symbol, timeframe in series:
+            self.add(symbol, timeframe)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        '''Yields the (symbol, timeframe) pair of every series, in index order.'''
+        for symbol_id, timeframe_id in zip(self.symbol_id.tolist(), self.timeframe_id.tolist()):
+            yield self.symbols[symbol_id], TIMEFRAMES[timeframe_id]
+
+    # Views of the used rows; they stay valid until the next add()
+    @property
+    def symbol_id(self):
+        return self._symbol_id[:self._size]
+
+    @property
+    def timeframe_id(self):
+        return self._timeframe_id[:self._size]
+
+    @property
+    def last_processed(self):
+        return self._last_processed[:self._size]
+
+    @property
+    def period(self):
+        return TIMEFRAME_PERIODS[self.timeframe_id]
+
+    def intern(self, symbol: str):
+        '''Returns the id of `symbol`, assigning the next free id to a new symbol.'''
+        symbol_id = self.symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self.symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return symbol_id
+
+    def add(self, symbol: str, timeframe: str):
+        '''
+        Registers a series and returns its index.
+
+        Raises:
+            ValueError: If `timeframe` is not one of TIMEFRAMES.
+        '''
+        timeframe_id = TIMEFRAME_IDS.get(timeframe)
+        if timeframe_id is None:
+            raise ValueError(f"Unknown timeframe {timeframe!r} for {symbol}: expected one of {', '.join(TIMEFRAMES)}")
+        key = (self.intern(symbol), timeframe_id)
+        index = self._rows.get(key)
+        if index is not None:
+            return index
+
+        if self._size == len(self._symbol_id):
+            capacity = 2 * max(self._size, 1)
+            self._symbol_id = np.resize(self._symbol_id, capacity)
+            self._timeframe_id = np.resize(self._timeframe_id, capacity)
+            self._last_processed = np.resize(self._last_processed, capacity)
+        index = self._rows[key] = self._size
+        self._symbol_id[index], self._timeframe_id[index] = key
+        self._last_processed[index] = NO_CANDLE
+        self._size += 1
+        return index
+
+    def index(self, symbol: str, timeframe: str):
+        '''Returns the index of a series, or None if it is not registered.'''
+        symbol_id, timeframe_id = self.symbol_ids.get(symbol), TIMEFRAME_IDS.get(timeframe)
+        if symbol_id is None or timeframe_id is None:
+            return None
+        return self._rows.get((symbol_id, timeframe_id))
+
+    def series(self, index: int):
+        '''Returns the (symbol, timeframe) pair of series `index`.'''
+        return self.symbols[self._symbol_id[index]], TIMEFRAMES[self._timeframe_id[index]]
+
+    def by_symbol(self, indices=None):
+        '''
+        Groups series indices (all series by default) by symbol, keeping their order within
+        each symbol.
+
+        Returns:
+            list: (symbol, array of series indices) pairs, in order of first appearance.
+        '''
+        indices = np.arange(self._size) if indices is None else np.asarray(indices, dtype=np.intp)
+        if len(indices) == 0:
+            return []
+        symbol_ids = self._symbol_id[indices]
+        order = np.argsort(symbol_ids, kind='stable')
+        starts = np.flatnonzero(np.diff(symbol_ids[order], prepend=-1))
+        groups = np.split(indices[order], starts[1:])
+        # The stable sort keeps the first series of every symbol at the start of its group
+        first_seen = np.argsort(order[starts], kind='stable')
+        return [(self.symbols[self._symbol_id[groups[k][0]]], groups[k]) for k in first_seen.tolist()]
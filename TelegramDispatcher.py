@@ -0,0 +1,212 @@
+import queue
+import threading
+import requests
+from time import sleep, monotonic
+
+from Metrics import metrics
+
+STOP_POLL_INTERVAL = 0.5 # Seconds the worker waits for a message before checking for stop()
+
+
+def chain_callbacks(*callbacks):
+    '''Combines the given on_sent or on_failed callbacks (None entries are skipped) into one, or None.'''
+    callbacks = [callback for callback in callbacks if callback is not None]
+    if len(callbacks) <= 1:
+        return callbacks[0] if callbacks else None
+    def run():
+        for callback in callbacks:
+            callback()
+    return run
+
+
+class TokenBucket:
+    '''
+    Simple token bucket: `rate` tokens per second, holding at most `capacity` tokens.
+    '''
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+
+    def reserve(self):
+        '''
+        Takes one token and returns how many seconds the caller has to wait before
+        using it (0 if a token was available).
+        '''
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class TelegramDispatcher:
+    '''
+    Sends Telegram messages from a background worker thread so the trading loop never
+    waits on the Telegram API.
+
+    Messages go into a bounded queue that one worker drains in order. The worker reuses
+    keep-alive connections through a requests.Session, respects Telegram's global and
+    per-chat send limits with token buckets, and retries 429 responses (using the
+    `retry_after` the API returns) and 5xx/connection errors with exponential backoff.
+
+    Args:
+        bot_token (str): Telegram bot token.
+        api_url (str): Base URL of the Bot API. Point it at a local HTTP stand-in for testing.
+        max_queue (int): Maximum number of pending messages. submit() drops messages beyond it.
+        global_rate (float): Messages per second allowed across all chats (Telegram: ~30/s).
+        chat_rate (float): Messages per second allowed per chat (Telegram groups: 20/min).
+        chat_burst (int): Messages a chat may receive back to back before chat_rate applies.
+        max_retries (int): Retries per message for 429, 5xx and connection errors.
+        timeout (float): HTTP timeout per request in seconds.
+    '''
+
+    def __init__(self, bot_token: str, api_url: str = 'https://api.telegram.org', max_queue: int = 1000,
+                 global_rate: float = 30.0, chat_rate: float = 20 / 60, chat_burst: int = 3,
+                 max_retries: int = 5, timeout: float = 10.0):
+        self.bot_token = bot_token
+        self.api_url = api_url.rstrip('/')
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._session = requests.Session()
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = {}
+        self._worker = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        '''Starts the worker thread (no-op if it is already running).'''
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stopping.clear()
+                self._worker = threading.Thread(target=self._run, name='telegram-dispatcher', daemon=True)
+                self._worker.start()
+
+    def submit(self, chat_id: str, text: str, parse_mode: str = 'Markdown', on_sent=None, on_failed=None):
+        '''
+        Queues a message and returns immediately. `on_sent` is called from the worker
+        thread once the message has been delivered. `on_failed` is called if it never will
+        be: from the worker when the API rejects it or the retries run out, or right here
+        when the queue is full.
+
+        Returns:
+            bool: True if the message was queued, False if the queue is full.
+        '''
+        self.start()
+        try:
+            self._queue.put_nowait(({'chat_id': chat_id, 'text': text, 'parse_mode': parse_mode}, on_sent, on_failed))
+            return True
+        except queue.Full:
+            print(f"Telegram queue is full ({self._queue.maxsize} messages). Dropping message.")
+            metrics.inc('telegram_dropped')
+            if on_failed is not None:
+                on_failed()
+            return False
+
+    def flush(self, timeout: float = None):
+        '''
+        Waits until every queued message has been sent (or given up on).
+
+        Returns:
+            bool: True if the queue was drained within `timeout` seconds.
+        '''
+        deadline = None if timeout is None else monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and monotonic() >= deadline:
+                return False
+            sleep(0.01)
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        '''
+        Flushes pending messages, stops the worker and closes the HTTP session. Returns
+        within about 2 * `timeout` seconds even if Telegram is unreachable; messages still
+        queued then are dropped.
+        '''
+        drained = self.flush(timeout)
+        if self._worker is not None and self._worker.is_alive():
+            self._stopping.set()
+            try:
+                self._queue.put_nowait(None) # Wakes an idle worker at once
+            except queue.Full:
+                pass # The worker sees the stop event after its current message
+            self._worker.join(timeout)
+        self._session.close()
+        return drained
+
+    def _wait_for_slot(self, chat_id: str):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        delay = max(self._global_bucket.reserve(), bucket.reserve())
+        if delay > 0:
+            sleep(delay)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                item = self._queue.get(timeout=STOP_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            try:
+                if item is None:
+                    return
+                payload, on_sent, on_failed = item
+                callback = on_sent if self._deliver(payload) else on_failed
+                if callback is not None:
+                    callback()
+            except Exception as err: # The worker must survive anything a single message does
+                print(f"Other error sending Telegram message: {err}")
+                metrics.inc('errors', stage='telegram')
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, payload: dict):
+        url = f"{self.api_url}/bot{self.bot_token}/sendMessage"
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_slot(payload['chat_id'])
+            backoff = min(2 ** attempt, 60)
+            try:
+                with metrics.time('telegram_post'):
+                    response = self._session.post(url, json=payload, timeout=self.timeout)
+            except requests.exceptions.RequestException as err:
+                print(f"Connection error sending Telegram message: {err}. Retrying in {backoff}s...")
+                metrics.inc('telegram_retries', reason='connection')
+                sleep(backoff)
+                continue
+
+            if response.status_code == 429:
+                # Telegram tells us how long to back off in parameters.retry_after
+                try:
+                    retry_after = response.json().get('parameters', {}).get('retry_after', backoff)
+                except ValueError:
+                    retry_after = backoff
+                print(f"Telegram rate limit hit. Retrying in {retry_after}s...")
+                metrics.inc('telegram_retries', reason='rate_limit')
+                sleep(retry_after)
+                continue
+            if response.status_code >= 500:
+                print(f"Telegram server error {response.status_code}. Retrying in {backoff}s...")
+                metrics.inc('telegram_retries', reason='server_error')
+                sleep(backoff)
+                continue
+            if not response.ok:
+                print(f"HTTP error sending Telegram message: {response.status_code} - {response.text}")
+                metrics.inc('errors', stage='telegram')
+                return False
+
+            print(f"Telegram message sent successfully. Response: {response.json()}")
+            metrics.inc('telegram_sent')
+            return True
+
+        print(f"Giving up on Telegram message after {self.max_retries + 1} attempts.")
+        metrics.inc('errors', stage='telegram')
+        return False
@@ -1,14 +1,110 @@
-import MetaTrader5 as mt5
+import numpy as np
+from Broker import mt5
+from time import sleep, monotonic, perf_counter
 from pytz import utc # For UTC timezone awareness
 from datetime import datetime, time, timedelta # Added timedelta for more robust time calcs
 
+# Length of one candle in seconds for every supported trading timeframe
+TIMEFRAME_SECONDS = {
+    '1m': 60, '3m': 180, '5m': 300, '15m': 900, '30m': 1800,
+    '1h': 3600, '2h': 7200, '3h': 10800, '4h': 14400, '1d': 86400,
+}
 
-def MarketIsOpen():
+# MetaTrader5 timeframe constant of every trading timeframe, looked up on the active broker
+MT5_TIMEFRAMES = {
+    '1m': 'TIMEFRAME_M1', '3m': 'TIMEFRAME_M3', '5m': 'TIMEFRAME_M5', '15m': 'TIMEFRAME_M15', '30m': 'TIMEFRAME_M30',
+    '1h': 'TIMEFRAME_H1', '2h': 'TIMEFRAME_H2', '3h': 'TIMEFRAME_H3', '4h': 'TIMEFRAME_H4', '1d': 'TIMEFRAME_D1',
+}
+
+
+class SystemClock:
+    '''The wall clock. Used by the trading loop unless another clock is installed with set_clock().'''
+
+    def time(self):
+        '''Current UTC epoch time in seconds.'''
+        return datetime.now(tz=utc).timestamp()
+
+    def now(self):
+        '''Current time as a timezone-aware UTC datetime.'''
+        return datetime.now(tz=utc)
+
+    def monotonic(self):
+        return monotonic()
+
+    def sleep(self, seconds: float):
+        sleep(seconds)
+
+
+class ClockStopped(Exception):
+    '''Raised by VirtualClock.sleep() when the sleep would go past the end of the clock.'''
+
+
+class VirtualClock:
+    '''
+    Clock for replaying a recorded session as fast as possible. Sleeping moves the clock
+    forward instantly; between sleeps it runs at real speed, so the time spent processing
+    a cycle still shows in the measured latencies.
+
+    Args:
+        start (float): UTC epoch time the clock starts at.
+        end (float, optional): UTC epoch time after which sleep() raises ClockStopped.
+    '''
+
+    def __init__(self, start: float, end: float = None):
+        self.end = end
+        self._origin = (float(start), perf_counter()) # (virtual time, perf_counter) at the last jump
+
+    def time(self):
+        virtual, real = self._origin
+        return virtual + (perf_counter() - real)
+
+    def now(self):
+        return datetime.fromtimestamp(self.time(), tz=utc)
+
+    def monotonic(self):
+        return self.time()
+
+    def sleep(self, seconds: float):
+        target = self.time() + max(seconds, 0)
+        if self.end is not None and target > self.end:
+            raise ClockStopped(f"Virtual clock reached its end ({datetime.fromtimestamp(self.end, tz=utc)})")
+        self._origin = (target, perf_counter())
+
+
+# --- Active clock ----------------------------------------------------------------------
+
+_active_clock = SystemClock()
+
+def set_clock(new_clock):
+    '''Installs the clock used by every module through `TimeProcessing.clock`.'''
+    global _active_clock
+    _active_clock = new_clock
+
+def get_clock():
+    return _active_clock
+
+
+class _ClockProxy:
+    '''Forwards every attribute to the active clock, like Broker.mt5 does for the broker.'''
+
+    def __getattr__(self, name):
+        return getattr(_active_clock, name)
+
+
+# Time source of the trading loop: clock.time(), clock.now(), clock.monotonic() and clock.sleep()
+clock = _ClockProxy()
+
+
+def MarketIsOpen(date_now_utc: datetime = None):
     '''
     This function checks if the forex market is currently open based on UTC time.
     Forex market typically opens Sunday 22:00 UTC and closes Friday 21:59 UTC.
+
+    Args:
+        date_now_utc (datetime, optional): UTC time to check. Defaults to the current time.
     '''
-    date_now_utc = datetime.now(tz=utc)
+    if date_now_utc is None:
+        date_now_utc = clock.now()
     time_now_utc = date_now_utc.time()
     
     # Define market open and close times in UTC
@@ -33,6 +129,16 @@ def MarketIsOpen():
     # Otherwise, the market is considered open
     return True
 
+def NextMarketOpen(date_utc: datetime):
+    '''
+    Returns the first UTC time at or after `date_utc` when MarketIsOpen() is True
+    (the market reopens Sunday 22:00 UTC).
+    '''
+    if MarketIsOpen(date_utc):
+        return date_utc
+    days_until_sunday = (6 - date_utc.weekday()) % 7
+    return (date_utc + timedelta(days=days_until_sunday)).replace(hour=22, minute=0, second=0, microsecond=0)
+
 def NewCandleUpdate(tframe: str):
     '''
     Returns True if the current UTC system time aligns with the start of a new candle
@@ -46,35 +152,16 @@ def NewCandleUpdate(tframe: str):
     Returns:
         bool: True if a new candle interval has just started, False otherwise.
     '''
-    date_now_utc = datetime.now(tz=utc)
-    current_minute = date_now_utc.minute
-    current_hour = date_now_utc.hour
-
-    if tframe == '1m':
-        return (current_minute % 1 == 0)
-    elif tframe == '3m':
-        return (current_minute % 3 == 0)
-    elif tframe == '5m':
-        return (current_minute % 5 == 0)
-    elif tframe == '15m':
-        return (current_minute % 15 == 0)
-    elif tframe == '30m':
-        return (current_minute % 30 == 0)
-    elif tframe == '1h':
-        return (current_minute == 0)
-    elif tframe == '2h':
-        return (current_minute == 0 and current_hour % 2 == 0)
-    elif tframe == '3h':
-        return (current_minute == 0 and current_hour % 3 == 0)
-    elif tframe == '4h':
-        return (current_minute == 0 and current_hour % 4 == 0)
-    elif tframe == '1d':
-        # Daily candle typically opens at 00:00 UTC
-        return (current_minute == 0 and current_hour == 0)
-    else:
+    period = TIMEFRAME_SECONDS.get(tframe)
+    if period is None:
         print(f'Invalid timeframe input: {tframe}. Please use a valid timeframe from the list (5m, 15m, 30m, 1h, 2h, 3h, 4h, 1d).')
         return False # Should not happen with validated input
 
+    # Candles are aligned to UTC midnight, so a boundary is a whole number of periods into the day
+    date_now_utc = clock.now()
+    minute_of_day = date_now_utc.hour * 60 + date_now_utc.minute
+    return (minute_of_day * 60) % period == 0
+
 
 def get_mt5_interval(trading_frame: str):
     '''
@@ -87,26 +174,153 @@ def get_mt5_interval(trading_frame: str):
         int: The MetaTrader5 timeframe constant (e.g., mt5.TIMEFRAME_M15).
              Returns None if the input timeframe is not recognized.
     '''
-    if trading_frame == '1m':
-        return mt5.TIMEFRAME_M1
-    elif trading_frame == '3m':
-        return mt5.TIMEFRAME_M3
-    elif trading_frame == '5m':
-        return mt5.TIMEFRAME_M5
-    elif trading_frame == '15m':
-        return mt5.TIMEFRAME_M15
-    elif trading_frame == '30m':
-        return mt5.TIMEFRAME_M30
-    elif trading_frame == '1h':
-        return mt5.TIMEFRAME_H1
-    elif trading_frame == '2h':
-        return mt5.TIMEFRAME_H2
-    elif trading_frame == '3h':
-        return mt5.TIMEFRAME_H3
-    elif trading_frame == '4h':
-        return mt5.TIMEFRAME_H4
-    elif trading_frame == '1d':
-        return mt5.TIMEFRAME_D1
-    else:
+    name = MT5_TIMEFRAMES.get(trading_frame)
+    if name is None:
         print(f"Error: Unknown trading timeframe '{trading_frame}'.")
         return None
+    return getattr(mt5, name)
+
+
+def NextCandleOpen(tframe: str, after_ts: float):
+    '''
+    Returns the UTC epoch timestamp of the first candle boundary of `tframe` strictly
+    after `after_ts`, skipping boundaries that fall while the market is closed.
+    Boundaries are aligned to UTC the same way NewCandleUpdate() checks them
+    (e.g. every 15 minutes, every 4th hour, midnight for daily candles).
+    '''
+    period = TIMEFRAME_SECONDS[tframe]
+    boundary = (int(after_ts) // period + 1) * period
+    boundary_utc = datetime.fromtimestamp(boundary, tz=utc)
+    if not MarketIsOpen(boundary_utc):
+        reopen = NextMarketOpen(boundary_utc).timestamp()
+        boundary = -(-int(reopen) // period) * period # First boundary at or after the reopen
+    return boundary
+
+
+def NextCandleOpens(periods, after_ts: float, session_ids=None, sessions=None):
+    '''
+    Vectorized NextCandleOpen() for an array of candle periods (seconds) sharing the same
+    `after_ts`. The market-hours check runs once per distinct boundary, not once per series.
+
+    With `sessions` (SessionCalendar.Session objects) and `session_ids` (index into `sessions`
+    for every period), boundaries are checked against each series' own trading session
+    instead of MarketIsOpen(), once per distinct (session, boundary) pair.
+
+    Returns:
+        np.ndarray: int64 UTC epoch boundaries, aligned with `periods`.
+    '''
+    periods = np.asarray(periods, dtype=np.int64)
+    boundaries = (int(after_ts) // periods + 1) * periods
+    if sessions is not None:
+        session_ids = np.asarray(session_ids, dtype=np.int64)
+        for key in np.unique(boundaries * len(sessions) + session_ids).tolist():
+            boundary, session_id = divmod(key, len(sessions))
+            session = sessions[session_id]
+            if session.is_open(boundary):
+                continue
+            closed = (boundaries == boundary) & (session_ids == session_id)
+            for period in np.unique(periods[closed]).tolist():
+                boundaries[closed & (periods == period)] = _next_session_boundary(session, period, boundary)
+        return boundaries
+    for boundary in np.unique(boundaries).tolist():
+        boundary_utc = datetime.fromtimestamp(boundary, tz=utc)
+        if not MarketIsOpen(boundary_utc):
+            closed = boundaries == boundary
+            reopen = int(NextMarketOpen(boundary_utc).timestamp())
+            boundaries[closed] = -(-reopen // periods[closed]) * periods[closed] # First boundary at or after the reopen
+    return boundaries
+
+
+def _next_session_boundary(session, period: int, boundary: int):
+    '''First candle boundary of `period` at or after `boundary` that falls inside `session`.'''
+    for _ in range(16): # A boundary after a reopen can still hit a short break; give up after a few
+        reopen = session.next_open(boundary)
+        if reopen is None or reopen == boundary:
+            break # Open, or closed for longer than the session calendar looks ahead
+        boundary = -(-reopen // period) * period
+    return boundary
+
+
+class CandleScheduler:
+    '''
+    Keeps the next candle boundary of every (symbol, timeframe) series in an array and
+    sleeps exactly until the earliest one, instead of polling the clock. Each series is
+    returned once per candle, `settle_delay` seconds after its boundary so the broker has
+    time to open the new candle. Due series are selected with one vectorized comparison,
+    so a cycle costs the same few array operations for thousands of series.
+
+    Args:
+        series (iterable): (symbol, timeframe) pairs, indexed the same way as the symbol table.
+        settle_delay (float): Seconds to wait after a boundary before the series is due.
+        max_sleep (float): Longest single sleep, so the caller can still run housekeeping
+                           (connection checks, market-close handling) during long gaps.
+        calendar (SessionCalendar, optional): Per-symbol trading sessions. Boundaries at which
+                           a symbol does not trade are skipped; without a calendar every series
+                           follows MarketIsOpen().
+    '''
+
+    def __init__(self, series, settle_delay: float = 2.0, max_sleep: float = 300.0, clock=None, sleeper=None,
+                 calendar=None):
+        series = list(series)
+        self.periods = np.array([TIMEFRAME_SECONDS[tframe] for _, tframe in series], dtype=np.int64)
+        self.sessions = None    # Distinct trading sessions of the series (with a calendar)
+        self.session_ids = None # Index into self.sessions for every series
+        if calendar is not None:
+            sessions = [calendar.session(symbol) for symbol, _ in series]
+            ids = {}
+            self.session_ids = np.array([ids.setdefault(id(session), len(ids)) for session in sessions], dtype=np.int64)
+            self.sessions = list({id(session): session for session in sessions}.values())
+        self.settle_delay = settle_delay
+        self.max_sleep = max_sleep
+        self.clock = clock or (lambda: _active_clock.time())
+        self.sleeper = sleeper or (lambda seconds: _active_clock.sleep(seconds))
+
+        self.candle_open = np.zeros(len(self.periods), dtype=np.int64) # Boundary that made each series due last time
+        self.next_open = NextCandleOpens(self.periods, self.clock(), self.session_ids, self.sessions) # Next boundary of every series
+        self.retry_at = np.full(len(self.periods), np.inf)             # Pending retry deadline, inf if none
+
+    def next_deadline(self):
+        '''Returns the epoch time of the earliest pending deadline, or None if nothing is scheduled.'''
+        if len(self.periods) == 0:
+            return None
+        return min(float(self.next_open.min()) + self.settle_delay, float(self.retry_at.min()))
+
+    def pop_due(self):
+        '''
+        Returns the indices of all series whose deadline has passed, without sleeping.
+        Regular deadlines are rescheduled for the next candle of their timeframe.
+        '''
+        now = self.clock()
+        regular = self.next_open + self.settle_delay <= now
+        retried = self.retry_at <= now
+        due = regular | retried
+        if not due.any():
+            return []
+        self.retry_at[retried] = np.inf
+        if regular.any():
+            self.candle_open[regular] = self.next_open[regular]
+            session_ids = self.session_ids[regular] if self.sessions is not None else None
+            self.next_open[regular] = NextCandleOpens(self.periods[regular], now, session_ids, self.sessions)
+        return np.flatnonzero(due).tolist()
+
+    def wait_due(self):
+        '''
+        Sleeps until the earliest deadline (at most `max_sleep` seconds) and returns
+        the indices of the series that are due. Returns an empty list if the sleep
+        was cut short by `max_sleep`.
+        '''
+        deadline = self.next_deadline()
+        if deadline is None:
+            return []
+        delay = deadline - self.clock()
+        if delay > 0:
+            self.sleeper(min(delay, self.max_sleep))
+        return self.pop_due()
+
+    def retry(self, idx: int, delay: float):
+        '''
+        Makes series `idx` due again after `delay` seconds for the same candle, e.g. when
+        the broker has not opened the new candle yet. Its regular schedule is unchanged,
+        and a retry still pending for the series is replaced.
+        '''
+        self.retry_at[idx] = self.clock() + delay
@@ -1,45 +1,195 @@
+import os
 import sys
-import pandas as pd
-from time import sleep
-import MetaTrader5 as mt5
+import argparse
+from time import perf_counter
+startup_started = perf_counter()
+from Broker import mt5, SerializedBroker, get_broker, set_broker
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from pytz import utc # Import utc timezone
 
 # Ensure local imports work by adding current directory to path
 sys.path.append('.')
 
 # Import custom modules
-from DataProcessing import Indicator
-from OrderProcessing import Execute_Buy_Order, Execute_Sell_Order # These will now send Telegram messages
-from TimeProcessing import MarketIsOpen, NewCandleUpdate, get_mt5_interval
+from DataProcessing import IndicatorState
+from HistoryStore import HistoryStore
+from MetadataCache import metadata_cache
+from StateJournal import StateJournal
+from SymbolTable import SymbolTable
+from Metrics import metrics
+from Profiler import profiler
+from Replay import RecordingBroker, Replay
+from SeriesProcessing import SeriesProcessor
+from SessionCalendar import SessionCalendar
+from Strategies import StrategyPipeline
+from Config import LoadConfig, CONFIG_ENV_VAR
+from OrderProcessing import configure_signals, configure_telegram, flush_lone_signal, set_followers # These will now send Telegram messages
+from TimeProcessing import CandleScheduler, ClockStopped, clock
 
-# Trading symbols and timeframes
-# Each tuple now stores: (symbol, timeframe, last_processed_candle_timestamp)
-# last_processed_candle_timestamp will be updated in UTC
+# Trading symbols and timeframes as [symbol, timeframe] pairs. The per-series state
+# (last processed candle, schedule) lives in the symbol table built from this list.
 symbols = [
-    ['EURUSD-VIP', '15m', None], ['XAUUSD-VIP', '15m', None], ['EURGBP-VIP', '15m', None], ['EURCAD-VIP', '15m', None], ['EURAUD-VIP', '15m', None], ['EURNZD-VIP', '15m', None],
-    ['XAUUSD-VIP', '30m', None], ['EURCHF-VIP', '30m', None], ['GBPUSD-VIP', '30m', None], ['GBPCAD-VIP', '30m', None], ['GBPNZD-VIP', '30m', None], ['GBPAUD-VIP', '30m', None],
-    ['XAUUSD-VIP', '1h', None],  ['GBPJPY-VIP', '1h', None],  ['GBPCHF-VIP', '1h', None],  ['USDCAD-VIP', '1h', None],  ['USDJPY-VIP', '1h', None],  ['USDCHF-VIP', '1h', None],
-    ['CADJPY-VIP', '2h', None],  ['CADCHF-VIP', '2h', None],  ['NZDUSD-VIP', '2h', None],  ['NZDCAD-VIP', '2h', None],  ['NZDCHF-VIP', '2h', None],
-    ['XAUUSD-VIP', '4h', None],  ['AUDUSD-VIP', '4h', None],  ['AUDCAD-VIP', '4h', None],  ['AUDNZD-VIP', '4h', None],  ['AUDJPY-VIP', '4h', None], ['AUDCHF-VIP', '4h', None],
-    ['CHFJPY-VIP', '4h', None],
-    ['XAUUSD-VIP', '1d', None],
+    ['EURUSD-VIP', '15m'], ['XAUUSD-VIP', '15m'], ['EURGBP-VIP', '15m'], ['EURCAD-VIP', '15m'], ['EURAUD-VIP', '15m'], ['EURNZD-VIP', '15m'],
+    ['XAUUSD-VIP', '30m'], ['EURCHF-VIP', '30m'], ['GBPUSD-VIP', '30m'], ['GBPCAD-VIP', '30m'], ['GBPNZD-VIP', '30m'], ['GBPAUD-VIP', '30m'],
+    ['XAUUSD-VIP', '1h'],  ['GBPJPY-VIP', '1h'],  ['GBPCHF-VIP', '1h'],  ['USDCAD-VIP', '1h'],  ['USDJPY-VIP', '1h'],  ['USDCHF-VIP', '1h'],
+    ['CADJPY-VIP', '2h'],  ['CADCHF-VIP', '2h'],  ['NZDUSD-VIP', '2h'],  ['NZDCAD-VIP', '2h'],  ['NZDCHF-VIP', '2h'],
+    ['XAUUSD-VIP', '4h'],  ['AUDUSD-VIP', '4h'],  ['AUDCAD-VIP', '4h'],  ['AUDNZD-VIP', '4h'],  ['AUDJPY-VIP', '4h'], ['AUDCHF-VIP', '4h'],
+    ['CHFJPY-VIP', '4h'],
+    ['XAUUSD-VIP', '1d'],
 ]
 
+# Every series keeps a rolling candle cache and a streaming indicator state (see SeriesProcessor)
+HISTORY_BARS = 550     # Candles kept per series (and fetched when a cache is seeded)
+
+# Symbols listed with several timeframes fetch only their shortest timeframe from the broker;
+# the higher timeframes are built from it after their first seed. VERIFY_RESAMPLED compares
+# every resampled candle with the broker's candle once it closes.
+RESAMPLE_HIGHER_TIMEFRAMES = True
+VERIFY_RESAMPLED = False
+SYNC_MAX_AGE = 1       # Seconds a synced base series is reused by the other timeframes of its symbol
+
+# Strategy plugins (see Strategies.STRATEGIES) evaluated on every new candle of every series
+STRATEGIES = ['indicator_bands']
+strategy_pipeline = StrategyPipeline(STRATEGIES)
+CRITICAL_STRATEGIES = [] # Strategies whose signals skip the digest and are sent at once
+
+# Closed candles are also kept on disk, so a restart only fetches the candles missed while stopped
+HISTORY_DIR = 'history'
+HISTORY_KEEP_BARS = 100000 # Candles kept per series on disk; older ones are dropped at startup
+history_store = HistoryStore(HISTORY_DIR)
+
+# Last processed candle, indicator state and sent signals of every series are journaled, so a
+# restart neither reprocesses candles nor sends a signal twice
+JOURNAL_PATH = 'state.db'
+JOURNAL_SIGNAL_DAYS = 30 # Days signal keys are kept for de-duplication
+
+# Order payloads built for the follower accounts of the config (see OrderProcessing.FanOut) are
+# appended to this file, one JSON line per signal, for the trade copier that places them
+FOLLOWER_ORDERS_PATH = 'follower_orders.jsonl'
+
+# Candle scheduling: each series is due once per candle, shortly after its boundary.
+# If the broker has not opened the new candle yet, the series is retried for a short window.
+CANDLE_SETTLE_DELAY = 2    # Seconds to wait after a candle boundary before fetching
+CANDLE_RETRY_DELAY = 2     # Seconds between retries while the new candle is not available
+CANDLE_RETRY_WINDOW = 60   # Seconds after the boundary during which retries are made
+SIGNAL_RESEND_DELAY = 30   # Seconds before a series whose signal Telegram did not deliver is processed again
+
+# Trading sessions per symbol (weekly hours, daily breaks, holidays; see sessions.example.json).
+# Boundaries at which a symbol does not trade are not scheduled and its series are not fetched.
+# Without the file every symbol trades Sunday 22:00 to Friday 21:59 UTC.
+SESSIONS_PATH = 'sessions.json'
+
+# Series due at the same boundary are evaluated on a pool of EVALUATION_WORKERS threads, so each
+# signal goes out as soon as its own series is done (1 = one series after another). Calls to the
+# MT5 terminal are serialized, and the series of one symbol share caches, so they run in one worker.
+EVALUATION_WORKERS = 4
+
+# Per-stage latency and event metrics. When enabled they are served in Prometheus format at
+# http://127.0.0.1:<METRICS_PORT>/metrics and a summary is printed every METRICS_SUMMARY_INTERVAL seconds.
+METRICS_ENABLED = False
+METRICS_PORT = 9108
+METRICS_SUMMARY_INTERVAL = 900
+
+# On-demand profiling of boundary cycles (cProfile + tracemalloc, written to profiles/ as collapsed
+# stacks for flame graphs). Armed with --profile-cycles, with SIGUSR1 (PROFILE_SIGNAL_CYCLES cycles),
+# or by creating PROFILE_TRIGGER_FILE containing "<cycles> [<min seconds>]". Costs nothing while off.
+PROFILE_SIGNAL_CYCLES = 5
+PROFILE_TRIGGER_FILE = 'profile.trigger'
+
+# Record and replay: --record writes every MT5 call of a live run (rates, ticks, symbol info,
+# positions, with their times) to a capture file. --replay runs the loop on a capture instead of
+# the terminal, on a virtual clock that skips the sleeps, without Telegram, history or journal
+# files, and reports cycles per second and signal latency. --replay-signals writes the signals,
+# so two versions of the code can be checked for identical signals on the same market data.
+
+# Startup phases and their durations in seconds, reported once every series is pre-warmed
+startup_phases = []
+_phase_started = startup_started
+
+def end_startup_phase(name: str):
+    global _phase_started
+    now = perf_counter()
+    startup_phases.append((name, now - _phase_started))
+    _phase_started = now
+
+end_startup_phase('imports')
+
+parser = argparse.ArgumentParser(description='Sends buy/sell signals for the configured symbols to Telegram.')
+parser.add_argument('--config', help=f'JSON config file for daemon mode (default: ${CONFIG_ENV_VAR})')
+parser.add_argument('--daemon', action='store_true',
+                    help='Run without prompts, reading the settings from the config file and TRADING_* environment variables')
+parser.add_argument('--profile-cycles', type=int, metavar='N', help='Profile the first N boundary cycles')
+parser.add_argument('--profile-threshold', type=float, metavar='SECONDS',
+                    help='Keep only profiled cycles slower than this (profiles every cycle if --profile-cycles is not given)')
+parser.add_argument('--record', metavar='CAPTURE', help='Record every MT5 call of this run to a capture file')
+parser.add_argument('--replay', metavar='CAPTURE', help='Replay a capture on a virtual clock instead of connecting to MT5')
+parser.add_argument('--replay-signals', metavar='PATH', help='With --replay, write the keys of the replayed signals to this file')
+args = parser.parse_args()
+daemon_mode = args.daemon or args.config is not None or bool(os.environ.get(CONFIG_ENV_VAR))
+
 # Initialize MT5 and login once at the start of the program
 # This block handles initial connection regardless of market open status
 mt5_account, mt5_passw, server = None, None, None
+replay = None
 
-while True:
+if args.replay:
+    try:
+        replay = Replay(args.replay)
+    except (OSError, ValueError) as err:
+        print(f'Could not load the capture: {err}')
+        sys.exit(1)
+    replay.install()
+    history_store = None
+    JOURNAL_PATH = ':memory:'
+    FOLLOWER_ORDERS_PATH = None
+    symbols = [[symbol, timeframe] for symbol, timeframe in replay.broker.header.get('series') or symbols]
+    mt5_account = replay.broker.header.get('account')
+    print(f"Replaying {args.replay} with {len(symbols)} series")
+elif daemon_mode:
     try:
-        mt5_account = int(input('Enter MT5 account number: '))
-        mt5_passw = str(input('Enter MT5 password: '))
-        server = str(input('Enter server name: '))
-        break
-    except ValueError:
-        print('Invalid input. Account number must be an integer. Please try again.')
-    except Exception as e:
-        print(f'An unexpected error occurred: {e}. Please try again.')
+        config = LoadConfig(args.config)
+    except (OSError, ValueError) as err:
+        print(f'Could not load the configuration: {err}')
+        sys.exit(1)
+    mt5_account, mt5_passw, server = config['mt5']['account'], config['mt5']['password'], config['mt5']['server']
+    configure_telegram(config['telegram'].get('bot_token'), config['telegram'].get('chat_id'), config['telegram'].get('api_url'))
+    if config['symbols']:
+        symbols = [[symbol, timeframe] for symbol, timeframe in config['symbols']]
+    configure_signals(config['signals']['digest_window'])
+    CRITICAL_STRATEGIES = config['signals']['critical_strategies'] or CRITICAL_STRATEGIES
+    for name in CRITICAL_STRATEGIES:
+        if name not in STRATEGIES:
+            print(f"Critical strategy {name} is not one of the evaluated strategies ({', '.join(STRATEGIES)})")
+    if config['followers']:
+        set_followers(*zip(*config['followers']))
+        print(f"Order payloads are built for {len(config['followers'])} follower accounts into {FOLLOWER_ORDERS_PATH}")
+    print(f"Loaded the configuration for account #{mt5_account} with {len(symbols)} series")
+else:
+    while True:
+        try:
+            mt5_account = int(input('Enter MT5 account number: '))
+            mt5_passw = str(input('Enter MT5 password: '))
+            server = str(input('Enter server name: '))
+            break
+        except ValueError:
+            print('Invalid input. Account number must be an integer. Please try again.')
+        except Exception as e:
+            print(f'An unexpected error occurred: {e}. Please try again.')
+end_startup_phase('config')
+
+# Symbols and timeframes are interned to integer ids; series are addressed by their index in the table
+symbol_table = SymbolTable((symbol, timeframe) for symbol, timeframe in symbols)
+
+if args.record:
+    set_broker(RecordingBroker(get_broker(), args.record, series=list(symbol_table), account=mt5_account))
+    print(f"Recording the MT5 calls of this run to {args.record}")
+
+try:
+    session_calendar = SessionCalendar.load(SESSIONS_PATH)
+except (OSError, ValueError) as err:
+    print(f'Could not load the trading sessions: {err}')
+    sys.exit(1)
 
 # Initialize MetaTrader5 terminal
 if not mt5.initialize(login=mt5_account, password=mt5_passw, server=server):
@@ -53,128 +203,149 @@ if not mt5.login(login=mt5_account, password=mt5_passw, server=server):
     mt5.shutdown()
     sys.exit()
 print(f"Successfully logged in to MT5 account #{mt5_account}")
+end_startup_phase('connect')
 
+if METRICS_ENABLED:
+    metrics.enabled = True
+    metrics.serve(METRICS_PORT)
+    metrics.start_summaries(METRICS_SUMMARY_INTERVAL)
+    print(f"Metrics available at http://127.0.0.1:{METRICS_PORT}/metrics")
 
-# Main Program Loop
-while True:
-    # Check market status. If market is closed, sleep until it opens.
-    if not MarketIsOpen():
-        print('\nMARKET IS CLOSED.\nSleeping till market opens...')
-        # Reset last processed candle timestamps when market closes
-        for symbol_lst in symbols:
-            symbol_lst[2] = None # Set last_processed_candle_timestamp to None
+if args.profile_cycles is not None or args.profile_threshold is not None:
+    profiler.arm(args.profile_cycles, args.profile_threshold)
+profiler.install_signal(cycles=PROFILE_SIGNAL_CYCLES)
+
+# The MT5 connection is shared by the evaluation workers
+evaluation_pool = None
+if EVALUATION_WORKERS > 1:
+    set_broker(SerializedBroker(get_broker()))
+    evaluation_pool = ThreadPoolExecutor(max_workers=EVALUATION_WORKERS, thread_name_prefix='series')
+
+# Pre-warm symbol metadata so signals only need one live tick request
+missing_symbols = metadata_cache.prewarm(sorted(symbol_table.symbols))
+if missing_symbols:
+    print(f"Could not load symbol info for: {', '.join(missing_symbols)}")
+end_startup_phase('metadata')
+
+
+# Journal of the processed candles and sent signals, and the per-boundary work on the series
+journal = StateJournal(JOURNAL_PATH)
+processor = SeriesProcessor(symbol_table, journal, strategy_pipeline, history_bars=HISTORY_BARS, store=history_store,
+                            resample=RESAMPLE_HIGHER_TIMEFRAMES, sync_max_age=SYNC_MAX_AGE,
+                            verify_resampled=VERIFY_RESAMPLED, calendar=session_calendar,
+                            critical_strategies=CRITICAL_STRATEGIES, follower_orders_path=FOLLOWER_ORDERS_PATH,
+                            pool=evaluation_pool)
+
+# Restore the progress of the previous run
+journal.prune_signals(clock.time() - JOURNAL_SIGNAL_DAYS * 86400)
+journaled_series = journal.load()
+for (symbol, timeframe), (last_candle, saved_state) in journaled_series.items():
+    i = symbol_table.index(symbol, timeframe)
+    if i is None:
+        continue # Series no longer configured
+    if last_candle is not None:
+        symbol_table.last_processed[i] = last_candle
+    if saved_state is not None:
+        processor.indicator_states[(symbol, timeframe)] = IndicatorState.from_dict(saved_state)
+if journaled_series:
+    print(f"Restored the state of {len(journaled_series)} series from {JOURNAL_PATH}")
+end_startup_phase('journal')
+
+# Keep the on-disk history bounded (and drop tails left by an interrupted write) before it is mapped
+if history_store is not None:
+    compacted = history_store.compact(max(HISTORY_KEEP_BARS, HISTORY_BARS))
+    if compacted:
+        print(f"Compacted the stored history of {compacted} series to at most {HISTORY_KEEP_BARS} candles")
+end_startup_phase('history')
+
+processor.prewarm_series()
+end_startup_phase('prewarm')
+print('Startup: ' + ', '.join(f'{name} {seconds:.2f}s' for name, seconds in startup_phases) +
+      f' (total {perf_counter() - startup_started:.2f}s)')
+for name, seconds in startup_phases:
+    metrics.observe('startup_seconds', seconds, phase=name)
+
+# Sleeps until the next candle boundary of any series instead of polling every few seconds
+scheduler = CandleScheduler(symbol_table, settle_delay=CANDLE_SETTLE_DELAY, calendar=session_calendar)
+
+# Signals queued but never delivered before the last stop left their candle unjournaled. While that
+# candle is still the newest one its series is processed again right away, which re-sends them.
+for symbol, timeframe, candle in journal.undelivered_signals():
+    i = symbol_table.index(symbol, timeframe)
+    if i is None or candle is None or candle <= symbol_table.last_processed[i]:
+        continue
+    if processor.resend(scheduler, i, candle):
+        print(f"Re-sending the undelivered signals of {symbol} ({timeframe}) for {datetime.fromtimestamp(candle, tz=utc)}")
+
+def market_is_open():
+    '''True while at least one configured symbol is inside its trading session.'''
+    now = scheduler.clock()
+    return any(session.is_open(now) for session in scheduler.sessions)
+
+# Main Program Loop. Only the virtual clock of a replay stops, once the whole capture is replayed.
+try:
+    while True:
+        # Check market status. If market is closed, sleep until it opens.
+        if not market_is_open():
+            print('\nMARKET IS CLOSED.\nSleeping till market opens...')
+            # Last processed candle timestamps are kept (and journaled): the first candle after the
+            # reopen is newer than all of them anyway
         
-        # Sleep for a shorter interval and check more frequently or until market opens
-        while not MarketIsOpen():
-            sleep(300) # Sleep for 5 minutes
-            if mt5.terminal_info().connected: # Check connection during sleep
-                print("Market still closed. Sleeping...")
-            else:
-                print("Connection lost while market closed. Attempting to re-initialize...")
+            # Sleep for a shorter interval and check more frequently or until market opens
+            while not market_is_open():
+                clock.sleep(300) # Sleep for 5 minutes
+                if mt5.terminal_info().connected: # Check connection during sleep
+                    print("Market still closed. Sleeping...")
+                else:
+                    print("Connection lost while market closed. Attempting to re-initialize...")
+                    metrics.inc('reconnects')
+                    if not mt5.initialize(login=mt5_account, password=mt5_passw, server=server):
+                        print(f'Re-initialize failed, error code={mt5.last_error()}. Retrying...')
+                        clock.sleep(60) # Wait a bit before next re-init attempt
+                        continue
+                    if not mt5.login(login=mt5_account, password=mt5_passw, server=server):
+                        print(f'Re-login failed, error code={mt5.last_error()}. Retrying...')
+                        clock.sleep(60) # Wait a bit before next re-login attempt
+                        continue
+                    print("Reconnected to MT5.")
+            print("\nMARKET IS OPEN! Starting trading analysis...")
+
+        # Analysis & Trading Loop (runs when market is open)
+        while market_is_open():
+            # Check internet connection from terminal
+            if not mt5.terminal_info().connected:
+                print("MT5 terminal disconnected. Attempting to re-connect...")
+                metrics.inc('reconnects')
                 if not mt5.initialize(login=mt5_account, password=mt5_passw, server=server):
                     print(f'Re-initialize failed, error code={mt5.last_error()}. Retrying...')
-                    sleep(60) # Wait a bit before next re-init attempt
+                    clock.sleep(30)
                     continue
                 if not mt5.login(login=mt5_account, password=mt5_passw, server=server):
                     print(f'Re-login failed, error code={mt5.last_error()}. Retrying...')
-                    sleep(60) # Wait a bit before next re-login attempt
+                    clock.sleep(30)
                     continue
-                print("Reconnected to MT5.")
-        print("\nMARKET IS OPEN! Starting trading analysis...")
-
-    # Analysis & Trading Loop (runs when market is open)
-    while MarketIsOpen():
-        # Check internet connection from terminal
-        if not mt5.terminal_info().connected:
-            print("MT5 terminal disconnected. Attempting to re-connect...")
-            if not mt5.initialize(login=mt5_account, password=mt5_passw, server=server):
-                print(f'Re-initialize failed, error code={mt5.last_error()}. Retrying...')
-                sleep(30)
-                continue
-            if not mt5.login(login=mt5_account, password=mt5_passw, server=server):
-                print(f'Re-login failed, error code={mt5.last_error()}. Retrying...')
-                sleep(30)
-                continue
-            print("Successfully reconnected to MT5.")
-            continue # Continue to the next iteration of the inner loop to process symbols
-
-        for i, symbol_lst in enumerate(symbols):
-            symbol, timeframe, last_processed_candle_timestamp = symbol_lst
+                print("Successfully reconnected to MT5.")
+                continue # Continue to the next iteration of the inner loop to process symbols
 
-            # Use NewCandleUpdate to check if it's the right system time for a potential new candle
-            if NewCandleUpdate(timeframe):
-                # Fetch the latest candle's data directly from MT5
-                rates_latest_candle = mt5.copy_rates_from_pos(symbol, get_mt5_interval(timeframe), 0, 1)
-
-                if rates_latest_candle is None or len(rates_latest_candle) == 0:
-                    print(f"Failed to retrieve latest rates for {symbol}. Skipping this cycle.")
-                    continue
-                
-                # Get the timestamp of the latest candle returned by MT5 (converted to UTC datetime)
-                current_candle_timestamp_mt5 = datetime.fromtimestamp(rates_latest_candle[0][0], tz=utc)
-                
-                # Check if this candle's timestamp is newer than the last one we processed for this symbol
-                if last_processed_candle_timestamp is None or current_candle_timestamp_mt5 > last_processed_candle_timestamp:
-                    print(f"--- Processing new candle for {symbol} ({timeframe}): {current_candle_timestamp_mt5} ---")
-                    
-                    # Select symbol on Market Watch (necessary before getting rates/ticks)
-                    if not mt5.symbol_select(symbol, True): # True to add if not exists
-                        print(f'Failed to select {symbol} on Market Watch, error code={mt5.last_error()}\nShutting down the program...')
-                        mt5.shutdown()
-                        sys.exit()
-                    
-                    # Process candles only if symbol has no open positions
-                    if len(mt5.positions_get(symbol=symbol)) < 1:
-                        # Retrieve last 550 candles for indicator calculation
-                        rates = mt5.copy_rates_from_pos(symbol, get_mt5_interval(timeframe), 0, 550)
-                        
-                        if rates is not None and len(rates) > 0:
-                            # Create DataFrame and convert time column to datetime objects (important for DataProcessing)
-                            df_rates = pd.DataFrame(rates)
-                            df_rates['time'] = pd.to_datetime(df_rates['time'], unit='s', utc=True)
-                            
-                            # Ensure enough data exists for indicator calculation (min 20 candles: 2 for prev_high/low + ATR period)
-                            if len(df_rates) < 20: 
-                                print(f"Not enough historical data ({len(df_rates)} candles) for {symbol} to calculate indicators. Skipping.")
-                                continue
-
-                            # Get current open (last candle), previous high, and previous low (second to last candle)
-                            curr_open = df_rates.iloc[-1]['open']
-                            prv_high = df_rates.iloc[-2]['high']
-                            prv_low = df_rates.iloc[-2]['low']
-                            
-                            # Analyze candles and return indicator lines values for the previous complete candle
-                            maximum, minimum, average = Indicator(df_rates)
-                            
-                            # Check if indicator values are valid (not NaN)
-                            if pd.isna(maximum) or pd.isna(minimum) or pd.isna(average):
-                                print(f"Indicator calculation resulted in NaN for {symbol}. Skipping trading opportunity.")
-                                continue
-
-                            # Define buy and sell Conditions
-                            buy_condition = ((prv_low <= minimum) and (curr_open < average))
-                            sell_condition = ((prv_high >= maximum) and (curr_open > average))
-
-                            # Execute Sell/Buy Order if conditions are met
-                            # These functions now send Telegram messages instead of executing trades
-                            if buy_condition:
-                                print(f"Buy condition met for {symbol}. Sending buy signal to Telegram...")
-                                # Pass the timeframe to the Execute_Buy_Order function
-                                Execute_Buy_Order(symbol=symbol, openp=curr_open, min_val=minimum, avg_val=average, timeframe=timeframe)
-                            elif sell_condition:
-                                print(f"Sell condition met for {symbol}. Sending sell signal to Telegram...")
-                                # Pass the timeframe to the Execute_Sell_Order function
-                                Execute_Sell_Order(symbol=symbol, openp=curr_open, max_val=maximum, avg_val=average, timeframe=timeframe)
-                            else:
-                                print(f"No trade condition met for {symbol}.")
-
-                        else:
-                            print(f'Failed to retrieve sufficient historical rates for {symbol} from MT5 terminal. Skipping...')
-                    else:
-                        print(f"Skipping {symbol} as there are open positions already. Waiting for position close or manual intervention.")
-                    
-                    # Update the last processed candle timestamp for this symbol
-                    symbols[i][2] = current_candle_timestamp_mt5
-        
-        # After checking all symbols, sleep for a short period before the next loop iteration
-        sleep(5) # Sleep for 5 seconds to prevent excessive CPU usage and API calls.
\ No newline at end of file
+            # Sleep until the next candle boundary and process every series that is due
+            due = scheduler.wait_due()
+            profiler.check_trigger(PROFILE_TRIGGER_FILE)
+            # Signals Telegram did not deliver since the last wake-up are sent again with their series
+            processor.resend_undelivered(scheduler, SIGNAL_RESEND_DELAY)
+            if not due:
+                continue
+            with metrics.time('cycle'), profiler.cycle():
+                pending = processor.process_due(due, scheduler)
+            if not pending:
+                flush_lone_signal() # The boundary is done: a single signal has nothing to wait for
+            for i in pending:
+                # New candle not available yet: retry shortly, but only close to the boundary
+                seconds_since_open = clock.time() - scheduler.candle_open[i]
+                if seconds_since_open < CANDLE_RETRY_WINDOW:
+                    scheduler.retry(i, CANDLE_RETRY_DELAY)
+except ClockStopped:
+    signal_keys = journal.signal_keys()
+    replay.report(signal_keys)
+    if args.replay_signals:
+        Replay.write_signals(args.replay_signals, signal_keys)
+        print(f"Signals written to {args.replay_signals}")